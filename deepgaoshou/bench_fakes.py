@@ -0,0 +1,263 @@
+"""
+基准测试用的本地替身
+- FakeSMTPServer: 进程内SMTP服务器，支持 AUTH / NOOP，记录每封邮件的到达时间
+- FakeWebhookServer: 进程内HTTP服务器，记录每个 POST 请求的 JSON 内容
+- FakeProbeBackend: 可配置丢包率和延迟的探测后端，通过 socketpair 模拟应答
+- FakePsutil: 提供合成挂载表的 psutil 替身
+"""
+import heapq
+import json
+import random
+import socket
+import socketserver
+import threading
+import time
+from collections import namedtuple
+from email import message_from_string
+from email.header import decode_header, make_header
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+class _SMTPHandler(socketserver.StreamRequestHandler):
+    def _reply(self, line):
+        if self.server.response_delay:
+            time.sleep(self.server.response_delay)
+        self.wfile.write(line.encode() + b"\r\n")
+
+    def handle(self):
+        self.server.connections += 1
+        self._reply("220 fake ESMTP")
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            command = line.decode("utf-8", "replace").strip()
+            verb = command.split(" ", 1)[0].upper()
+            if verb == "EHLO":
+                self.wfile.write(b"250-fake\r\n250-AUTH PLAIN LOGIN\r\n250 8BITMIME\r\n")
+            elif verb == "HELO":
+                self._reply("250 fake")
+            elif verb == "AUTH":
+                parts = command.split()
+                if parts[1].upper() == "LOGIN":
+                    for prompt in ("VXNlcm5hbWU6", "UGFzc3dvcmQ6"):
+                        self._reply(f"334 {prompt}")
+                        self.rfile.readline()
+                elif len(parts) < 3:
+                    self._reply("334 ")
+                    self.rfile.readline()
+                self._reply("235 authenticated")
+            elif verb == "DATA":
+                self._reply("354 end with .")
+                lines = []
+                while True:
+                    data = self.rfile.readline()
+                    if not data or data in (b".\r\n", b".\n"):
+                        break
+                    lines.append(data.decode("utf-8", "replace"))
+                self.server.deliver("".join(lines))
+                self._reply("250 queued")
+            elif verb == "QUIT":
+                self._reply("221 bye")
+                return
+            elif verb in ("MAIL", "RCPT", "NOOP", "RSET"):
+                self._reply("250 ok")
+            else:
+                self._reply("502 not implemented")
+
+class FakeSMTPServer(socketserver.ThreadingTCPServer):
+    """
+    进程内SMTP替身服务器
+    response_delay: 每条应答前的延迟（秒），用于模拟网络往返
+    """
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, host="127.0.0.1", port=0, response_delay=0):
+        super().__init__((host, port), _SMTPHandler)
+        self.response_delay = response_delay
+        self.connections = 0
+        self.messages = []   # (到达时间 perf_counter, 标题)
+        self._cond = threading.Condition()
+
+    @property
+    def port(self):
+        return self.server_address[1]
+
+    def deliver(self, raw):
+        subject = str(make_header(decode_header(message_from_string(raw)["Subject"] or "")))
+        with self._cond:
+            self.messages.append((time.perf_counter(), subject))
+            self._cond.notify_all()
+
+    def wait_for(self, count, timeout=10):
+        """等待收到至少 count 封邮件"""
+        with self._cond:
+            return self._cond.wait_for(lambda: len(self.messages) >= count, timeout)
+
+    def start(self):
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+class _WebhookHandler(BaseHTTPRequestHandler):
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        if self.server.response_delay:
+            time.sleep(self.server.response_delay)
+        self.server.deliver(json.loads(body))
+        self.send_response(self.server.status)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def log_message(self, format, *args):
+        pass
+
+class FakeWebhookServer(ThreadingHTTPServer):
+    """
+    进程内webhook替身服务器
+    status: 返回的HTTP状态码；response_delay: 应答前的延迟（秒），用于模拟慢渠道
+    """
+    daemon_threads = True
+
+    def __init__(self, host="127.0.0.1", port=0, status=200, response_delay=0):
+        super().__init__((host, port), _WebhookHandler)
+        self.status = status
+        self.response_delay = response_delay
+        self.requests = []   # (到达时间 perf_counter, JSON 内容)
+        self._cond = threading.Condition()
+
+    @property
+    def port(self):
+        return self.server_address[1]
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.port}/hook"
+
+    def deliver(self, payload):
+        with self._cond:
+            self.requests.append((time.perf_counter(), payload))
+            self._cond.notify_all()
+
+    def wait_for(self, count, timeout=10):
+        """等待收到至少 count 个请求"""
+        with self._cond:
+            return self._cond.wait_for(lambda: len(self.requests) >= count, timeout)
+
+    def start(self):
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+class _FakeNetwork:
+    """按计划时间向 socketpair 写入应答的后台线程"""
+    def __init__(self):
+        self._heap = []
+        self._cond = threading.Condition()
+        threading.Thread(target=self._run, daemon=True).start()
+
+    def schedule(self, due, sock):
+        with self._cond:
+            heapq.heappush(self._heap, (due, id(sock), sock))
+            self._cond.notify()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._heap or self._heap[0][0] > time.perf_counter():
+                    timeout = self._heap[0][0] - time.perf_counter() if self._heap else None
+                    self._cond.wait(timeout)
+                _, _, sock = heapq.heappop(self._heap)
+            try:
+                sock.send(b"\x00")
+            except OSError:
+                pass  # 探测已被取消
+
+class _FakeProbe:
+    events = 1  # selectors.EVENT_READ
+
+    def __init__(self, host, backend):
+        self.host = host
+        self.sock, self._peer = socket.socketpair()
+        self.sock.setblocking(False)
+        self.started_ns = time.perf_counter_ns()
+        latency, lost = backend.outcome(host)
+        if not lost:
+            backend.network.schedule(time.perf_counter() + latency, self._peer)
+
+    def fileno(self):
+        return self.sock.fileno()
+
+    def poll(self):
+        try:
+            self.sock.recv(1)
+        except BlockingIOError:
+            return None
+        return True, None
+
+    def close(self):
+        self.sock.close()
+        self._peer.close()
+
+class FakeProbeBackend:
+    """
+    模拟探测后端
+    loss: 丢包率；latency / jitter: 应答延迟及其随机波动（秒）
+    host_overrides: {host: (loss, latency)} 为个别host单独设置
+    """
+    name = "fake"
+    fallback = None
+
+    def __init__(self, loss=0.0, latency=0.01, jitter=0.0, host_overrides=None, seed=None):
+        self.loss = loss
+        self.latency = latency
+        self.jitter = jitter
+        self.host_overrides = host_overrides or {}
+        self.random = random.Random(seed)
+        self.network = _FakeNetwork()
+
+    def outcome(self, host):
+        loss, latency = self.host_overrides.get(host, (self.loss, self.latency))
+        latency = max(0.0, latency + self.random.uniform(-self.jitter, self.jitter))
+        return latency, self.random.random() < loss
+
+    def start(self, host):
+        return _FakeProbe(host, self)
+
+_sdiskpart = namedtuple("sdiskpart", ["device", "mountpoint", "fstype", "opts"])
+_sdiskusage = namedtuple("sdiskusage", ["total", "used", "free", "percent"])
+
+class FakePsutil:
+    """
+    psutil 替身，提供合成的挂载表
+    usage: {挂载点: (总字节, 已用字节)}
+    """
+    def __init__(self, usage):
+        self.usage = dict(usage)
+
+    @classmethod
+    def with_mounts(cls, count, total_gb=1000, used_gb=500):
+        usage = {f"/mnt/disk{i}": (total_gb * 1024 ** 3, used_gb * 1024 ** 3) for i in range(count)}
+        return cls(usage)
+
+    def set_used(self, mount_point, used_bytes):
+        total, _ = self.usage[mount_point]
+        self.usage[mount_point] = (total, used_bytes)
+
+    def disk_partitions(self, all=False):
+        return [_sdiskpart(f"/dev/fake{i}", mount_point, "ext4", "rw")
+                for i, mount_point in enumerate(self.usage)]
+
+    def disk_usage(self, path):
+        total, used = self.usage[path]
+        free = total - used
+        return _sdiskusage(total, used, free, round(used / total * 100, 1))
+
+    def boot_time(self):
+        return time.time() - 3600
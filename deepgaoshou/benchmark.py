@@ -0,0 +1,194 @@
+#!/usr/bin/env python3
+"""
+小悠基准测试
+所有组件都在本地替身上运行，不访问真实的DNS和邮件服务器：
+  python benchmark.py                      # 运行并保存结果到 bench_results/<版本>.json
+  python benchmark.py --compare old.json   # 与之前的结果对比
+"""
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+from datetime import datetime
+
+from bench_fakes import FakeSMTPServer, FakeProbeBackend, FakePsutil
+
+def _percentile(sorted_samples, q):
+    if not sorted_samples:
+        return 0.0
+    index = min(len(sorted_samples) - 1, int(round(q * (len(sorted_samples) - 1))))
+    return sorted_samples[index]
+
+def _summarize(samples, elapsed, operations=None):
+    """把每次操作的耗时（秒）汇总为吞吐量和分位数（毫秒）"""
+    samples = sorted(samples)
+    operations = operations or len(samples)
+    return {
+        "operations": operations,
+        "throughput_per_s": round(operations / elapsed, 2) if elapsed else 0,
+        "p50_ms": round(_percentile(samples, 0.5) * 1000, 3),
+        "p99_ms": round(_percentile(samples, 0.99) * 1000, 3),
+        "max_ms": round(samples[-1] * 1000, 3) if samples else 0,
+    }
+
+def _timed(func, iterations):
+    samples = []
+    start = time.perf_counter()
+    for _ in range(iterations):
+        t = time.perf_counter()
+        func()
+        samples.append(time.perf_counter() - t)
+    return _summarize(samples, time.perf_counter() - start)
+
+def bench_internet_check(iterations):
+    """并发探测：5个host，30%丢包，5ms延迟"""
+    import internet_check
+    hosts = [f"10.0.0.{i}" for i in range(5)]
+    results = {}
+    for loss in (0.0, 0.3):
+        backend = FakeProbeBackend(loss=loss, latency=0.005, jitter=0.002, seed=1)
+        results[f"concurrent_loss_{int(loss * 100)}"] = _timed(
+            lambda: internet_check.probe_hosts(hosts, timeout=0.5, concurrent=True, backend=backend),
+            iterations
+        )
+    return results
+
+def bench_disk_usage(iterations, mounts=500):
+    """一次扫描 500 个合成挂载点"""
+    import disk_usage
+    fake = FakePsutil.with_mounts(mounts)
+    original = disk_usage.psutil
+    disk_usage.psutil = fake
+    try:
+        registry = disk_usage.MountRegistry(list(fake.usage))
+        sweep = _timed(registry.sweep, iterations)
+        sweep["mounts"] = mounts
+        return {"sweep": sweep}
+    finally:
+        disk_usage.psutil = original
+
+def bench_email_composer(iterations):
+    from email_composer import EmailComposer
+    composer = EmailComposer()
+    return {
+        "compose_disk_warning": _timed(
+            lambda: composer.compose_disk_warning_high("/data", 1000, 999.5, 0.5, 99.95), iterations
+        ),
+        "format_title": _timed(lambda: composer.format_title("小悠提醒你空间不够了！"), iterations),
+    }
+
+def bench_email_sender(iterations, server):
+    """复用会话与每次新建连接的发送耗时对比"""
+    import email_sender
+    results = {}
+    manager = email_sender.SMTPSessionManager("127.0.0.1", server.port, "bench@local", "x",
+                                              use_starttls=False, idle_timeout=60)
+    message = "Subject: bench\r\n\r\nbody"
+    results["reused_session"] = _timed(lambda: manager.sendmail("bench@local", ["admin@local"], message), iterations)
+    manager.close()
+
+    def cold_send():
+        cold = email_sender.SMTPSessionManager("127.0.0.1", server.port, "bench@local", "x",
+                                               use_starttls=False, idle_timeout=0)
+        cold.sendmail("bench@local", ["admin@local"], message)
+        cold.close()
+    results["new_connection"] = _timed(cold_send, max(1, iterations // 4))
+    return results
+
+def bench_end_to_end(iterations, server):
+    """从磁盘越过阈值到替身服务器收到告警邮件的端到端延迟"""
+    os.environ.update({
+        "ENV_EMLADDR": "bench@local", "ENV_EMLPAW": "x", "ENV_EMLNOTION2": "admin@local",
+        "XIAOU_SMTP_SERVER": "127.0.0.1", "XIAOU_SMTP_PORT": str(server.port), "XIAOU_SMTP_STARTTLS": "0",
+        "ENV_MOUNT_POINT": "/mnt/disk0", "XIAOU_STATE_FILE": "off", "XIAOU_DISK_ANALYZE": "0",
+    })
+    import disk_usage
+    import xiaoU
+
+    fake = FakePsutil.with_mounts(1, total_gb=100, used_gb=10)
+    disk_usage.psutil = fake
+    system = xiaoU.XiaoUSystem()
+    watch = system.mount_registry.watches["/mnt/disk0"]
+
+    samples = []
+    start = time.perf_counter()
+    for _ in range(iterations):
+        watch.last_warning_times.clear()
+        fake.set_used("/mnt/disk0", int(99.5 * 1024 ** 3))  # 越过 1GB 阈值
+        received = len(server.messages)
+        t = time.perf_counter()
+        usage = disk_usage.check_disk_usage("/mnt/disk0")
+        system._check_mount(watch, usage, datetime.now())
+        if not server.wait_for(received + 1):
+            raise RuntimeError("等待告警邮件超时")
+        samples.append(server.messages[received][0] - t)
+    return {"disk_alert": _summarize(samples, time.perf_counter() - start)}
+
+def _version_label():
+    try:
+        return subprocess.run(["git", "describe", "--always", "--dirty"], capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except Exception:
+        return datetime.now().strftime("%Y%m%d-%H%M%S")
+
+def compare(current, baseline):
+    """打印与基线结果的对比（p50 / 吞吐量变化百分比）"""
+    print(f"\n对比基线 {baseline.get('version')}:")
+    for component, cases in current["results"].items():
+        for case, stats in cases.items():
+            old = baseline.get("results", {}).get(component, {}).get(case)
+            if not old:
+                continue
+            def change(key):
+                return f"{(stats[key] - old[key]) / old[key] * 100:+.1f}%" if old[key] else "n/a"
+            print(f"  {component}.{case}: p50 {old['p50_ms']} -> {stats['p50_ms']}ms ({change('p50_ms')}), "
+                  f"吞吐 {old['throughput_per_s']} -> {stats['throughput_per_s']}/s ({change('throughput_per_s')})")
+
+def main():
+    parser = argparse.ArgumentParser(description="小悠基准测试")
+    parser.add_argument("--iterations", type=int, default=200)
+    parser.add_argument("--label", help="结果版本标签，默认使用 git describe")
+    parser.add_argument("--output-dir", default="bench_results")
+    parser.add_argument("--compare", help="与指定的历史结果文件对比")
+    args = parser.parse_args()
+
+    server = FakeSMTPServer().start()
+    results = {}
+    try:
+        for name, run in (
+            ("internet_check", lambda: bench_internet_check(args.iterations)),
+            ("disk_usage", lambda: bench_disk_usage(args.iterations)),
+            ("email_composer", lambda: bench_email_composer(args.iterations * 50)),
+            ("email_sender", lambda: bench_email_sender(args.iterations, server)),
+            ("end_to_end", lambda: bench_end_to_end(max(1, args.iterations // 10), server)),
+        ):
+            results[name] = run()
+            for case, stats in results[name].items():
+                print(f"{name}.{case}: {stats['throughput_per_s']}/s, "
+                      f"p50 {stats['p50_ms']}ms, p99 {stats['p99_ms']}ms", flush=True)
+    finally:
+        server.stop()
+
+    report = {
+        "version": args.label or _version_label(),
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "results": results,
+    }
+    os.makedirs(args.output_dir, exist_ok=True)
+    path = os.path.join(args.output_dir, f"{report['version']}.json")
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"\n结果已保存到 {path}")
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            compare(report, json.load(f))
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
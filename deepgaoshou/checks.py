@@ -0,0 +1,443 @@
+import os
+import signal
+import socket
+import threading
+import time
+import zlib
+from collections import namedtuple
+from datetime import datetime
+
+import disk_usage
+import internet_check
+from email_composer import email_composer
+from lazy_import import LazyModule
+from metrics import metrics
+from notifier import SEVERITIES, SEVERITY_INFO, SEVERITY_WARNING, SEVERITY_CRITICAL, get_notifier
+from scheduler import WorkerPool
+
+try:
+    import tomllib
+except ImportError:  # Python 3.10 及以下可安装 tomli
+    try:
+        import tomli as tomllib
+    except ImportError:
+        tomllib = None
+
+# 只有配置了 http 检查时才需要
+urllib_request = LazyModule("urllib.request")
+
+# 一项检查的定义，params 为该类型特有的参数
+CheckSpec = namedtuple("CheckSpec", ["name", "type", "interval", "timeout", "failures", "recoveries",
+                                     "severity", "channels", "repeat", "recovery", "params"])
+
+# 各字段的默认值，可在配置文件的 [defaults] 中修改
+DEFAULTS = {
+    "interval": 60,      # 执行间隔（秒）
+    "timeout": 5,        # 单次检查超时（秒）
+    "failures": 3,       # 连续失败多少次才告警
+    "recoveries": 2,     # 连续成功多少次才确认恢复
+    "severity": SEVERITY_WARNING,
+    "channels": None,    # 通知渠道，None 表示按级别路由
+    "repeat": 0,         # 持续失败时每隔多少分钟重复告警，0 表示不重复
+    "recovery": True,    # 恢复时是否发送通知
+}
+
+# 各类型的参数：必填参数和可选参数（默认值）
+TYPE_PARAMS = {
+    "ping": ({"host"}, {"backend": None}),
+    "tcp": ({"host", "port"}, {}),
+    "http": ({"url"}, {"expect_status": None}),
+    "disk": ({"path"}, {"thresholds": disk_usage.DEFAULT_THRESHOLDS, "cooldowns": disk_usage.DEFAULT_COOLDOWNS}),
+}
+
+def _log(message):
+    """统一的日志输出函数"""
+    timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    print(f"[{timestamp}] {message}", flush=True)
+
+def describe_target(spec):
+    """检查对象的文本描述"""
+    params = spec.params
+    if spec.type == "tcp":
+        return f"{params['host']}:{params['port']}"
+    return params.get("host") or params.get("url") or params.get("path")
+
+def _parse_channels(name, channels, channel_names):
+    """校验通知渠道：字符串或字符串数组，channel_names 不为None时只能使用其中的渠道"""
+    if isinstance(channels, str):
+        channels = [channels]
+    if not isinstance(channels, list) or not all(isinstance(channel, str) for channel in channels):
+        raise ValueError(f"检查 {name} 的 channels 应为渠道名或渠道名数组")
+    channels = tuple(channel.strip().lower() for channel in channels)
+    if channel_names is not None:
+        unknown = [channel for channel in channels if channel not in channel_names]
+        if unknown:
+            raise ValueError(f"检查 {name} 的通知渠道未启用: {', '.join(unknown)}"
+                             f"（已启用: {', '.join(channel_names) or '无'}）")
+    return channels
+
+def parse_checks(data, channel_names=None):
+    """
+    解析并校验配置，任何一项有误都抛出 ValueError，不会只加载部分检查
+    data: TOML 解析结果，[defaults] 为公共默认值，[checks.<名称>] 为各项检查
+    channel_names: 已启用的通知渠道，为None时不校验渠道名
+    返回: dict - 名称 -> CheckSpec
+    """
+    for key in ("defaults", "checks"):
+        if not isinstance(data.get(key, {}), dict):
+            raise ValueError(f"[{key}] 应为表")
+    defaults = dict(DEFAULTS)
+    for key, value in data.get("defaults", {}).items():
+        if key not in DEFAULTS:
+            raise ValueError(f"[defaults] 中有未知的字段: {key}")
+        defaults[key] = value
+    unknown = set(data) - {"defaults", "checks"}
+    if unknown:
+        raise ValueError(f"未知的配置项: {', '.join(sorted(unknown))}")
+
+    specs = {}
+    for name, table in data.get("checks", {}).items():
+        if not isinstance(table, dict):
+            raise ValueError(f"检查 {name} 的定义应为表")
+        table = dict(table)
+        check_type = table.pop("type", None)
+        if check_type not in TYPE_PARAMS:
+            raise ValueError(f"检查 {name} 的类型无效: {check_type}（可用: {', '.join(TYPE_PARAMS)}）")
+        required, optional = TYPE_PARAMS[check_type]
+        common = {key: table.pop(key, default) for key, default in defaults.items()}
+        missing = required - set(table)
+        if missing:
+            raise ValueError(f"检查 {name} 缺少参数: {', '.join(sorted(missing))}")
+        extra = set(table) - required - set(optional)
+        if extra:
+            raise ValueError(f"检查 {name} 有未知的参数: {', '.join(sorted(extra))}")
+        params = dict(optional)
+        params.update(table)
+
+        if common["severity"] not in SEVERITIES:
+            raise ValueError(f"检查 {name} 的通知级别无效: {common['severity']}")
+        if common["interval"] <= 0 or common["timeout"] <= 0:
+            raise ValueError(f"检查 {name} 的间隔和超时必须大于0")
+        if common["failures"] < 1 or common["recoveries"] < 1:
+            raise ValueError(f"检查 {name} 的 failures 和 recoveries 至少为1")
+        channels = common["channels"]
+        if channels is not None:
+            channels = _parse_channels(name, channels, channel_names)
+        if check_type == "disk":
+            # 也支持写成数组，如 thresholds = ["10%", "5%", "1GB"]
+            for key in ("thresholds", "cooldowns"):
+                value = params[key]
+                params[key] = ",".join(map(str, value)) if isinstance(value, list) else str(value)
+            # 提前校验，避免加载后才在执行时出错
+            disk_usage.parse_thresholds(params["thresholds"], params["cooldowns"])
+        if check_type == "tcp":
+            params["port"] = int(params["port"])
+
+        specs[name] = CheckSpec(
+            name, check_type, float(common["interval"]), float(common["timeout"]),
+            int(common["failures"]), int(common["recoveries"]), common["severity"], channels,
+            float(common["repeat"]), bool(common["recovery"]), params,
+        )
+    return specs
+
+def run_ping(spec):
+    result = internet_check.probe_all([spec.params["host"]], spec.timeout, spec.params["backend"])[0]
+    return result.ok, internet_check.format_probe_result(result)
+
+def run_tcp(spec):
+    host, port = spec.params["host"], spec.params["port"]
+    started = time.perf_counter()
+    try:
+        with socket.create_connection((host, port), timeout=spec.timeout):
+            pass
+    except OSError as e:
+        return False, f"无法连接 {host}:{port}: {e}"
+    return True, f"连接 {host}:{port} 成功 ({round((time.perf_counter() - started) * 1000, 2)}ms)"
+
+def run_http(spec):
+    url, expected = spec.params["url"], spec.params["expect_status"]
+    started = time.perf_counter()
+    try:
+        with urllib_request.urlopen(url, timeout=spec.timeout) as response:
+            status = response.status
+    except urllib_request.HTTPError as e:
+        status = e.code
+    except OSError as e:
+        return False, f"请求 {url} 失败: {e}"
+    elapsed = round((time.perf_counter() - started) * 1000, 2)
+    if expected is None:
+        ok = 200 <= status < 400
+    else:
+        ok = status in (expected if isinstance(expected, list) else [expected])
+    return ok, f"{url} 返回 {status} ({elapsed}ms)"
+
+# 通/断类型的检查函数 run(spec) -> (是否正常, 详情)
+RUNNERS = {
+    "ping": run_ping,
+    "tcp": run_tcp,
+    "http": run_http,
+}
+
+class CheckState:
+    """
+    一项检查的运行状态，重新加载配置时只要名称和类型不变就保留
+    - 通/断类型：确认后的状态（迟滞）、最后一次告警时间和故障开始时间
+    - disk 类型：与挂载点空间预警相同的分级阈值和冷却时间
+    """
+    def __init__(self, spec):
+        self.type = spec.type
+        self.hysteresis = internet_check.StateHysteresis(spec.failures, spec.recoveries)
+        self.hysteresis.state = True   # 视为正常开始，首次失败也需要连续确认
+        self.alerted_at = None         # 最后一次发送故障告警的时间（monotonic）
+        self.down_since = None         # 确认故障的时间
+        self.detail = ""
+        self.watch = None
+        self.lock = threading.Lock()   # 同一项检查不会并发执行
+        self.update(spec)
+
+    def update(self, spec):
+        """应用新的配置，保留已有的状态"""
+        self.hysteresis.down_checks = spec.failures
+        self.hysteresis.up_checks = spec.recoveries
+        if spec.type == "disk":
+            thresholds = disk_usage.parse_thresholds(spec.params["thresholds"], spec.params["cooldowns"])
+            if self.watch is None or self.watch.mount_point != spec.params["path"]:
+                self.watch = disk_usage.MountWatch(spec.params["path"], thresholds)
+            else:
+                self.watch.thresholds = thresholds
+
+    @property
+    def up(self):
+        return self.hysteresis.state
+
+class CheckRegistry:
+    """
+    从 TOML 配置文件加载声明式检查（ping/tcp/http/disk），在共享的有界线程池中按各自的间隔执行
+    - 文件变化（定期检查 mtime/大小/inode）或收到 SIGHUP 时重新加载；先完整解析和校验，
+      有任何错误都保留当前配置，校验通过后一次性替换，不会出现新旧配置混用
+    - 重新加载时名称和类型不变的检查保留运行状态（迟滞计数、告警冷却、故障开始时间），
+      只修改间隔；删除的检查停止调度，正在执行的一次结束后不再告警
+    - 各检查的首次执行按名称分散在一个间隔内，大量检查不会同时启动
+    notify(subject, content, severity, channels, on_result) 由调用方负责发送，
+    channel_names 为已启用的通知渠道，配置中使用其他渠道视为无效
+    """
+    def __init__(self, path, scheduler, notify, workers=8, poll_interval=5, channel_names=None):
+        self.path = path
+        self.scheduler = scheduler
+        self.notify = notify
+        self.channel_names = channel_names
+        self.poll_interval = poll_interval
+        self.pool = WorkerPool(workers, name="xiaoU-check")
+        self.specs = {}          # 名称 -> CheckSpec，重新加载时整体替换
+        self._states = {}        # 名称 -> CheckState
+        self._signature = None   # 已加载文件的 (mtime, 大小, inode)
+        self._force = False
+        self._lock = threading.Lock()   # 同一时间只进行一次加载
+        self._stats = {"loads": 0, "errors": 0}
+        self._loaded_at = None
+
+    def start(self):
+        self.pool.start()
+        self.reload(force=True)
+        self.scheduler.add_job("checks_reload", self.reload, self.poll_interval, delay=self.poll_interval)
+
+    def stop(self):
+        self.pool.stop()
+
+    def install_sighup(self):
+        """收到 SIGHUP 时重新加载（只能在主线程调用，Windows 上不可用）"""
+        if not hasattr(signal, "SIGHUP"):
+            return False
+
+        def handler(signum, frame):
+            # 信号处理函数中不获取锁，交给调度器在工作线程中加载
+            self._force = True
+            threading.Thread(target=self.scheduler.run_now, args=("checks_reload",), daemon=True).start()
+
+        signal.signal(signal.SIGHUP, handler)
+        return True
+
+    def _file_signature(self):
+        st = os.stat(self.path)
+        return st.st_mtime_ns, st.st_size, st.st_ino
+
+    def reload(self, force=False):
+        """
+        文件有变化（或 force）时重新加载
+        返回: Boolean - 是否加载了新配置
+        """
+        with self._lock:
+            force, self._force = force or self._force, False
+            try:
+                signature = self._file_signature()
+            except OSError as e:
+                if force or self._signature is not None:
+                    _log(f"无法读取检查配置 {self.path}: {e}")
+                    self._signature = None
+                return False
+            if not force and signature == self._signature:
+                return False
+            self._signature = signature
+            try:
+                with open(self.path, "rb") as f:
+                    specs = parse_checks(tomllib.load(f), self.channel_names)
+            except (OSError, ValueError, TypeError) as e:
+                # tomllib.TOMLDecodeError 是 ValueError 的子类
+                self._stats["errors"] += 1
+                _log(f"检查配置 {self.path} 无效，继续使用当前配置: {e}")
+                return False
+            self._apply(specs)
+            return True
+
+    def _apply(self, specs):
+        """替换配置并同步调度任务（调用方需持有锁）"""
+        old = self.specs
+        states = {}
+        for name, spec in specs.items():
+            state = self._states.get(name)
+            if state is not None and state.type == spec.type:
+                state.update(spec)
+            else:
+                state = CheckState(spec)
+            states[name] = state
+        self._states = states
+        self.specs = specs
+
+        added = [name for name in specs if name not in old]
+        removed = [name for name in old if name not in specs]
+        changed = [name for name in specs if name in old and specs[name] != old[name]]
+        for name in removed:
+            self.scheduler.remove_job(f"check:{name}")
+            metrics.remove("xiaou_check_up", check=name)
+        for name in added:
+            spec = specs[name]
+            # 按名称把首次执行分散到一个间隔内
+            delay = zlib.crc32(name.encode("utf-8")) % 1000 / 1000 * spec.interval
+            self.scheduler.add_job(f"check:{name}", lambda name=name: self.run_check(name), spec.interval,
+                                   delay=delay, pool=self.pool)
+        for name in changed:
+            self.scheduler.set_interval(f"check:{name}", specs[name].interval)
+
+        self._stats["loads"] += 1
+        self._loaded_at = datetime.now()
+        _log(f"已加载检查配置 {self.path}: 共 {len(specs)} 项"
+             f"（新增 {len(added)}，修改 {len(changed)}，删除 {len(removed)}）")
+
+    def run_check(self, name):
+        """执行一项检查（在检查线程池中执行）"""
+        spec = self.specs.get(name)
+        state = self._states.get(name)
+        if spec is None or state is None:
+            return  # 已在重新加载时删除
+        if not state.lock.acquire(blocking=False):
+            return
+        try:
+            if spec.type == "disk":
+                self._run_disk(spec, state)
+            else:
+                self._run_status(spec, state)
+        except Exception as e:
+            _log(f"检查 {name} 执行出错: {e}")
+        finally:
+            state.lock.release()
+
+    def _current(self, spec):
+        """检查是否仍在配置中（执行期间可能被重新加载删除）"""
+        return self.specs.get(spec.name) is not None
+
+    def _run_status(self, spec, state):
+        ok, detail = RUNNERS[spec.type](spec)
+        was_up = state.up
+        up = state.hysteresis.update(ok)
+        state.detail = detail
+        if not self._current(spec):
+            return
+        metrics.set("xiaou_check_up", 1 if up else 0, check=spec.name)
+        now = time.monotonic()
+        target = describe_target(spec)
+        if not up:
+            if was_up:
+                state.down_since = datetime.now()
+                _log(f"检查 {spec.name} 失败: {detail}")
+            repeat_due = spec.repeat > 0 and state.alerted_at is not None and now - state.alerted_at >= spec.repeat * 60
+            if state.alerted_at is None or repeat_due:
+                state.alerted_at = now
+                content = email_composer.compose_check_failed(spec.name, spec.type, target, detail,
+                                                              state.down_since)
+                self.notify(f"小悠的检查失败了：{spec.name}", content, spec.severity, spec.channels,
+                            lambda success: self._on_alert_result(state, success))
+        elif not was_up:
+            _log(f"检查 {spec.name} 已恢复: {detail}")
+            if state.alerted_at is not None and spec.recovery:
+                content = email_composer.compose_check_recovered(spec.name, spec.type, target, detail,
+                                                                 state.down_since)
+                self.notify(f"小悠的检查恢复了：{spec.name}", content, SEVERITY_INFO, spec.channels, None)
+            state.alerted_at = None
+            state.down_since = None
+
+    def _on_alert_result(self, state, success):
+        if not success:
+            state.alerted_at = None  # 下次执行时重新发送
+
+    def _run_disk(self, spec, state):
+        watch = state.watch
+        total_gb, used_gb, free_gb, percent = disk_usage.check_disk_usage(watch.mount_point)
+        if total_gb == 0 and used_gb == 0 and free_gb == 0:
+            state.detail = "无法获取磁盘使用信息"
+            return
+        level = watch.level_for(free_gb, percent)
+        state.detail = f"{free_gb}GB 剩余 ({percent}% 已使用)"
+        state.hysteresis.state = level is None
+        if not self._current(spec):
+            return
+        metrics.set("xiaou_check_up", 0 if level else 1, check=spec.name)
+        current_time = datetime.now()
+        threshold = watch.due_threshold(free_gb, percent, current_time)
+        if threshold is None:
+            return
+        level = threshold.level
+        _log(f"检查 {spec.name}: {watch.mount_point} 剩余空间 <{threshold.describe()}，准备发送警告")
+        compose = getattr(email_composer, f"compose_disk_warning_{level}")
+        content = compose(watch.mount_point, total_gb, used_gb, free_gb, percent)
+        severity = SEVERITY_CRITICAL if level == "high" else spec.severity
+        watch.last_warning_times[level] = current_time
+
+        def on_result(success):
+            if not success:
+                watch.last_warning_times.pop(level, None)
+
+        self.notify(f"小悠的检查 {spec.name}：{watch.mount_point} 空间不足", content, severity, spec.channels,
+                    on_result)
+
+    def get_stats(self):
+        states = list(self._states.values())
+        return {
+            "checks": len(states),
+            "down": sum(1 for state in states if state.up is False),
+            "loads": self._stats["loads"],
+            "errors": self._stats["errors"],
+        }
+
+    def format_stats(self):
+        stats = self.get_stats()
+        loaded = self._loaded_at.strftime("%Y-%m-%d %H:%M:%S") if self._loaded_at else "未加载"
+        return (f"检查 {stats['checks']} 项, 失败 {stats['down']} 项, 加载 {stats['loads']} 次"
+                f"（无效 {stats['errors']} 次）, 上次加载 {loaded}")
+
+    def format_failures(self):
+        """当前失败的检查，每项一行"""
+        return [f"{name}: {state.detail}" for name, state in self._states.items() if state.up is False]
+
+def build_check_registry(scheduler, notify):
+    """
+    根据环境变量创建检查注册表，未设置 XIAOU_CHECKS_FILE 时返回None
+    XIAOU_CHECK_WORKERS: 执行检查的线程数（所有检查共用）
+    """
+    path = os.environ.get("XIAOU_CHECKS_FILE")
+    if not path:
+        return None
+    if tomllib is None:
+        _log("当前 Python 不支持 TOML（需要 3.11+ 或安装 tomli），跳过检查配置")
+        return None
+    return CheckRegistry(path, scheduler, notify, workers=int(os.environ.get("XIAOU_CHECK_WORKERS", 8)),
+                         channel_names=list(get_notifier().channels))
@@ -0,0 +1,37 @@
+import os
+import threading
+
+_loaded = False
+_path = None
+_lock = threading.Lock()
+
+def _find_dotenv():
+    """从当前目录和程序所在目录逐级向上查找 .env 文件"""
+    starts = [os.getcwd(), os.path.dirname(os.path.abspath(__file__))]
+    for start in starts:
+        directory = start
+        while True:
+            path = os.path.join(directory, ".env")
+            if os.path.isfile(path):
+                return path
+            parent = os.path.dirname(directory)
+            if parent == directory:
+                break
+            directory = parent
+    return None
+
+def load_config():
+    """
+    加载 .env 中的环境变量，整个进程只加载一次，已有的环境变量不会被覆盖
+    找不到 .env 文件时（如 systemd 已通过 EnvironmentFile 注入）不导入 python-dotenv
+    返回: 加载的 .env 文件路径，没有时返回None
+    """
+    global _loaded, _path
+    with _lock:
+        if not _loaded:
+            _path = _find_dotenv()
+            if _path is not None:
+                from dotenv import load_dotenv
+                load_dotenv(_path)
+            _loaded = True
+        return _path
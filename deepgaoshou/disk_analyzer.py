@@ -0,0 +1,291 @@
+import heapq
+import os
+import queue
+import threading
+import time
+from array import array
+from collections import namedtuple
+from datetime import datetime
+
+# 一次分析的结果：目录和文件均为 [(路径, 占用字节数), ...]，complete 为False表示扫描因预算耗尽而提前结束
+DiskReport = namedtuple("DiskReport", ["mount_point", "directories", "files", "scanned_dirs",
+                                       "elapsed", "complete"])
+
+def _log(message):
+    """统一的日志输出函数"""
+    timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    print(f"[{timestamp}] {message}", flush=True)
+
+def _allocated_bytes(st):
+    """文件实际占用的磁盘空间（稀疏文件按已分配的块计算，Windows 上退回到文件大小）"""
+    blocks = getattr(st, "st_blocks", None)
+    return blocks * 512 if blocks is not None else st.st_size
+
+def format_size(size):
+    """把字节数格式化为便于阅读的文本"""
+    for unit in ("B", "KB", "MB", "GB"):
+        if size < 1024:
+            return f"{round(size, 1)} {unit}"
+        size /= 1024
+    return f"{round(size, 2)} TB"
+
+class _CachedDir:
+    """目录扫描缓存，目录 mtime 不变时复用，不再重新列目录"""
+    __slots__ = ("mtime_ns", "subdirs", "names", "inodes", "scanned_at")
+
+    def __init__(self, mtime_ns, subdirs, names, inodes, scanned_at):
+        self.mtime_ns = mtime_ns
+        self.subdirs = subdirs       # 子目录名列表
+        self.names = names           # 目录下所有普通文件的文件名
+        self.inodes = inodes         # 与 names 对应的 inode 号
+        self.scanned_at = scanned_at
+
+class _Scan:
+    """一次扫描的共享状态"""
+    def __init__(self, root_dev, deadline, max_operations):
+        self.root_dev = root_dev
+        self.deadline = deadline
+        self.operations = max_operations
+        self.exhausted = False
+        self.results = {}        # 目录 -> (自身占用, 子目录路径列表, 最大的文件)
+        self.linked = set()      # 已统计过的硬链接文件 (设备, inode)，与 du 一样只计一次
+        self.lock = threading.Lock()
+
+    def spend(self, operations):
+        """扣除IO预算，预算或时间用完时返回False"""
+        with self.lock:
+            self.operations -= operations
+            if self.operations < 0 or time.monotonic() >= self.deadline:
+                self.exhausted = True
+            return not self.exhausted
+
+class DiskAnalyzer:
+    """
+    找出挂载点下占用空间最多的目录和文件
+    - 多个工作线程并行 os.scandir，不跨越到其他文件系统，不跟随符号链接
+    - 按目录 mtime 缓存目录内容：mtime 未变的目录不再列目录，按缓存的文件名重新 stat 每个文件，
+      原地增长的文件（如日志）无论之前大小都能被发现；inode 与缓存不一致时重新列目录，
+      缓存超过 cache_ttl 秒后完整重扫
+    - time_budget（秒）和 max_operations（stat/目录项数量）限制单次扫描的开销，
+      超出预算时返回不完整的结果，避免在磁盘已经吃紧时再加重负担
+    - 同一挂载点 min_interval 秒内重复请求直接返回上次的结果
+    """
+    def __init__(self, workers=4, time_budget=5, max_operations=500000, top_n=10,
+                 max_depth=3, min_interval=600, cache_ttl=3600, min_file_bytes=1024 * 1024):
+        self.workers = workers
+        self.time_budget = time_budget
+        self.max_operations = max_operations
+        self.top_n = top_n
+        self.max_depth = max_depth
+        self.min_interval = min_interval
+        self.cache_ttl = cache_ttl
+        self.min_file_bytes = min_file_bytes
+        self._cache = {}      # 目录 -> _CachedDir
+        self._reports = {}    # 挂载点 -> (完成时间, DiskReport)
+        self._lock = threading.Lock()   # 同一时间只进行一次扫描
+
+    def analyze(self, mount_point):
+        """
+        分析挂载点的空间占用
+        返回: DiskReport，挂载点不可访问时返回None
+        """
+        with self._lock:
+            cached = self._reports.get(mount_point)
+            if cached is not None and time.monotonic() - cached[0] < self.min_interval:
+                return cached[1]
+            try:
+                root_dev = os.stat(mount_point).st_dev
+            except OSError as e:
+                _log(f"无法分析挂载点 {mount_point}: {e}")
+                return None
+            report = self._scan(mount_point, root_dev)
+            self._reports[mount_point] = (time.monotonic(), report)
+            return report
+
+    def _scan(self, mount_point, root_dev):
+        started = time.monotonic()
+        scan = _Scan(root_dev, started + self.time_budget, self.max_operations)
+        pending = queue.Queue()
+        pending.put(mount_point)
+
+        def work():
+            while True:
+                path = pending.get()
+                if path is None:
+                    return
+                try:
+                    if scan.spend(1):
+                        for child in self._scan_directory(path, scan):
+                            pending.put(child)
+                except OSError:
+                    pass  # 目录无权限或扫描过程中被删除
+                finally:
+                    pending.task_done()
+
+        threads = [threading.Thread(target=work, name=f"disk-analyzer-{i}", daemon=True)
+                   for i in range(self.workers)]
+        for thread in threads:
+            thread.start()
+        pending.join()
+        for _ in threads:
+            pending.put(None)
+
+        if not scan.exhausted:
+            # 完整扫描后清理已删除目录的缓存
+            prefix = mount_point.rstrip(os.sep) + os.sep
+            for path in [path for path in self._cache if path.startswith(prefix) or path == mount_point]:
+                if path not in scan.results:
+                    del self._cache[path]
+
+        directories, files = self._rank(mount_point, scan.results)
+        return DiskReport(mount_point, directories, files, len(scan.results),
+                          time.monotonic() - started, not scan.exhausted)
+
+    def _scan_directory(self, path, scan):
+        """扫描单个目录，返回需要继续扫描的子目录"""
+        st = os.stat(path, follow_symlinks=False)
+        if st.st_dev != scan.root_dev:
+            return []
+        now = time.monotonic()
+        cached = self._cache.get(path)
+        refreshed = None
+        if cached is not None and cached.mtime_ns == st.st_mtime_ns and now - cached.scanned_at < self.cache_ttl:
+            refreshed = self._refresh_files(path, cached, scan)
+        if refreshed is not None:
+            own_bytes, files = refreshed
+            subdirs = cached.subdirs
+        else:
+            own_bytes, subdirs, files, names, inodes, partial = self._list_directory(path, scan)
+            # 预算耗尽时列出的只是部分内容，不能缓存为完整结果
+            if partial:
+                self._cache.pop(path, None)
+            else:
+                self._cache[path] = _CachedDir(st.st_mtime_ns, subdirs, names, inodes, now)
+        children = [os.path.join(path, name) for name in subdirs]
+        with scan.lock:
+            scan.results[path] = (own_bytes, children, files)
+        return children
+
+    def _list_directory(self, path, scan):
+        """
+        列出目录内容
+        返回: (自身占用, 子目录名列表, 最大的文件, 普通文件名列表, 对应的 inode, 是否因预算耗尽只列出了一部分)
+        """
+        own_bytes = 0
+        partial = False
+        subdirs = []
+        files = []
+        names = []
+        inodes = array("Q")
+        operations = 0
+        with os.scandir(path) as entries:
+            for entry in entries:
+                operations += 1
+                try:
+                    if entry.is_dir(follow_symlinks=False):
+                        subdirs.append(entry.name)
+                    elif entry.is_file(follow_symlinks=False):
+                        st = entry.stat(follow_symlinks=False)
+                        names.append(entry.name)
+                        inodes.append(st.st_ino)
+                        if st.st_nlink > 1:
+                            key = (st.st_dev, st.st_ino)
+                            with scan.lock:
+                                if key in scan.linked:
+                                    continue
+                                scan.linked.add(key)
+                        size = _allocated_bytes(st)
+                        own_bytes += size
+                        if size >= self.min_file_bytes:
+                            files.append((size, entry.name))
+                except OSError:
+                    continue
+                if operations % 1000 == 0 and not scan.spend(1000):
+                    partial = True
+                    break
+        scan.spend(operations % 1000)
+        return own_bytes, subdirs, heapq.nlargest(self.top_n, files), names, inodes, partial
+
+    def _refresh_files(self, path, cached, scan):
+        """
+        目录内容未变，按缓存的文件名重新 stat 每个文件（省去列目录）
+        返回: (自身占用, 最大的文件)，文件已不存在或 inode 与缓存不一致时返回None，需要重新列目录
+        """
+        stats = []
+        operations = 0
+        for name, inode in zip(cached.names, cached.inodes):
+            operations += 1
+            try:
+                st = os.stat(os.path.join(path, name), follow_symlinks=False)
+            except FileNotFoundError:
+                return None
+            except OSError:
+                continue
+            if st.st_ino != inode:
+                return None
+            stats.append((name, st))
+            if operations % 1000 == 0 and not scan.spend(1000):
+                break
+        scan.spend(operations % 1000)
+
+        own_bytes = 0
+        files = []
+        with scan.lock:
+            for name, st in stats:
+                if st.st_nlink > 1:
+                    # 与列目录时一样登记硬链接，其他目录中的同一 inode 不会重复统计
+                    key = (st.st_dev, st.st_ino)
+                    if key in scan.linked:
+                        continue
+                    scan.linked.add(key)
+                size = _allocated_bytes(st)
+                own_bytes += size
+                if size >= self.min_file_bytes:
+                    files.append((size, name))
+        return own_bytes, heapq.nlargest(self.top_n, files)
+
+    def _rank(self, mount_point, results):
+        """自底向上汇总目录总占用，取最大的目录（限制深度）和文件"""
+        totals = {}
+        for path in sorted(results, key=lambda path: path.count(os.sep), reverse=True):
+            own_bytes, children, _ = results[path]
+            totals[path] = own_bytes + sum(totals.get(child, 0) for child in children)
+
+        root_depth = mount_point.rstrip(os.sep).count(os.sep)
+        candidates = (
+            (size, path) for path, size in totals.items()
+            if path != mount_point and path.count(os.sep) - root_depth <= self.max_depth
+        )
+        directories = [(path, size) for size, path in heapq.nlargest(self.top_n, candidates)]
+        all_files = (
+            (size, os.path.join(path, name))
+            for path, (_, _, files) in results.items() for size, name in files
+        )
+        files = [(path, size) for size, path in heapq.nlargest(self.top_n, all_files)]
+        return directories, files
+
+def build_disk_analyzer():
+    """
+    根据环境变量创建分析器，XIAOU_DISK_ANALYZE=0 时返回None
+    XIAOU_DISK_ANALYZE_BUDGET: 单次扫描最长时间（秒），XIAOU_DISK_ANALYZE_WORKERS: 扫描线程数
+    """
+    if os.environ.get("XIAOU_DISK_ANALYZE", "1") == "0":
+        return None
+    return DiskAnalyzer(
+        workers=int(os.environ.get("XIAOU_DISK_ANALYZE_WORKERS", 4)),
+        time_budget=float(os.environ.get("XIAOU_DISK_ANALYZE_BUDGET", 5)),
+    )
+
+if __name__ == "__main__":
+    import sys
+    analyzer = DiskAnalyzer()
+    target = sys.argv[1] if len(sys.argv) > 1 else "/"
+    for attempt in ("首次扫描", "再次扫描"):
+        analyzer._reports.clear()
+        report = analyzer.analyze(target)
+        print(f"{attempt}: {report.scanned_dirs} 个目录, 耗时 {round(report.elapsed, 2)}秒, "
+              f"{'完整' if report.complete else '未完成'}")
+    for path, size in report.directories:
+        print(f"目录 {format_size(size):>10}  {path}")
+    for path, size in report.files:
+        print(f"文件 {format_size(size):>10}  {path}")
@@ -0,0 +1,241 @@
+import os
+import time
+from array import array
+from collections import namedtuple
+from datetime import timedelta
+
+from disk_usage import DISK_LEVELS, DEFAULT_COOLDOWNS, MountTable
+from disk_analyzer import format_size
+from lazy_import import LazyModule
+
+psutil = LazyModule("psutil")  # 首次采样时才导入
+
+# 单个设备在一个采样周期内的IO统计：吞吐量（字节/秒）、IOPS、平均服务时间（毫秒）和利用率（%）
+# 平台不提供 busy_time 时 util 为None，周期内没有IO时 await_ms 为None
+IOStats = namedtuple("IOStats", ["device", "read_bps", "write_bps", "read_iops", "write_iops",
+                                 "await_ms", "util"])
+
+# 每个设备在计数数组中占用的字段，依次排列
+FIELDS = ("read_count", "write_count", "read_bytes", "write_bytes", "read_time", "write_time", "busy_time")
+_FIELD_COUNT = len(FIELDS)
+
+DEFAULT_UTIL_THRESHOLDS = "80,90,98"
+DEFAULT_AWAIT_THRESHOLDS = "100,500,2000"
+
+def device_name(device):
+    """把分区设备路径转换为 disk_io_counters 中的设备名，如 /dev/mapper/vg-root -> dm-0"""
+    return os.path.basename(os.path.realpath(device)) if device.startswith("/dev/") else device
+
+def format_stats(stats):
+    text = (f"读 {format_size(stats.read_bps)}/s ({round(stats.read_iops, 1)} IOPS), "
+            f"写 {format_size(stats.write_bps)}/s ({round(stats.write_iops, 1)} IOPS)")
+    if stats.await_ms is not None:
+        text += f", 平均服务时间 {round(stats.await_ms, 1)}ms"
+    if stats.util is not None:
+        text += f", 利用率 {round(stats.util, 1)}%"
+    return text
+
+class DiskIOSampler:
+    """
+    按设备计算IO速率
+    所有设备的累计计数按 FIELDS 顺序平铺在一个 array 中，两次采样的数组逐项相减即得到全部设备的差值，
+    不为每个设备单独保存对象
+    """
+    def __init__(self):
+        self._devices = ()        # 设备名，顺序与数组中的位置对应
+        self._previous = None     # 上次采样的计数数组
+        self._sampled_at = None
+
+    def sample(self):
+        """
+        采样一次
+        返回: {设备名: IOStats}，首次采样或设备列表变化后新出现的设备本次不返回
+        """
+        counters = psutil.disk_io_counters(perdisk=True) or {}
+        now = time.monotonic()
+        devices = tuple(counters)
+        current = array("d")
+        for name in devices:
+            values = counters[name]
+            # 只有 Linux 和 FreeBSD 提供 busy_time，其他平台填 -1
+            current.extend(getattr(values, field, -1) for field in FIELDS)
+
+        previous, previous_devices, elapsed = self._previous, self._devices, None
+        if self._sampled_at is not None:
+            elapsed = now - self._sampled_at
+        self._previous, self._devices, self._sampled_at = current, devices, now
+        if previous is None or not elapsed:
+            return {}
+        if devices != previous_devices:
+            # 设备增减时按设备名对齐上次的计数
+            index = {name: i for i, name in enumerate(previous_devices)}
+            aligned = array("d")
+            for name in devices:
+                i = index.get(name)
+                aligned.extend(previous[i * _FIELD_COUNT:(i + 1) * _FIELD_COUNT] if i is not None
+                               else array("d", [-1.0] * _FIELD_COUNT))
+            previous = aligned
+
+        deltas = array("d", map(float.__sub__, current, previous))
+        stats = {}
+        for i, name in enumerate(devices):
+            base = i * _FIELD_COUNT
+            if previous[base] < 0:
+                continue  # 新出现的设备
+            reads, writes, read_bytes, write_bytes, read_time, write_time, busy = deltas[base:base + _FIELD_COUNT]
+            if reads < 0 or writes < 0:
+                continue  # 计数被重置（设备重新接入）
+            ops = reads + writes
+            util = None
+            if current[base + 6] >= 0:
+                util = min(max(busy, 0) / (elapsed * 1000) * 100, 100.0)
+            stats[name] = IOStats(
+                name, read_bytes / elapsed, write_bytes / elapsed, reads / elapsed, writes / elapsed,
+                (read_time + write_time) / ops if ops else None, util,
+            )
+        return stats
+
+class IOThreshold:
+    """单个预警级别的阈值：利用率达到 util%，或平均服务时间达到 await_ms 毫秒"""
+    def __init__(self, level, util, await_ms, cooldown, min_iops=1):
+        self.level = level
+        self.util = util
+        self.await_ms = await_ms
+        self.cooldown = cooldown
+        self.min_iops = min_iops   # IOPS 过低时单个慢请求不代表设备繁忙，不按服务时间判断
+
+    def matches(self, stats):
+        if stats.util is not None and stats.util >= self.util:
+            return True
+        return (stats.await_ms is not None and stats.await_ms >= self.await_ms
+                and stats.read_iops + stats.write_iops >= self.min_iops)
+
+    def describe(self, stats):
+        if stats.util is not None and stats.util >= self.util:
+            return f"利用率 {round(stats.util, 1)}% ≥ {self.util:g}%"
+        return f"平均服务时间 {round(stats.await_ms, 1)}ms ≥ {self.await_ms:g}ms"
+
+def parse_io_thresholds(util_spec=None, await_spec=None, cooldowns=None):
+    """
+    解析IO阈值配置，格式与磁盘空间阈值相同，按低/中/高排列
+    util_spec: 利用率（%），如 "80,90,98"；await_spec: 平均服务时间（毫秒），如 "100,500,2000"
+    cooldowns: 对应级别的冷却时间（分钟）
+    返回: IOThreshold 列表（严重程度从高到低）
+    """
+    utils = [float(v) for v in (util_spec or DEFAULT_UTIL_THRESHOLDS).split(",")]
+    awaits = [float(v) for v in (await_spec or DEFAULT_AWAIT_THRESHOLDS).split(",")]
+    minutes = [float(v) for v in (cooldowns or DEFAULT_COOLDOWNS).split(",")]
+    if not len(utils) == len(awaits) == len(minutes) == 3:
+        raise ValueError(f"IO阈值配置需要低/中/高三个级别: {util_spec} / {await_spec} / {cooldowns}")
+    thresholds = [
+        IOThreshold(level, util, await_ms, timedelta(minutes=minute))
+        for level, util, await_ms, minute in zip(reversed(DISK_LEVELS), utils, awaits, minutes)
+    ]
+    thresholds.reverse()
+    return thresholds
+
+class DeviceWatch:
+    """
+    被监控的设备，对应一个或多个挂载点，保存各级别的最后预警时间
+    与挂载点空间预警使用相同的级别和冷却模型；IO 繁忙常有短时突发，
+    同一级别需要连续 sustain 次采样都达到才触发
+    """
+    def __init__(self, device, thresholds, sustain=3):
+        self.device = device
+        self.mount_points = []
+        self.thresholds = thresholds
+        self.sustain = sustain
+        self.last_warning_times = {}  # 级别 -> 最后预警时间
+        self._streaks = {}            # 级别 -> 连续达到的采样次数
+
+    def level_for(self, stats):
+        """返回当前达到的最高预警级别，没有达到时返回None"""
+        for threshold in self.thresholds:
+            if threshold.matches(stats):
+                return threshold
+        return None
+
+    def due_threshold(self, stats, now):
+        """返回需要发送预警的级别（持续达到且不在冷却期内），否则返回None"""
+        sustained = None
+        for threshold in self.thresholds:
+            streak = self._streaks.get(threshold.level, 0) + 1 if threshold.matches(stats) else 0
+            self._streaks[threshold.level] = streak
+            if sustained is None and streak >= self.sustain:
+                sustained = threshold
+        if sustained is None:
+            return None
+        last = self.last_warning_times.get(sustained.level)
+        if last is None or now - last >= sustained.cooldown:
+            return sustained
+        return None
+
+class DiskIOMonitor:
+    """
+    监控挂载点所在设备的IO吞吐量、IOPS、平均服务时间和利用率
+    通过挂载表把被监控的挂载点映射到 disk_io_counters 中的设备，挂载表变化时重新映射
+    """
+    def __init__(self, registry, thresholds=None, sustain=3, mount_table=None):
+        self.registry = registry
+        self.thresholds = thresholds or parse_io_thresholds()
+        self.sustain = sustain
+        self.mount_table = mount_table or registry.mount_table or MountTable()
+        self.sampler = DiskIOSampler()
+        self.watches = {}          # 设备名 -> DeviceWatch
+        self._mapped = None        # 生成当前映射时的 (分区列表, 挂载点)
+
+    def _map_devices(self):
+        partitions = self.mount_table.partitions()
+        mount_points = tuple(self.registry.watches)
+        if self._mapped == (partitions, mount_points):
+            return
+        self._mapped = (partitions, mount_points)
+        devices = {p.mountpoint: device_name(p.device) for p in partitions}
+        watches = {}
+        for mount_point in mount_points:
+            device = devices.get(mount_point)
+            if device is None:
+                continue  # 不在挂载表中或没有块设备（如 tmpfs、overlay）
+            watch = watches.get(device)
+            if watch is None:
+                # 保留已有设备的预警状态
+                watch = watches[device] = self.watches.get(device) or DeviceWatch(
+                    device, self.thresholds, self.sustain
+                )
+                watch.mount_points = []
+            watch.mount_points.append(mount_point)
+        self.watches = watches
+
+    def sweep(self):
+        """
+        采样所有被监控的设备
+        返回: [(DeviceWatch, IOStats), ...]，首次采样时为空
+        """
+        self._map_devices()
+        stats = self.sampler.sample()
+        return [(watch, stats[device]) for device, watch in self.watches.items() if device in stats]
+
+def build_disk_io_monitor(registry):
+    """
+    根据环境变量创建磁盘IO监控，XIAOU_DISKIO=0 时返回None
+    XIAOU_DISKIO_UTIL / XIAOU_DISKIO_AWAIT: 低/中/高三级的利用率（%）和平均服务时间（毫秒）阈值
+    XIAOU_DISKIO_COOLDOWNS: 各级别冷却时间（分钟），XIAOU_DISKIO_SUSTAIN: 连续达到多少次采样才预警
+    """
+    if os.environ.get("XIAOU_DISKIO", "1") == "0":
+        return None
+    thresholds = parse_io_thresholds(
+        os.environ.get("XIAOU_DISKIO_UTIL"),
+        os.environ.get("XIAOU_DISKIO_AWAIT"),
+        os.environ.get("XIAOU_DISKIO_COOLDOWNS"),
+    )
+    return DiskIOMonitor(registry, thresholds, sustain=int(os.environ.get("XIAOU_DISKIO_SUSTAIN", 3)))
+
+if __name__ == "__main__":
+    sampler = DiskIOSampler()
+    sampler.sample()
+    for _ in range(5):
+        time.sleep(1)
+        for name, stats in sorted(sampler.sample().items()):
+            if stats.read_iops or stats.write_iops:
+                print(f"{name}: {format_stats(stats)}")
+        print("-" * 40)
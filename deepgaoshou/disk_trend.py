@@ -0,0 +1,108 @@
+from array import array
+import time
+
+class FillRateTracker:
+    """
+    单个挂载点的磁盘写入速度跟踪
+    用固定容量的环形缓冲区保存最近的剩余空间采样，
+    在其上以增量方式维护线性回归所需的累加和，计算写入速度和预计写满时间
+    """
+    def __init__(self, capacity=30, min_samples=3, min_rate=1e-6):
+        self.capacity = capacity
+        self.min_samples = min_samples
+        self.min_rate = min_rate  # 低于该速度（GB/秒）视为稳定，忽略浮点噪声
+        self._times = array('d', bytes(8 * capacity))
+        self._values = array('d', bytes(8 * capacity))
+        self._head = 0      # 下一个写入位置
+        self._count = 0
+        self._origin = None  # 时间原点，避免累加和中出现过大的数值
+        self._reset_sums()
+
+    def _reset_sums(self):
+        self._sx = self._sy = self._sxx = self._sxy = 0.0
+
+    def _accumulate(self, x, y, sign):
+        self._sx += sign * x
+        self._sy += sign * y
+        self._sxx += sign * x * x
+        self._sxy += sign * x * y
+
+    def add(self, free_gb, timestamp=None):
+        """记录一次剩余空间采样"""
+        if timestamp is None:
+            timestamp = time.monotonic()
+        if self._origin is None:
+            self._origin = timestamp
+
+        if self._count == self.capacity:
+            # 移除最旧的采样
+            self._accumulate(self._times[self._head], self._values[self._head], -1)
+        else:
+            self._count += 1
+
+        x = timestamp - self._origin
+        self._times[self._head] = x
+        self._values[self._head] = free_gb
+        self._accumulate(x, free_gb, 1)
+        self._head = (self._head + 1) % self.capacity
+
+        # 每写满一轮，以最旧的采样为原点重新计算累加和，消除浮点误差累积
+        if self._head == 0:
+            self._rebase()
+
+    def _rebase(self):
+        # 此时缓冲区已按时间顺序排列，下标0即最旧的采样
+        oldest = self._times[0]
+        self._origin += oldest
+        self._reset_sums()
+        for i in range(self._count):
+            self._times[i] -= oldest
+            self._accumulate(self._times[i], self._values[i], 1)
+
+    def fill_rate(self):
+        """
+        写入速度（GB/秒），正数表示剩余空间在减少
+        采样不足时返回None
+        """
+        n = self._count
+        if n < self.min_samples:
+            return None
+        denominator = n * self._sxx - self._sx * self._sx
+        if denominator <= 0:
+            return None
+        slope = (n * self._sxy - self._sx * self._sy) / denominator
+        return -slope
+
+    def time_to_full(self, free_gb):
+        """预计写满所需的秒数，剩余空间没有减少时返回None"""
+        rate = self.fill_rate()
+        if rate is None or rate < self.min_rate:
+            return None
+        return free_gb / rate
+
+    def suggest_interval(self, free_gb, base_interval, min_interval):
+        """
+        根据预计写满时间建议下一次采样间隔
+        写入越快间隔越短，磁盘稳定时恢复为 base_interval
+        """
+        ttf = self.time_to_full(free_gb)
+        if ttf is None:
+            return base_interval
+        return max(min_interval, min(base_interval, ttf / 30))
+
+def format_duration(seconds):
+    """将秒数格式化为易读的时长"""
+    minutes = int(seconds // 60)
+    if minutes < 1:
+        return "不到1分钟"
+    hours, minutes = divmod(minutes, 60)
+    days, hours = divmod(hours, 24)
+    if days > 0:
+        return f"{days}天{hours}小时{minutes}分钟"
+    if hours > 0:
+        return f"{hours}小时{minutes}分钟"
+    return f"{minutes}分钟"
+
+def format_fill_rate(rate):
+    """将写入速度（GB/秒）格式化为 GB/分钟"""
+    return f"{round(rate * 60, 2)} GB/分钟"
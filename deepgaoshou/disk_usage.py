@@ -1,5 +1,13 @@
-import psutil
 import platform
+import os
+import select
+import time
+from datetime import timedelta
+from disk_trend import FillRateTracker
+from lazy_import import LazyModule
+import instrumentation
+
+psutil = LazyModule("psutil")  # 首次检查磁盘时才导入
 
 def _log(message):
     """统一的日志输出函数"""
@@ -7,10 +15,10 @@ def _log(message):
     timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
     print(f"[{timestamp}] {message}", flush=True)
 
-def check_disk_usage(mount_point=None):
+def read_disk_usage(mount_point=None):
     """
-    检查指定挂载点的磁盘使用情况
-    返回: (总空间GB, 已用空间GB, 剩余空间GB, 使用百分比)
+    读取指定挂载点的磁盘使用情况（字节）
+    返回: psutil.disk_usage 的结果（total/used/free/percent），出错时返回None
     """
     try:
         # 如果没有指定挂载点，根据操作系统选择默认值
@@ -28,18 +36,29 @@ def check_disk_usage(mount_point=None):
             if not mount_point.endswith('\\'):
                 mount_point += '\\'
         
-        disk_usage = psutil.disk_usage(mount_point)
-        
-        total_gb = round(disk_usage.total / (1024 ** 3), 2)
-        used_gb = round(disk_usage.used / (1024 ** 3), 2)
-        free_gb = round(disk_usage.free / (1024 ** 3), 2)
-        percent = round(disk_usage.percent, 2)
-        
-        return total_gb, used_gb, free_gb, percent
+        with instrumentation.timer("disk_usage"):
+            return psutil.disk_usage(mount_point)
     except Exception as e:
         _log(f"检查磁盘使用情况时出错: {e}")
         _log(f"尝试的挂载点: {mount_point}")
+        return None
+
+def _to_gb(disk_usage):
+    """把 read_disk_usage 的结果换算为 (总空间GB, 已用空间GB, 剩余空间GB, 使用百分比)，读取失败时均为0"""
+    if disk_usage is None:
         return 0, 0, 0, 0
+    total_gb = round(disk_usage.total / (1024 ** 3), 2)
+    used_gb = round(disk_usage.used / (1024 ** 3), 2)
+    free_gb = round(disk_usage.free / (1024 ** 3), 2)
+    percent = round(disk_usage.percent, 2)
+    return total_gb, used_gb, free_gb, percent
+
+def check_disk_usage(mount_point=None):
+    """
+    检查指定挂载点的磁盘使用情况
+    返回: (总空间GB, 已用空间GB, 剩余空间GB, 使用百分比)
+    """
+    return _to_gb(read_disk_usage(mount_point))
 
 def get_available_drives():
     """
@@ -60,6 +79,203 @@ def get_available_drives():
     
     return drives
 
+class DiskThreshold:
+    """
+    单个预警级别的阈值
+    kind 为 "gb" 时表示剩余空间低于 value GB，为 "percent" 时表示剩余比例低于 value%
+    """
+    def __init__(self, level, kind, value, cooldown):
+        self.level = level
+        self.kind = kind
+        self.value = value
+        self.cooldown = cooldown
+
+    def matches(self, free_gb, percent):
+        if self.kind == "percent":
+            return 100 - percent < self.value
+        return free_gb < self.value
+
+    def describe(self):
+        if self.kind == "percent":
+            return f"剩余{self.value:g}%"
+        return f"{self.value:g}GB"
+
+# 预警级别，按严重程度从高到低排列
+DISK_LEVELS = ("high", "medium", "low")
+DEFAULT_THRESHOLDS = "100GB,30GB,1GB"
+DEFAULT_COOLDOWNS = "90,20,10"
+
+def parse_thresholds(spec=None, cooldowns=None):
+    """
+    解析阈值配置
+    spec: 低/中/高三个级别的阈值，如 "100GB,30GB,1GB" 或 "10%,5%,1GB"
+    cooldowns: 对应级别的冷却时间（分钟），如 "90,20,10"
+    返回: DiskThreshold 列表（严重程度从高到低）
+    """
+    values = [v.strip() for v in (spec or DEFAULT_THRESHOLDS).split(",")]
+    minutes = [float(v) for v in (cooldowns or DEFAULT_COOLDOWNS).split(",")]
+    if len(values) != 3 or len(minutes) != 3:
+        raise ValueError(f"阈值配置需要低/中/高三个级别: {spec} / {cooldowns}")
+
+    thresholds = []
+    for level, value, minute in zip(reversed(DISK_LEVELS), values, minutes):
+        if value.endswith("%"):
+            kind, number = "percent", float(value[:-1])
+        else:
+            kind, number = "gb", float(value.upper().removesuffix("GB"))
+        thresholds.append(DiskThreshold(level, kind, number, timedelta(minutes=minute)))
+    thresholds.reverse()
+    return thresholds
+
+def parse_mount_thresholds(spec, cooldowns=None):
+    """
+    解析按挂载点单独设置的阈值，如 "/data=10%,5%,1%;/boot=1GB,0.5GB,0.1GB"
+    返回: dict - 挂载点 -> DiskThreshold 列表
+    """
+    result = {}
+    for item in (spec or "").split(";"):
+        if not item.strip():
+            continue
+        mount_point, _, values = item.partition("=")
+        result[mount_point.strip()] = parse_thresholds(values, cooldowns)
+    return result
+
+class MountWatch:
+    """被监控的挂载点，保存各级别的阈值和最后预警时间"""
+    def __init__(self, mount_point, thresholds):
+        self.mount_point = mount_point
+        self.thresholds = thresholds
+        self.last_warning_times = {}  # 级别 -> 最后预警时间
+        self.trend = FillRateTracker()  # 写入速度跟踪
+        self.usage_bytes = None         # 最近一次采样的 (总字节, 已用字节, 剩余字节)，读取失败时为None
+
+    def level_for(self, free_gb, percent):
+        """返回当前触发的最高预警级别，没有触发时返回None"""
+        for threshold in self.thresholds:
+            if threshold.matches(free_gb, percent):
+                return threshold
+        return None
+
+    def due_threshold(self, free_gb, percent, now):
+        """返回需要发送预警的级别（已触发且不在冷却期内），否则返回None"""
+        threshold = self.level_for(free_gb, percent)
+        if threshold is None:
+            return None
+        last = self.last_warning_times.get(threshold.level)
+        if last is None or now - last >= threshold.cooldown:
+            return threshold
+        return None
+
+class MountTable:
+    """
+    挂载表缓存，只在挂载表发生变化时重新调用 psutil.disk_partitions
+    Linux 上通过 poll /proc/self/mounts 获取变化通知，其他系统按固定间隔重新扫描
+    变化通知只在 partitions() 中读取一次，重新扫描后返回新的列表对象，
+    多个使用方通过比较列表对象判断挂载表是否变化，不会互相消耗通知
+    """
+    def __init__(self, rescan_interval=300):
+        self.rescan_interval = rescan_interval
+        self._partitions = None
+        self._scanned_at = 0
+        self._mounts_file = None
+        self._poller = None
+        try:
+            self._mounts_file = open("/proc/self/mounts")
+            self._poller = select.poll()
+            self._poller.register(self._mounts_file, select.POLLERR | select.POLLPRI)
+        except (OSError, AttributeError):
+            self._poller = None
+
+    def _changed(self):
+        """挂载表是否可能已变化（会消耗 poll 通知，只能由 partitions 调用）"""
+        if self._partitions is None:
+            return True
+        if self._poller is not None:
+            return bool(self._poller.poll(0))
+        return time.monotonic() - self._scanned_at >= self.rescan_interval
+
+    def partitions(self):
+        """返回当前的分区列表，挂载表未变化时直接使用缓存"""
+        if self._changed():
+            if self._poller is not None:
+                # 重新读取挂载表文件以确认本次通知
+                self._mounts_file.seek(0)
+                self._mounts_file.read()
+            self._partitions = psutil.disk_partitions(all=False)
+            self._scanned_at = time.monotonic()
+        return self._partitions
+
+class MountRegistry:
+    """
+    管理所有被监控的挂载点
+    mount_points 为 "auto" 时监控所有物理分区，并随挂载表变化自动增删
+    """
+    def __init__(self, mount_points, thresholds=None, mount_thresholds=None, mount_table=None):
+        self.auto = mount_points == "auto"
+        self.mount_points = [] if self.auto else list(mount_points)
+        self.thresholds = thresholds or parse_thresholds()
+        self.mount_thresholds = mount_thresholds or {}
+        self.mount_table = mount_table or (MountTable() if self.auto else None)
+        self.watches = {}
+        self._partitions = None   # 生成当前监控项时的分区列表（auto 模式）
+        self._refresh()
+
+    def _refresh(self, partitions=None):
+        if self.auto:
+            self._partitions = partitions if partitions is not None else self.mount_table.partitions()
+            mount_points = [p.mountpoint for p in self._partitions]
+        else:
+            mount_points = self.mount_points
+
+        # 保留已有挂载点的预警状态，只为新挂载点创建监控项
+        self.watches = {
+            mount_point: self.watches.get(mount_point) or MountWatch(
+                mount_point, self.mount_thresholds.get(mount_point, self.thresholds)
+            )
+            for mount_point in mount_points
+        }
+
+    def sweep(self):
+        """
+        检查所有挂载点
+        返回: [(MountWatch, (总空间GB, 已用空间GB, 剩余空间GB, 使用百分比)), ...]
+        未经换算的字节数保存在 MountWatch.usage_bytes 中
+        """
+        if self.auto:
+            partitions = self.mount_table.partitions()
+            if partitions is not self._partitions:
+                self._refresh(partitions)
+        result = []
+        for mount_point, watch in self.watches.items():
+            disk_usage = read_disk_usage(mount_point)
+            watch.usage_bytes = (disk_usage.total, disk_usage.used, disk_usage.free) if disk_usage is not None else None
+            result.append((watch, _to_gb(disk_usage)))
+        return result
+
+def default_mount_point():
+    """根据操作系统返回默认挂载点"""
+    return "C:\\" if platform.system() == "Windows" else "/"
+
+def build_mount_registry(mount_spec=None):
+    """
+    根据环境变量创建挂载点监控
+    mount_spec / ENV_MOUNT_POINT: 单个挂载点、逗号分隔的多个挂载点，或 "auto"
+    XIAOU_DISK_THRESHOLDS: 默认阈值，如 "100GB,30GB,1GB"
+    XIAOU_DISK_COOLDOWNS: 各级别冷却时间（分钟），如 "90,20,10"
+    XIAOU_DISK_MOUNT_THRESHOLDS: 按挂载点设置的阈值，如 "/data=10%,5%,1%"
+    """
+    if mount_spec is None:
+        mount_spec = os.environ.get("ENV_MOUNT_POINT") or default_mount_point()
+    cooldowns = os.environ.get("XIAOU_DISK_COOLDOWNS")
+    thresholds = parse_thresholds(os.environ.get("XIAOU_DISK_THRESHOLDS"), cooldowns)
+    mount_thresholds = parse_mount_thresholds(os.environ.get("XIAOU_DISK_MOUNT_THRESHOLDS"), cooldowns)
+
+    if mount_spec.strip().lower() == "auto":
+        mount_points = "auto"
+    else:
+        mount_points = [m.strip() for m in mount_spec.split(",") if m.strip()]
+    return MountRegistry(mount_points, thresholds, mount_thresholds)
+
 if __name__ == "__main__":
     # 测试所有驱动器
     if platform.system() == "Windows":
@@ -76,4 +292,10 @@ if __name__ == "__main__":
         _log(f"总空间: {total}GB")
         _log(f"已用空间: {used}GB")
         _log(f"剩余空间: {free}GB")
-        _log(f"使用率: {percent}%")
\ No newline at end of file
+        _log(f"使用率: {percent}%")
+    
+    # 测试所有物理分区
+    _log("所有物理分区:")
+    registry = MountRegistry("auto")
+    for watch, (total, used, free, percent) in registry.sweep():
+        _log(f"  {watch.mount_point}: 剩余 {free}GB / {total}GB ({percent}% 已使用)")
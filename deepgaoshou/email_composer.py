@@ -1,10 +1,21 @@
 import random
 import time
-from datetime import datetime, timedelta
+from datetime import datetime
+from disk_analyzer import format_size
+from state_store import TTLMap
+
+def _log(message):
+    """统一的日志输出函数"""
+    timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    print(f"[{timestamp}] {message}", flush=True)
+
+TITLE_REPEAT_WINDOW = 30 * 60  # 同一标题在该时间（秒）内重复发送时添加随机前缀
 
 class EmailComposer:
     def __init__(self):
-        self.sent_titles = {}  # 存储已发送的标题和时间
+        # 已发送的标题，30分钟后过期，最多保留256个
+        self.sent_titles = TTLMap(TITLE_REPEAT_WINDOW, maxsize=256)
+        self._listeners = []
         self.prefixes = [
             "哦齁齁❤", "啊齁齁❤", "齁唔❤", 
             "去了去了❤", "嗯？❤", "哇哦❤",
@@ -15,18 +26,30 @@ class EmailComposer:
         """
         检查是否需要在标题前添加随机前缀
         """
-        current_time = datetime.now()
-        
+        # 30分钟内发送过同样的标题
         if base_title in self.sent_titles:
-            last_sent_time = self.sent_titles[base_title]
-            # 检查是否在30分钟内
-            if current_time - last_sent_time < timedelta(minutes=30):
-                return True
+            return True
         
         # 更新发送时间
-        self.sent_titles[base_title] = current_time
+        sent_time = time.time()
+        self.sent_titles.set(base_title, True, now=sent_time)
+        for listener in self._listeners:
+            # 持久化失败不能影响邮件发送
+            try:
+                listener(base_title, sent_time)
+            except Exception as e:
+                _log(f"标题记录监听器出错: {e}")
         return False
     
+    def add_listener(self, listener):
+        """注册监听器，记录新标题时以 listener(标题, 时间戳) 调用，用于持久化"""
+        self._listeners.append(listener)
+    
+    def restore_title(self, base_title, sent_time):
+        """恢复重启前记录的标题发送时间（已过期的会被忽略）"""
+        if time.time() - sent_time < TITLE_REPEAT_WINDOW:
+            self.sent_titles.set(base_title, True, now=sent_time)
+    
     def format_title(self, base_title):
         """
         格式化邮件标题，确保30分钟内不重复
@@ -37,7 +60,61 @@ class EmailComposer:
         else:
             return base_title
     
-    def compose_online_notification(self, boot_time, uptime):
+    def _format_trend(self, trend):
+        """
+        格式化磁盘写入趋势
+        trend: (写入速度文本, 预计写满时间文本)，为None时不显示
+        """
+        if not trend:
+            return ""
+        fill_rate, time_to_full = trend
+        return f"\n• 写入速度：{fill_rate}\n• 预计写满：约{time_to_full}后"
+    
+    def _format_consumers(self, report):
+        """
+        格式化占用空间最多的目录和文件
+        report: disk_analyzer.DiskReport，为None时不显示
+        """
+        if not report or not (report.directories or report.files):
+            return ""
+        lines = []
+        for title, items in (("占用空间最多的目录", report.directories), ("占用空间最多的文件", report.files)):
+            if items:
+                lines.append(f"\n\n{title}：")
+                lines.extend(f"\n  {format_size(size):>10}  {path}" for path, size in items)
+        if not report.complete:
+            lines.append("\n\n（扫描超出时间或IO预算已提前结束，结果可能不完整）")
+        return "".join(lines)
+    
+    def _format_quality(self, quality):
+        """
+        格式化网络质量统计
+        quality: 各测量目标的统计文本列表，为空时不显示
+        """
+        if not quality:
+            return ""
+        return "\n\n网络质量：" + "".join(f"\n  {line}" for line in quality)
+    
+    def _format_processes(self, processes):
+        """
+        格式化占用资源最多的进程
+        processes: 各项排名的文本列表，为空时不显示
+        """
+        if not processes:
+            return ""
+        return "\n\n占用资源最多的进程：" + "".join(f"\n  {line}" for line in processes)
+    
+    def _format_diagnosis(self, diagnosis):
+        """
+        格式化断网时的分层诊断结果
+        diagnosis: (诊断时间文本, 各层结果文本列表)，为None时不显示
+        """
+        if not diagnosis:
+            return ""
+        diagnosed_at, lines = diagnosis
+        return f"\n\n断网诊断（{diagnosed_at}）：" + "".join(f"\n  {line}" for line in lines)
+    
+    def compose_online_notification(self, boot_time, uptime, quality=None):
         """
         编写上线通知邮件内容
         """
@@ -47,7 +124,7 @@ class EmailComposer:
 系统状态报告：
 • 当前时间：{current_time}
 • 系统开机时间：{boot_time}
-• 系统运行时间：{uptime}
+• 系统运行时间：{uptime}{self._format_quality(quality)}
 
 系统已成功启动并连接到互联网。
 小悠开始为您服务！❤
@@ -55,16 +132,17 @@ class EmailComposer:
 -- 自动发送于 {current_time}"""
         return content
     
-    def compose_reconnect_notification(self):
+    def compose_reconnect_notification(self, quality=None, diagnosis=None):
         """
         编写重新联网通知邮件内容
+        diagnosis: 断网时的分层诊断结果，见 _format_diagnosis
         """
         current_time = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
         content = f"""小悠重新联网通知
 
 网络状态报告：
 • 当前时间：{current_time}
-• 事件：网络连接已恢复
+• 事件：网络连接已恢复{self._format_diagnosis(diagnosis)}{self._format_quality(quality)}
 
 系统检测到网络连接从断开状态恢复。
 小悠继续为您服务！❤
@@ -72,7 +150,36 @@ class EmailComposer:
 -- 自动发送于 {current_time}"""
         return content
     
-    def compose_disk_warning_low(self, mount_point, total_gb, used_gb, free_gb, percent):
+    def compose_network_degraded(self, details, quality=None):
+        """
+        编写网络质量下降警告邮件内容
+        details: 超出阈值的测量目标描述列表
+        """
+        current_time = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        problems = "".join(f"\n• {line}" for line in details)
+        content = f"""网络质量警告
+
+网络仍然连通，但以下测量目标超出了质量阈值：{problems}{self._format_quality(quality)}
+
+请检查上行链路是否拥塞或不稳定。
+
+-- 自动发送于 {current_time}"""
+        return content
+    
+    def compose_network_recovered(self, quality=None):
+        """
+        编写网络质量恢复通知邮件内容
+        """
+        current_time = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        content = f"""网络质量恢复通知
+
+网络质量已恢复到阈值以内。{self._format_quality(quality)}
+
+-- 自动发送于 {current_time}"""
+        return content
+    
+    def compose_disk_warning_low(self, mount_point, total_gb, used_gb, free_gb, percent, trend=None, consumers=None,
+                                 processes=None):
         """
         编写低级别磁盘空间警告邮件内容（100GB > 剩余 > 30GB）
         """
@@ -83,14 +190,15 @@ class EmailComposer:
 • 挂载点：{mount_point}
 • 总空间：{total_gb} GB
 • 已使用：{used_gb} GB ({percent}%)
-• 剩余空间：{free_gb} GB
+• 剩余空间：{free_gb} GB{self._format_trend(trend)}{self._format_consumers(consumers)}{self._format_processes(processes)}
 
 请注意及时清理磁盘空间，避免影响系统运行。
 
 -- 自动发送于 {current_time}"""
         return content
     
-    def compose_disk_warning_medium(self, mount_point, total_gb, used_gb, free_gb, percent):
+    def compose_disk_warning_medium(self, mount_point, total_gb, used_gb, free_gb, percent, trend=None, consumers=None,
+                                    processes=None):
         """
         编写中级别磁盘空间警告邮件内容（30GB > 剩余 > 1GB）
         """
@@ -101,14 +209,15 @@ class EmailComposer:
 • 挂载点：{mount_point}
 • 总空间：{total_gb} GB
 • 已使用：{used_gb} GB ({percent}%)
-• 剩余空间：{free_gb} GB
+• 剩余空间：{free_gb} GB{self._format_trend(trend)}{self._format_consumers(consumers)}{self._format_processes(processes)}
 
 请立即清理磁盘空间，系统运行可能受到影响！
 
 -- 自动发送于 {current_time}"""
         return content
     
-    def compose_disk_warning_high(self, mount_point, total_gb, used_gb, free_gb, percent):
+    def compose_disk_warning_high(self, mount_point, total_gb, used_gb, free_gb, percent, trend=None, consumers=None,
+                                  processes=None):
         """
         编写高级别磁盘空间警告邮件内容（剩余 < 1GB）
         """
@@ -119,12 +228,92 @@ class EmailComposer:
 • 挂载点：{mount_point}
 • 总空间：{total_gb} GB
 • 已使用：{used_gb} GB ({percent}%)
-• 剩余空间：{free_gb} GB
+• 剩余空间：{free_gb} GB{self._format_trend(trend)}{self._format_consumers(consumers)}{self._format_processes(processes)}
 
 请立即清理磁盘空间，系统运行即将受到严重影响！
 
+-- 自动发送于 {current_time}"""
+        return content
+
+    def compose_disk_warning_predicted(self, mount_point, total_gb, used_gb, free_gb, percent, trend,
+                                       consumers=None, processes=None):
+        """
+        编写磁盘即将写满的预测警告邮件内容（按当前写入速度推算）
+        """
+        current_time = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        content = f"""磁盘空间预测警告
+
+系统检测到磁盘空间正在快速减少：
+• 挂载点：{mount_point}
+• 总空间：{total_gb} GB
+• 已使用：{used_gb} GB ({percent}%)
+• 剩余空间：{free_gb} GB{self._format_trend(trend)}{self._format_consumers(consumers)}{self._format_processes(processes)}
+
+按当前写入速度磁盘即将写满，请尽快排查写入来源！
+
+-- 自动发送于 {current_time}"""
+        return content
+
+    
+    def compose_disk_io_warning(self, level, device, mount_points, stats, reason, processes=None):
+        """
+        编写磁盘IO繁忙警告邮件内容
+        level: 预警级别（low/medium/high），stats: 格式化后的IO统计，reason: 触发的阈值
+        """
+        heading, advice = {
+            "low": ("磁盘IO提醒", "请留意是否有异常的读写任务。"),
+            "medium": ("磁盘IO严重警告", "磁盘持续繁忙，系统响应可能变慢！"),
+            "high": ("磁盘IO紧急警告", "磁盘已接近饱和，请立即排查读写来源！"),
+        }[level]
+        current_time = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        content = f"""{heading}
+
+系统检测到磁盘持续繁忙：
+• 设备：{device}
+• 挂载点：{mount_points}
+• 触发条件：{reason}
+• IO统计：{stats}{self._format_processes(processes)}
+
+{advice}
+
+-- 自动发送于 {current_time}"""
+        return content
+
+    def compose_check_failed(self, name, check_type, target, detail, down_since):
+        """
+        编写配置文件中的检查失败通知邮件内容
+        down_since: 确认失败的时间
+        """
+        current_time = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        content = f"""检查失败通知
+
+系统检测到检查连续失败：
+• 检查：{name}（{check_type}）
+• 对象：{target}
+• 失败时间：{down_since.strftime("%Y-%m-%d %H:%M:%S")}
+• 最近结果：{detail}
+
+请检查对应的服务或网络是否正常。
+
+-- 自动发送于 {current_time}"""
+        return content
+
+    def compose_check_recovered(self, name, check_type, target, detail, down_since):
+        """
+        编写配置文件中的检查恢复通知邮件内容
+        """
+        current_time = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        since = down_since.strftime("%Y-%m-%d %H:%M:%S") if down_since else "未知"
+        content = f"""检查恢复通知
+
+检查已恢复正常：
+• 检查：{name}（{check_type}）
+• 对象：{target}
+• 失败时间：{since}
+• 最近结果：{detail}
+
 -- 自动发送于 {current_time}"""
         return content
 
 # 全局实例
-email_composer = EmailComposer()
\ No newline at end of file
+email_composer = EmailComposer()
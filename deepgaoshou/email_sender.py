@@ -1,17 +1,199 @@
-from email import encoders
-from email.header import Header
-from email.mime.text import MIMEText
-from email.utils import parseaddr, formataddr
 import os
-from dotenv import load_dotenv
-import smtplib
+import time
+import atexit
+import threading
+import instrumentation
+from lazy_import import LazyModule
 
-load_dotenv()
+# 邮件相关模块在首次连接或发送时才导入，不拖慢启动
+smtplib = LazyModule("smtplib")
 
 def _format_addr(s):
+    from email.header import Header
+    from email.utils import parseaddr, formataddr
     name, addr = parseaddr(s)
     return formataddr((Header(name, 'utf-8').encode(), addr))
 
+class SMTPSessionManager:
+    """
+    复用已认证的SMTP连接
+    - 复用前用 NOOP 检查连接是否仍然可用
+    - 服务器断开连接时透明地重新连接
+    - 空闲超过 idle_timeout 秒后自动关闭连接
+    """
+    def __init__(self, host, port=587, username=None, password=None,
+                 use_starttls=True, idle_timeout=300, timeout=30):
+        self.host = host
+        self.port = port
+        self.username = username
+        self.password = password
+        self.use_starttls = use_starttls
+        self.idle_timeout = idle_timeout
+        self.timeout = timeout
+
+        self._server = None
+        self._last_used = 0
+        self._lock = threading.RLock()
+        self._reaper = None
+        self._reaper_wakeup = threading.Event()
+
+    def _connect(self):
+        """建立新连接并完成 STARTTLS 和登录"""
+        with instrumentation.timer("smtp_phase", phase="connect"):
+            server = smtplib.SMTP(self.host, self.port, timeout=self.timeout)
+        try:
+            server.set_debuglevel(0)  # 生产环境关闭调试
+            if self.use_starttls:
+                with instrumentation.timer("smtp_phase", phase="starttls"):
+                    server.starttls()
+            if self.username and self.password:
+                with instrumentation.timer("smtp_phase", phase="login"):
+                    server.login(self.username, self.password)
+        except Exception:
+            self._quit(server)
+            raise
+        return server
+
+    @staticmethod
+    def _quit(server):
+        try:
+            server.quit()
+        except Exception:
+            try:
+                server.close()
+            except Exception:
+                pass
+
+    @staticmethod
+    def _is_alive(server):
+        """用 NOOP 检查连接是否仍然可用"""
+        try:
+            with instrumentation.timer("smtp_phase", phase="noop"):
+                return server.noop()[0] == 250
+        except (smtplib.SMTPException, OSError):
+            return False
+
+    def _get_server(self):
+        """获取可用连接，必要时重新连接（调用方需持有锁）"""
+        if self._server is not None and not self._is_alive(self._server):
+            self._discard()
+        if self._server is None:
+            self._server = self._connect()
+            self._last_used = time.monotonic()  # 从建立连接开始计算空闲时间，首次发送失败时连接不会被立即回收
+            self._start_reaper()
+        return self._server
+
+    def _discard(self):
+        if self._server is not None:
+            self._quit(self._server)
+            self._server = None
+
+    def connect(self):
+        """预先建立连接（已有可用连接时直接复用），之后的 sendmail 无需再等待握手"""
+        with self._lock:
+            self._get_server()
+            self._last_used = time.monotonic()
+
+    def sendmail(self, from_addr, to_addrs, msg):
+        """通过复用的连接发送邮件，连接被服务器断开时重连一次"""
+        with self._lock:
+            try:
+                server = self._get_server()
+                with instrumentation.timer("smtp_phase", phase="sendmail"):
+                    server.sendmail(from_addr, to_addrs, msg)
+            except (smtplib.SMTPServerDisconnected, ConnectionError):
+                self._discard()
+                server = self._get_server()
+                with instrumentation.timer("smtp_phase", phase="sendmail"):
+                    server.sendmail(from_addr, to_addrs, msg)
+            self._last_used = time.monotonic()
+
+    def close(self):
+        """关闭当前连接"""
+        with self._lock:
+            self._discard()
+        self._reaper_wakeup.set()
+
+    def _start_reaper(self):
+        if self.idle_timeout and (self._reaper is None or not self._reaper.is_alive()):
+            self._reaper_wakeup.clear()
+            self._reaper = threading.Thread(target=self._reap_idle, daemon=True)
+            self._reaper.start()
+
+    def _reap_idle(self):
+        """后台关闭空闲超时的连接，连接关闭后线程退出"""
+        while True:
+            with self._lock:
+                if self._server is None:
+                    return
+                idle = time.monotonic() - self._last_used
+                if idle >= self.idle_timeout:
+                    self._discard()
+                    return
+                remaining = self.idle_timeout - idle
+            self._reaper_wakeup.wait(remaining)
+            self._reaper_wakeup.clear()
+
+_session_manager = None
+_session_manager_lock = threading.Lock()
+
+def get_session_manager():
+    """
+    获取全局SMTP会话管理器，首次调用时根据环境变量创建
+    XIAOU_SMTP_SERVER / XIAOU_SMTP_PORT / XIAOU_SMTP_STARTTLS / XIAOU_SMTP_IDLE_TIMEOUT
+    """
+    global _session_manager
+    with _session_manager_lock:
+        if _session_manager is None:
+            _session_manager = SMTPSessionManager(
+                host=os.environ.get('XIAOU_SMTP_SERVER', "smtp.mxhichina.com"),
+                port=int(os.environ.get('XIAOU_SMTP_PORT', 587)),
+                username=os.environ.get('ENV_EMLADDR'),
+                password=os.environ.get('ENV_EMLPAW'),
+                use_starttls=os.environ.get('XIAOU_SMTP_STARTTLS', '1') != '0',
+                idle_timeout=float(os.environ.get('XIAOU_SMTP_IDLE_TIMEOUT', 300)),
+            )
+            atexit.register(_session_manager.close)
+        return _session_manager
+
+def warm_up(on_done=None):
+    """
+    在后台线程中预先建立SMTP连接，启动时与联网检测并行进行
+    on_done(success, elapsed): 连接完成后在该线程中调用
+    返回: 预连接线程，邮件配置不完整时返回None
+    """
+    if not all(os.environ.get(name) for name in ('ENV_EMLADDR', 'ENV_EMLPAW', 'ENV_EMLNOTION2')):
+        return None
+
+    def run():
+        start = time.perf_counter()
+        try:
+            get_session_manager().connect()
+            success = True
+        except Exception as e:
+            print(f"SMTP预连接失败，将在发送时重试: {e}")
+            success = False
+        if on_done is not None:
+            on_done(success, time.perf_counter() - start)
+
+    thread = threading.Thread(target=run, name="smtp-warm-up", daemon=True)
+    thread.start()
+    return thread
+
+def parse_recipients(value):
+    """解析逗号分隔的收件人列表"""
+    return [addr.strip() for addr in (value or "").split(",") if addr.strip()]
+
+def build_message(from_addr, to_addrs, subject, content):
+    """构造邮件，返回可直接交给 sendmail 的文本"""
+    from email.header import Header
+    from email.mime.text import MIMEText
+    msg = MIMEText(content, 'plain', 'utf-8')
+    msg['From'] = _format_addr(f'小悠 <{from_addr}>')
+    msg['To'] = ", ".join(_format_addr(f'管理员 <{addr}>') for addr in to_addrs)
+    msg['Subject'] = Header(subject, 'utf-8').encode()
+    return msg.as_string()
+
 def send_email(subject, content):
     """
     发送邮件
@@ -21,26 +203,15 @@ def send_email(subject, content):
     try:
         from_addr = os.environ.get('ENV_EMLADDR')
         password = os.environ.get('ENV_EMLPAW')
-        to_addr = os.environ.get('ENV_EMLNOTION2')
-        smtp_server = "smtp.mxhichina.com"
-        
-        if not all([from_addr, password, to_addr]):
+        to_addrs = parse_recipients(os.environ.get('ENV_EMLNOTION2'))
+
+        if not all([from_addr, password, to_addrs]):
             print("错误: 邮件配置信息不完整")
             return False
 
-        msg = MIMEText(content, 'plain', 'utf-8')
-        msg['From'] = _format_addr(f'小悠 <{from_addr}>')
-        msg['To'] = _format_addr(f'管理员 <{to_addr}>')
-        msg['Subject'] = Header(subject, 'utf-8').encode()
-
-        smtp_port = 587
-        server = smtplib.SMTP(smtp_server, smtp_port)
-        server.starttls()
-        server.set_debuglevel(0)  # 生产环境关闭调试
-        server.login(from_addr, password)
-        server.sendmail(from_addr, [to_addr], msg.as_string())
-        server.quit()
-        
+        msg = build_message(from_addr, to_addrs, subject, content)
+        get_session_manager().sendmail(from_addr, to_addrs, msg)
+
         print(f"邮件发送成功: {subject}")
         return True
     except Exception as e:
@@ -48,5 +219,7 @@ def send_email(subject, content):
         return False
 
 if __name__ == "__main__":
+    import config
+    config.load_config()
     # 测试发送
-    send_email("测试邮件", "这是一封测试邮件")
\ No newline at end of file
+    send_email("测试邮件", "这是一封测试邮件")
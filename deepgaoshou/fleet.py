@@ -0,0 +1,616 @@
+import hashlib
+import hmac
+import itertools
+import json
+import math
+import os
+import selectors
+import socket
+import threading
+import time
+from collections import deque
+from datetime import datetime
+
+from metrics import metrics, series_name
+from notifier import SEVERITIES, SEVERITY_INFO, SEVERITY_CRITICAL
+
+DEFAULT_PORT = 9470
+MAX_ALERT_CONTENT = 4000      # 单条告警内容上限（字符），保证 UDP 报文不会过大
+MAX_STREAM_BUFFER = 1024 * 1024
+MAX_NODES = 10000             # 汇总端最多保存的节点数
+NODE_TTL = 24 * 3600          # 离线超过该时间（秒）的节点从汇总端移除
+
+def _log(message):
+    """统一的日志输出函数"""
+    timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    print(f"[{timestamp}] {message}", flush=True)
+
+def parse_address(spec, default_port=DEFAULT_PORT):
+    """解析 host:port，省略端口时使用默认端口，省略主机时只监听/连接本机"""
+    host, sep, port = spec.strip().rpartition(":")
+    if not sep:
+        return spec.strip(), default_port
+    return host or "127.0.0.1", int(port)
+
+def _sign(payload, secret):
+    return hmac.new(secret, payload, hashlib.sha256).hexdigest().encode("ascii")
+
+def encode_report(node, run, seq, interval, gauges=None, full=False, alerts=None, secret=None):
+    """
+    编码一次上报，UDP 和 TCP 使用同样的格式（TCP 按换行分隔）
+    n: 节点名, r: 本次运行的标识, s: 序号, i: 上报间隔, g: 指标, f: 是否为全量指标, a: 告警
+    secret: 共享密钥（bytes），设置后在报文前加上 HMAC-SHA256 签名和一个空格
+    """
+    report = {"n": node, "r": run, "s": seq, "i": interval}
+    if gauges:
+        report["g"] = gauges
+    if full:
+        report["f"] = 1
+    if alerts:
+        report["a"] = alerts
+    data = json.dumps(report, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+    if secret is not None:
+        data = _sign(data, secret) + b" " + data
+    return data + b"\n"
+
+def _valid_alert(alert):
+    """告警格式为 [编号, 级别, 标题, 内容]"""
+    return (isinstance(alert, list) and len(alert) == 4 and isinstance(alert[0], int)
+            and alert[1] in SEVERITIES and isinstance(alert[2], str) and isinstance(alert[3], str))
+
+def decode_report(data, secret=None):
+    """
+    解码一次上报，格式不正确或签名不匹配时抛出 ValueError
+    各字段的类型都在这里校验，汇总端不会因为异常报文出错；格式不正确的告警被剔除，
+    数量记录在 report["invalid_alerts"] 中
+    secret: 共享密钥（bytes），设置后只接受签名正确的上报
+    """
+    if secret is not None:
+        signature, _, data = data.rstrip(b"\n").partition(b" ")
+        if not hmac.compare_digest(signature, _sign(data, secret)):
+            raise ValueError("上报签名不正确")
+    try:
+        report = json.loads(data)
+        if not isinstance(report, dict) or not isinstance(report["n"], str):
+            raise ValueError("上报格式不正确")
+        if not isinstance(report.get("r"), (str, int, type(None))):
+            raise ValueError("运行标识格式不正确")
+        report["s"] = int(report["s"])
+        report["i"] = float(report["i"])
+        if not 0 < report["i"] < math.inf:
+            raise ValueError("上报间隔不正确")
+        gauges = report.get("g")
+        if gauges is not None and not (isinstance(gauges, dict) and all(
+                isinstance(value, (int, float)) and not isinstance(value, bool) for value in gauges.values())):
+            raise ValueError("指标格式不正确")
+        alerts = report.get("a") or []
+        if not isinstance(alerts, list):
+            raise ValueError("告警格式不正确")
+        report["a"] = [alert for alert in alerts if _valid_alert(alert)]
+        report["invalid_alerts"] = len(alerts) - len(report["a"])
+    except (KeyError, TypeError, OverflowError, UnicodeDecodeError) as e:
+        raise ValueError(f"上报格式不正确: {e}")
+    return report
+
+class FleetAgent:
+    """
+    向集群汇总端上报心跳、指标和告警
+    - 每 interval 秒上报一次，只携带变化的仪表值，每 full_every 次上报一次全量，
+      汇总端重启或 UDP 丢包后最终会恢复一致
+    - 告警立即上报；UDP 方式下随后续 alert_repeats 次心跳重复发送，汇总端按告警编号去重
+    """
+    def __init__(self, address, node=None, transport="udp", interval=10, full_every=30,
+                 alert_repeats=3, timeout=5, max_pending=100, secret=None):
+        self.address = address
+        self.secret = secret
+        self.node = node or socket.gethostname()
+        self.transport = transport
+        self.interval = interval
+        self.full_every = full_every
+        self.alert_repeats = alert_repeats
+        self.timeout = timeout
+        self.max_pending = max_pending
+        self.run_id = f"{os.getpid():x}-{int(time.time()):x}"
+
+        self._seq = itertools.count(1)
+        self._alert_ids = itertools.count(1)
+        self._pending = []        # [告警, 剩余发送次数]
+        self._sent_gauges = {}
+        self._reports = 0
+        self._sock = None
+        self._target = None
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stopping = False
+        self._failing = False
+        self._thread = None
+
+    def start(self):
+        self._stopping = False
+        self._thread = threading.Thread(target=self._run, name="fleet-agent", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stopping = True
+        self._wakeup.set()
+        if self._thread is not None:
+            self._thread.join(timeout=2)
+            self._thread = None
+        with self._lock:
+            self._close()
+
+    def _run(self):
+        while not self._stopping:
+            try:
+                self.report()
+                if self._failing:
+                    self._failing = False
+                    _log(f"已恢复向集群汇总端 {self.address[0]}:{self.address[1]} 上报")
+            except OSError as e:
+                if not self._failing:
+                    self._failing = True
+                    _log(f"向集群汇总端上报失败，将在下次心跳时重试: {e}")
+            self._wakeup.wait(self.interval)
+
+    def report(self):
+        """立即上报一次"""
+        with self._lock:
+            self._report()
+
+    def send_alert(self, subject, content, severity):
+        """立即上报一条告警，发送失败时抛出 OSError（TCP 方式下告警保留到下次上报）"""
+        with self._lock:
+            alert = [next(self._alert_ids), severity, subject, content[:MAX_ALERT_CONTENT]]
+            self._pending.append([alert, 1 if self.transport == "tcp" else self.alert_repeats])
+            del self._pending[:-self.max_pending]
+            self._report()
+
+    def _report(self):
+        """调用方需持有锁"""
+        gauges = {series_name(name, key): value for (name, key), value in metrics.gauges().items()}
+        full = self._reports % self.full_every == 0 or (self.transport == "tcp" and self._sock is None)
+        if full:
+            changed = gauges
+        else:
+            changed = {name: value for name, value in gauges.items() if self._sent_gauges.get(name) != value}
+        alerts = [alert for alert, _ in self._pending]
+        data = encode_report(self.node, self.run_id, next(self._seq), self.interval, changed, full, alerts,
+                             self.secret)
+        self._transmit(data)
+        self._reports += 1
+        self._sent_gauges = gauges
+        for item in self._pending:
+            item[1] -= 1
+        self._pending = [item for item in self._pending if item[1] > 0]
+
+    def _transmit(self, data):
+        try:
+            if self.transport == "tcp":
+                if self._sock is None:
+                    self._sock = socket.create_connection(self.address, timeout=self.timeout)
+                self._sock.sendall(data)
+            else:
+                if self._sock is None:
+                    host, port = self.address
+                    family, _, _, _, self._target = socket.getaddrinfo(host, port, type=socket.SOCK_DGRAM)[0]
+                    self._sock = socket.socket(family, socket.SOCK_DGRAM)
+                self._sock.sendto(data, self._target)
+        except OSError:
+            self._close()
+            raise
+
+    def _close(self):
+        if self._sock is not None:
+            self._sock.close()
+            self._sock = None
+
+class FleetChannel:
+    """通知渠道：把告警转发给集群汇总端，由汇总端合并后统一发送"""
+    name = "collector"
+
+    def __init__(self, agent, timeout=5):
+        self.agent = agent
+        self.timeout = timeout
+
+    def send(self, subject, content, severity):
+        self.agent.send_alert(subject, content, severity)
+
+class _Node:
+    """汇总端保存的节点状态"""
+    __slots__ = ("name", "run", "seq", "interval", "last_seen", "address", "gauges", "down",
+                 "alert_ids", "alert_order")
+
+    def __init__(self, name):
+        self.name = name
+        self.run = None
+        self.seq = 0
+        self.interval = 10
+        self.last_seen = 0
+        self.address = None
+        self.gauges = {}
+        self.down = False
+        self.alert_ids = set()
+        self.alert_order = deque()
+
+    def seen_alert(self, alert_id):
+        """记录告警编号，重复上报的告警返回True"""
+        if alert_id in self.alert_ids:
+            return True
+        self.alert_ids.add(alert_id)
+        self.alert_order.append(alert_id)
+        if len(self.alert_order) > 256:
+            self.alert_ids.discard(self.alert_order.popleft())
+        return False
+
+class _NodeLimitReached(Exception):
+    """节点数已达上限且没有可移除的离线节点"""
+
+class _Connection:
+    __slots__ = ("sock", "address", "buffer")
+
+    def __init__(self, sock, address):
+        self.sock = sock
+        self.address = address
+        self.buffer = b""
+
+class FleetCollector:
+    """
+    集群汇总端：接收各节点的心跳、指标和告警，在内存中保存每个节点的最新状态
+    - UDP 和 TCP 长连接在同一个 selectors 事件循环中处理，单线程即可支撑数千个节点
+    - 超过 missed 个上报周期没有心跳的节点判定为离线
+    - 同一类告警在 window 秒内合并为一条通知 notify(subject, content, severity)，
+      同一节点重复上报的告警只计一次，窗口内离线又恢复的节点不再通知
+    - 最多保存 max_nodes 个节点，离线超过 node_ttl 秒的节点被移除；节点数已满时新节点
+      优先挤掉离线最久的节点，没有离线节点时拒绝其上报
+    - 设置 secret 后只接受签名正确的上报，告警内容会被转发到邮件中，公网监听时应当设置
+    """
+    NODE_DOWN = "节点离线"
+    NODE_UP = "节点恢复上线"
+
+    def __init__(self, notify, udp_address=None, tcp_address=None, missed=3, window=30,
+                 sweep_interval=1, max_details=10, max_nodes=MAX_NODES, node_ttl=NODE_TTL, secret=None):
+        self.notify = notify
+        self.udp_address = udp_address
+        self.tcp_address = tcp_address
+        self.missed = missed
+        self.window = window
+        self.sweep_interval = sweep_interval
+        self.max_details = max_details
+        self.max_nodes = max_nodes
+        self.node_ttl = node_ttl
+        self.secret = secret
+        self.nodes = {}
+        self._groups = {}   # (级别, 标题) -> (开始时间, {节点: 详情})
+        self._selector = None
+        self._udp = None
+        self._listener = None
+        self._wakeup = None
+        self._thread = None
+        self._stats = {
+            "messages": 0,
+            "bytes": 0,
+            "invalid": 0,
+            "rejected": 0,
+            "duplicates": 0,
+            "connections": 0,
+            "alerts": 0,
+            "notifications": 0,
+        }
+
+    @property
+    def udp_port(self):
+        return self._udp.getsockname()[1] if self._udp is not None else None
+
+    @property
+    def tcp_port(self):
+        return self._listener.getsockname()[1] if self._listener is not None else None
+
+    def start(self):
+        """打开监听端口并在后台线程中运行事件循环"""
+        self._selector = selectors.DefaultSelector()
+        try:
+            if self.udp_address is not None:
+                self._udp = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+                # 数千个节点的心跳可能同时到达，加大接收缓冲区
+                self._udp.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 4 * 1024 * 1024)
+                self._udp.bind(self.udp_address)
+                self._udp.setblocking(False)
+                self._selector.register(self._udp, selectors.EVENT_READ, "udp")
+            if self.tcp_address is not None:
+                self._listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+                self._listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+                self._listener.bind(self.tcp_address)
+                self._listener.listen(1024)
+                self._listener.setblocking(False)
+                self._selector.register(self._listener, selectors.EVENT_READ, "listen")
+        except OSError:
+            self._close_all()
+            raise
+        self._wakeup = os.pipe()
+        self._selector.register(self._wakeup[0], selectors.EVENT_READ, "wakeup")
+        self._thread = threading.Thread(target=self._run, name="fleet-collector", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        if self._thread is None:
+            return
+        # 事件循环因出错退出时已关闭唤醒管道
+        if self._thread.is_alive() and self._wakeup is not None:
+            try:
+                os.write(self._wakeup[1], b"x")
+            except OSError:
+                pass
+            self._thread.join(timeout=2)
+        self._thread = None
+
+    def _run(self):
+        next_sweep = time.monotonic() + self.sweep_interval
+        try:
+            while True:
+                for key, _ in self._selector.select(max(next_sweep - time.monotonic(), 0)):
+                    kind = key.data
+                    if kind == "wakeup":
+                        return
+                    if kind == "udp":
+                        self._read_datagrams()
+                    elif kind == "listen":
+                        self._accept()
+                    else:
+                        self._read_stream(kind)
+                now = time.monotonic()
+                if now >= next_sweep:
+                    self._sweep(now)
+                    next_sweep = now + self.sweep_interval
+        except Exception as e:
+            _log(f"集群汇总端已停止: {e}")
+        finally:
+            self._close_all()
+
+    def _close_all(self):
+        if self._selector is not None:
+            for key in list(self._selector.get_map().values()):
+                if isinstance(key.data, _Connection):
+                    key.data.sock.close()
+            self._selector.close()
+        for sock in (self._udp, self._listener):
+            if sock is not None:
+                sock.close()
+        if self._wakeup is not None:
+            for fd in self._wakeup:
+                os.close(fd)
+            self._wakeup = None
+
+    def _read_datagrams(self):
+        # 一次唤醒尽量读空接收缓冲区，减少 select 调用
+        for _ in range(1024):
+            try:
+                data, address = self._udp.recvfrom(65535)
+            except BlockingIOError:
+                return
+            self._handle(data, address)
+
+    def _accept(self):
+        for _ in range(1024):
+            try:
+                sock, address = self._listener.accept()
+            except BlockingIOError:
+                return
+            sock.setblocking(False)
+            self._selector.register(sock, selectors.EVENT_READ, _Connection(sock, address))
+            self._stats["connections"] += 1
+
+    def _read_stream(self, conn):
+        try:
+            data = conn.sock.recv(65536)
+        except BlockingIOError:
+            return
+        except OSError:
+            data = b""
+        if not data:
+            self._drop(conn)
+            return
+        lines = (conn.buffer + data).split(b"\n")
+        conn.buffer = lines.pop()
+        if len(conn.buffer) > MAX_STREAM_BUFFER:
+            self._drop(conn)
+            return
+        for line in lines:
+            if line:
+                self._handle(line, conn.address)
+
+    def _drop(self, conn):
+        self._selector.unregister(conn.sock)
+        conn.sock.close()
+        self._stats["connections"] -= 1
+
+    def _handle(self, data, address):
+        self._stats["messages"] += 1
+        self._stats["bytes"] += len(data)
+        try:
+            report = decode_report(data, self.secret)
+            self._apply(report, address)
+        except _NodeLimitReached:
+            self._stats["rejected"] += 1
+        except Exception:
+            # 单条异常的上报只计数，不能让事件循环退出
+            self._stats["invalid"] += 1
+
+    def _apply(self, report, address):
+        self._stats["invalid"] += report["invalid_alerts"]
+        now = time.monotonic()
+        name = report["n"]
+        node = self.nodes.get(name)
+        if node is None:
+            if len(self.nodes) >= self.max_nodes:
+                self._evict_node()
+            node = self.nodes[name] = _Node(name)
+        if report.get("r") != node.run:
+            # 节点重启：序号和告警编号重新开始
+            node.run = report.get("r")
+            node.seq = 0
+            node.gauges = {}
+            node.alert_ids.clear()
+            node.alert_order.clear()
+        node.last_seen = now
+        node.address = address[0]
+        node.interval = report["i"]
+        if report["s"] <= node.seq:
+            self._stats["duplicates"] += 1
+        else:
+            node.seq = report["s"]
+            gauges = report.get("g") or {}
+            if report.get("f"):
+                node.gauges = dict(gauges)
+            else:
+                node.gauges.update(gauges)
+        for alert_id, severity, subject, content in report["a"]:
+            if node.seen_alert(alert_id):
+                continue
+            self._stats["alerts"] += 1
+            self._add_event(severity, subject, name, content, now)
+        if node.down:
+            node.down = False
+            self._node_recovered(node, now)
+
+    def _evict_node(self):
+        """节点数已满时移除离线最久的节点，没有离线节点时抛出 _NodeLimitReached"""
+        down = [node for node in self.nodes.values() if node.down]
+        if not down:
+            raise _NodeLimitReached()
+        del self.nodes[min(down, key=lambda node: node.last_seen).name]
+
+    def _node_recovered(self, node, now):
+        group = self._groups.get((SEVERITY_CRITICAL, self.NODE_DOWN))
+        if group is not None and node.name in group[1]:
+            # 离线通知还未发出，节点已经恢复，两条通知都不必发送
+            del group[1][node.name]
+            return
+        self._add_event(SEVERITY_INFO, self.NODE_UP, node.name, f"节点 {node.name}（{node.address}）已恢复上报", now)
+
+    def _add_event(self, severity, title, node_name, detail, now):
+        group = self._groups.get((severity, title))
+        if group is None:
+            group = self._groups[(severity, title)] = (now, {})
+        group[1].setdefault(node_name, detail)
+
+    def _sweep(self, now):
+        """检查离线节点，发出到期的合并通知"""
+        down = 0
+        for node in list(self.nodes.values()):
+            if node.down and now - node.last_seen > self.node_ttl:
+                del self.nodes[node.name]
+                continue
+            if not node.down and now - node.last_seen > self.missed * node.interval:
+                node.down = True
+                silent = round(now - node.last_seen)
+                self._add_event(SEVERITY_CRITICAL, self.NODE_DOWN, node.name,
+                                f"节点 {node.name}（{node.address}）已 {silent} 秒没有心跳", now)
+            down += node.down
+        metrics.set("xiaou_fleet_nodes", len(self.nodes) - down, state="up")
+        metrics.set("xiaou_fleet_nodes", down, state="down")
+
+        for key in [key for key, (started, _) in self._groups.items() if now - started >= self.window]:
+            _, details = self._groups.pop(key)
+            if details:
+                self._emit(key[0], key[1], details)
+
+    def _emit(self, severity, title, details):
+        names = list(details)
+        subject = f"{title}（{names[0]}）" if len(names) == 1 else f"{title}（{len(names)}个节点）"
+        sections = [f"[{name}]\n{details[name]}" for name in names[:self.max_details]]
+        if len(names) > self.max_details:
+            sections.append(f"其余 {len(names) - self.max_details} 个节点: {', '.join(names[self.max_details:])}")
+        self._stats["notifications"] += 1
+        try:
+            self.notify(subject, "\n\n".join(sections), severity)
+        except Exception as e:
+            _log(f"集群告警发送出错: {e}")
+
+    def get_stats(self):
+        """获取汇总端统计信息"""
+        stats = dict(self._stats)
+        nodes = list(self.nodes.values())
+        stats["nodes"] = len(nodes)
+        stats["down"] = sum(1 for node in nodes if node.down)
+        return stats
+
+    def format_stats(self):
+        stats = self.get_stats()
+        return (f"节点 {stats['nodes']} 个 (离线 {stats['down']}), 连接 {stats['connections']}, "
+                f"已接收 {stats['messages']} 条上报, 无效 {stats['invalid']}, 拒绝 {stats['rejected']}, "
+                f"重复 {stats['duplicates']}, "
+                f"告警 {stats['alerts']} 条合并为 {stats['notifications']} 条通知")
+
+def _secret():
+    """读取 XIAOU_COLLECTOR_SECRET 共享密钥，未设置时返回None"""
+    secret = os.environ.get("XIAOU_COLLECTOR_SECRET")
+    return secret.encode("utf-8") if secret else None
+
+def build_fleet_collector(notify):
+    """
+    根据 XIAOU_COLLECTOR_LISTEN（如 0.0.0.0:9470）创建集群汇总端，同一端口同时监听 UDP 和 TCP
+    XIAOU_COLLECTOR_WINDOW: 告警合并窗口（秒）；XIAOU_COLLECTOR_MAX_NODES: 最多保存的节点数；
+    XIAOU_COLLECTOR_SECRET: 共享密钥，设置后只接受签名正确的上报；未设置监听地址时返回None
+    """
+    spec = os.environ.get("XIAOU_COLLECTOR_LISTEN")
+    if not spec:
+        return None
+    address = parse_address(spec)
+    secret = _secret()
+    if secret is None and address[0] not in ("127.0.0.1", "localhost"):
+        _log(f"集群汇总端监听 {address[0]}:{address[1]} 但未设置 XIAOU_COLLECTOR_SECRET，将接受任何来源的上报")
+    return FleetCollector(notify, udp_address=address, tcp_address=address,
+                          window=float(os.environ.get("XIAOU_COLLECTOR_WINDOW", 30)),
+                          max_nodes=int(os.environ.get("XIAOU_COLLECTOR_MAX_NODES", MAX_NODES)),
+                          secret=secret)
+
+_agent = None
+_agent_lock = threading.Lock()
+
+def get_agent():
+    """
+    获取向汇总端上报的全局代理，首次调用时根据环境变量创建，未设置 XIAOU_COLLECTOR 时返回None
+    XIAOU_COLLECTOR（host:port）/ XIAOU_COLLECTOR_TRANSPORT（udp/tcp）/ XIAOU_NODE_NAME / XIAOU_REPORT_INTERVAL /
+    XIAOU_COLLECTOR_SECRET
+    """
+    global _agent
+    with _agent_lock:
+        if _agent is None and os.environ.get("XIAOU_COLLECTOR"):
+            _agent = FleetAgent(
+                parse_address(os.environ["XIAOU_COLLECTOR"]),
+                node=os.environ.get("XIAOU_NODE_NAME") or None,
+                transport=os.environ.get("XIAOU_COLLECTOR_TRANSPORT", "udp").strip().lower(),
+                interval=float(os.environ.get("XIAOU_REPORT_INTERVAL", 10)),
+                secret=_secret(),
+            )
+        return _agent
+
+if __name__ == "__main__":
+    # 独立运行汇总端，告警直接输出到标准输出（供 fleet_loadgen.py 使用）
+    import argparse
+    import sys
+    parser = argparse.ArgumentParser(description="小悠集群汇总端")
+    parser.add_argument("--listen", default=f"127.0.0.1:{DEFAULT_PORT}")
+    parser.add_argument("--window", type=float, default=30)
+    parser.add_argument("--missed", type=int, default=3)
+    parser.add_argument("--stats", type=float, default=5, help="统计信息输出间隔（秒）")
+    args = parser.parse_args()
+
+    def output(line):
+        # 告警和统计来自不同线程，整行写入避免输出交错
+        sys.stdout.write(line + "\n")
+        sys.stdout.flush()
+
+    def print_alert(subject, content, severity):
+        output(f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] 集群告警 [{severity}] {subject}")
+
+    address = parse_address(args.listen)
+    collector = FleetCollector(print_alert, udp_address=address, tcp_address=address,
+                               missed=args.missed, window=args.window, secret=_secret())
+    collector.start()
+    try:
+        while True:
+            time.sleep(args.stats)
+            output("STATS " + json.dumps(collector.get_stats()))
+    except KeyboardInterrupt:
+        collector.stop()
@@ -0,0 +1,185 @@
+#!/usr/bin/env python3
+"""
+集群汇总端压力测试
+在一台机器上模拟大量节点按固定间隔上报，汇总端运行在独立进程中，统计其CPU占用、收包率和离线检测结果：
+  python fleet_loadgen.py --agents 5000 --interval 10 --transport udp
+  python fleet_loadgen.py --agents 2000 --transport tcp --kill 0.02
+"""
+import argparse
+import heapq
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import threading
+import time
+
+import psutil
+
+import fleet
+
+PROBE_HOSTS = ("223.5.5.5", "114.114.114.114", "1.1.1.1", "8.8.8.8")
+
+def _raise_fd_limit(needed):
+    """TCP 模式下每个模拟节点占用一个连接，按需提高文件描述符上限"""
+    try:
+        import resource
+    except ImportError:
+        return
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if soft < needed:
+        resource.setrlimit(resource.RLIMIT_NOFILE, (min(needed, hard), hard))
+
+def _free_port():
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+class _SimulatedAgent:
+    """模拟节点，上报的内容与 FleetAgent 相同：心跳、变化的指标和偶尔的告警"""
+    __slots__ = ("name", "run", "seq", "sock", "alive", "alert_id", "rng")
+
+    def __init__(self, index, seed):
+        self.name = f"node-{index:05d}"
+        self.run = f"load-{index:x}"
+        self.seq = 0
+        self.sock = None
+        self.alive = True
+        self.alert_id = 0
+        self.rng = random.Random(seed + index)
+
+    def report(self, interval, full_every, alert_rate):
+        self.seq += 1
+        full = self.seq % full_every == 1
+        gauges = {f'xiaou_probe_rtt_seconds{{host="{host}"}}': round(self.rng.uniform(0.005, 0.05), 4)
+                  for host in PROBE_HOSTS}
+        if full:
+            gauges['xiaou_network_up'] = 1
+            gauges['xiaou_disk_total_bytes{mount="/"}'] = 500 * 1024 ** 3
+            gauges['xiaou_disk_used_bytes{mount="/"}'] = 420 * 1024 ** 3
+            gauges['xiaou_disk_free_bytes{mount="/"}'] = 80 * 1024 ** 3
+            gauges['xiaou_notification_queue_depth'] = 0
+        alerts = None
+        if self.rng.random() < alert_rate:
+            self.alert_id += 1
+            alerts = [[self.alert_id, "warning", "小悠提醒你空间不够了！",
+                       f"挂载点 / 剩余空间不足（{self.name}）"]]
+        return fleet.encode_report(self.name, self.run, self.seq, interval, gauges, full, alerts)
+
+class _CollectorProcess:
+    """在子进程中运行汇总端，读取其输出的统计信息和告警"""
+    def __init__(self, port, window, missed):
+        script = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fleet.py")
+        self.process = subprocess.Popen(
+            [sys.executable, script, "--listen", f"127.0.0.1:{port}", "--window", str(window),
+             "--missed", str(missed), "--stats", "1"],
+            stdout=subprocess.PIPE, text=True,
+        )
+        self.stats = None
+        self.alerts = []
+        self._reader = threading.Thread(target=self._read, daemon=True)
+        self._reader.start()
+
+    def _read(self):
+        for line in self.process.stdout:
+            if line.startswith("STATS "):
+                self.stats = json.loads(line[len("STATS "):])
+            elif "集群告警" in line:
+                self.alerts.append(line.strip())
+
+    def cpu_seconds(self):
+        times = psutil.Process(self.process.pid).cpu_times()
+        return times.user + times.system
+
+    def wait_ready(self, timeout=10):
+        deadline = time.monotonic() + timeout
+        while self.stats is None:
+            if time.monotonic() > deadline or self.process.poll() is not None:
+                raise RuntimeError("汇总端未能启动")
+            time.sleep(0.05)
+
+    def stop(self):
+        self.process.terminate()
+        self.process.wait(timeout=5)
+
+def run(args):
+    port = _free_port()
+    collector = _CollectorProcess(port, args.window, args.missed)
+    try:
+        collector.wait_ready()
+        agents = [_SimulatedAgent(i, args.seed) for i in range(args.agents)]
+        address = ("127.0.0.1", port)
+        udp = None
+        if args.transport == "tcp":
+            _raise_fd_limit(args.agents + 256)
+            for agent in agents:
+                agent.sock = socket.create_connection(address)
+        else:
+            udp = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+
+        rng = random.Random(args.seed)
+        start = time.monotonic()
+        # 各节点的上报时间在一个周期内随机分布
+        schedule = [(start + rng.uniform(0, args.interval), i) for i in range(len(agents))]
+        heapq.heapify(schedule)
+        killed = set(rng.sample(range(len(agents)), int(len(agents) * args.kill)))
+        kill_at = start + args.kill_after
+        cpu_started = collector.cpu_seconds()
+        sent = sent_bytes = 0
+
+        end = start + args.duration
+        while schedule and schedule[0][0] < end:
+            due, index = heapq.heappop(schedule)
+            delay = due - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            if due >= kill_at and index in killed:
+                continue  # 模拟节点宕机，不再上报
+            data = agents[index].report(args.interval, 30, args.alert_rate)
+            if udp is not None:
+                udp.sendto(data, address)
+            else:
+                agents[index].sock.sendall(data)
+            sent += 1
+            sent_bytes += len(data)
+            heapq.heappush(schedule, (due + args.interval, index))
+
+        remaining = end - time.monotonic()
+        if remaining > 0:
+            time.sleep(remaining)
+        elapsed = time.monotonic() - start
+        cpu = collector.cpu_seconds() - cpu_started
+        time.sleep(1.5)  # 等待下一次统计输出
+        stats = collector.stats
+    finally:
+        collector.stop()
+
+    print(f"模拟节点: {args.agents} ({args.transport}), 上报间隔 {args.interval}秒, 持续 {round(elapsed, 1)}秒")
+    print(f"已发送: {sent} 条上报 ({round(sent / elapsed, 1)}/s, 平均 {round(sent_bytes / max(sent, 1))} 字节)")
+    print(f"汇总端接收: {stats['messages']} 条 (丢失 {max(sent - stats['messages'], 0)}), "
+          f"无效 {stats['invalid']}, 节点 {stats['nodes']}")
+    print(f"汇总端CPU: {round(cpu, 2)}秒, 占单核 {round(cpu / elapsed * 100, 1)}%")
+    print(f"离线检测: 停止上报 {len(killed)} 个节点, 汇总端判定离线 {stats['down']} 个")
+    print(f"告警: 上报 {stats['alerts']} 条, 合并为 {stats['notifications']} 条通知")
+    for line in collector.alerts:
+        print(f"  {line}")
+    return stats
+
+def main():
+    parser = argparse.ArgumentParser(description="小悠集群汇总端压力测试")
+    parser.add_argument("--agents", type=int, default=5000)
+    parser.add_argument("--interval", type=float, default=10)
+    parser.add_argument("--transport", choices=("udp", "tcp"), default="udp")
+    parser.add_argument("--duration", type=float, default=75)
+    parser.add_argument("--kill", type=float, default=0.01, help="中途停止上报的节点比例")
+    parser.add_argument("--kill-after", type=float, default=15, help="开始后多少秒停止这些节点")
+    parser.add_argument("--alert-rate", type=float, default=0.0005, help="每次上报附带告警的概率")
+    parser.add_argument("--window", type=float, default=5, help="汇总端告警合并窗口（秒）")
+    parser.add_argument("--missed", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=1)
+    run(parser.parse_args())
+
+if __name__ == "__main__":
+    main()
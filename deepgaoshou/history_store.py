@@ -0,0 +1,293 @@
+import bisect
+import mmap
+import os
+import re
+import struct
+import threading
+import time
+from datetime import datetime
+from urllib.parse import quote
+
+try:
+    import numpy
+except ImportError:  # numpy 为可选依赖
+    numpy = None
+
+def _log(message):
+    """统一的日志输出函数"""
+    timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    print(f"[{timestamp}] {message}", flush=True)
+
+_MAGIC = b"XUHIST01"
+_HEADER = struct.Struct("<8sIIQQ")   # magic, 列数, 容量, 下一个写入位置, 已写入数量
+_HEADER_SIZE = 64                   # 头部按64字节对齐，列数据按8字节对齐
+
+RAW_COLUMNS = ("timestamp", "value")
+ROLLUP_COLUMNS = ("timestamp", "mean", "min", "max", "count")
+
+class RingFile:
+    """
+    基于内存映射文件的定长环形缓冲区
+    每一列是连续的 float64 数组，文件大小固定，写入只是内存拷贝
+    """
+    def __init__(self, path, columns, capacity):
+        self.path = path
+        self.columns = columns
+        self.capacity = capacity
+        size = _HEADER_SIZE + len(columns) * capacity * 8
+
+        fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            if os.fstat(fd).st_size != size:
+                os.ftruncate(fd, 0)
+                os.ftruncate(fd, size)
+            self._mmap = mmap.mmap(fd, size)
+        finally:
+            os.close(fd)
+
+        magic, ncols, cap, head, count = _HEADER.unpack_from(self._mmap, 0)
+        if magic != _MAGIC or ncols != len(columns) or cap != capacity:
+            # 新文件或格式不匹配，重新初始化
+            head, count = 0, 0
+            _HEADER.pack_into(self._mmap, 0, _MAGIC, len(columns), capacity, 0, 0)
+        self.head = head
+        self.count = count
+
+        data = memoryview(self._mmap)[_HEADER_SIZE:]
+        self._cols = [data[i * capacity * 8:(i + 1) * capacity * 8].cast("d") for i in range(len(columns))]
+
+    def append(self, values):
+        """追加一条记录，写满后覆盖最旧的记录"""
+        head = self.head
+        for col, value in zip(self._cols, values):
+            col[head] = value
+        self.head = (head + 1) % self.capacity
+        if self.count < self.capacity:
+            self.count += 1
+        _HEADER.pack_into(self._mmap, 0, _MAGIC, len(self.columns), self.capacity, self.head, self.count)
+
+    def segments(self):
+        """
+        按时间顺序返回数据段（环形缓冲区回绕时为两段）
+        每段为 {列名: memoryview}，直接引用映射内存，不复制数据
+        """
+        if self.count < self.capacity:
+            ranges = [(0, self.count)]
+        else:
+            ranges = [(self.head, self.capacity), (0, self.head)]
+        return [
+            {name: col[start:end] for name, col in zip(self.columns, self._cols)}
+            for start, end in ranges if end > start
+        ]
+
+    def query(self, start=None, end=None):
+        """返回时间戳在 [start, end) 内的数据段"""
+        result = []
+        for segment in self.segments():
+            timestamps = segment["timestamp"]
+            lo = 0 if start is None else bisect.bisect_left(timestamps, start)
+            hi = len(timestamps) if end is None else bisect.bisect_left(timestamps, end)
+            if hi > lo:
+                result.append({name: view[lo:hi] for name, view in segment.items()})
+        return result
+
+    def flush(self):
+        self._mmap.flush()
+
+    def close(self):
+        self._cols = []
+        try:
+            self._mmap.close()
+        except BufferError:
+            # 仍有查询结果引用映射内存，交由垃圾回收关闭
+            pass
+
+class _Rollup:
+    """当前时间桶的聚合值"""
+    def __init__(self, bucket):
+        self.bucket = bucket
+        self.total = 0.0
+        self.minimum = float("inf")
+        self.maximum = float("-inf")
+        self.count = 0
+
+    def add(self, value):
+        self.total += value
+        self.count += 1
+        if value < self.minimum:
+            self.minimum = value
+        if value > self.maximum:
+            self.maximum = value
+
+    def record(self, width):
+        return (self.bucket * width, self.total / self.count, self.minimum, self.maximum, self.count)
+
+class Series:
+    """
+    单个指标的历史数据
+    原始数据写入 raw 环形文件，同时在内存中聚合，每满一分钟/一小时写入对应的降采样文件
+    """
+    RESOLUTIONS = {"minute": 60, "hour": 3600}
+
+    def __init__(self, directory, name, raw_capacity, minute_capacity, hour_capacity):
+        self.name = name
+        base = os.path.join(directory, name)
+        self.rings = {
+            "raw": RingFile(f"{base}.raw", RAW_COLUMNS, raw_capacity),
+            "minute": RingFile(f"{base}.minute", ROLLUP_COLUMNS, minute_capacity),
+            "hour": RingFile(f"{base}.hour", ROLLUP_COLUMNS, hour_capacity),
+        }
+        self._rollups = {}
+        self._lock = threading.Lock()
+
+    def append(self, timestamp, value):
+        with self._lock:
+            self.rings["raw"].append((timestamp, value))
+            for resolution, width in self.RESOLUTIONS.items():
+                bucket = int(timestamp // width)
+                rollup = self._rollups.get(resolution)
+                if rollup is not None and rollup.bucket != bucket:
+                    self.rings[resolution].append(rollup.record(width))
+                    rollup = None
+                if rollup is None:
+                    rollup = self._rollups[resolution] = _Rollup(bucket)
+                rollup.add(value)
+
+    def query(self, start=None, end=None, resolution="raw"):
+        with self._lock:
+            return self.rings[resolution].query(start, end)
+
+    def flush(self):
+        with self._lock:
+            for ring in self.rings.values():
+                ring.flush()
+
+    def close(self):
+        with self._lock:
+            for ring in self.rings.values():
+                ring.close()
+
+def _series_filename(name):
+    """
+    把指标名转换为安全的文件名，如 disk./mnt/data.free_gb -> disk.%2Fmnt%2Fdata.free_gb
+    采用百分号编码（% 本身也被编码），不同的指标名不会映射到同一个文件
+    """
+    return quote(name, safe="")
+
+def _legacy_series_filename(name):
+    """旧版本的文件名（把特殊字符替换为下划线，可能冲突），用于迁移已有数据"""
+    return re.sub(r"[^0-9A-Za-z._-]", "_", name)
+
+_SUFFIXES = (".raw", ".minute", ".hour")
+
+class HistoryStore:
+    """
+    嵌入式时间序列存储
+    每个指标一组定长的内存映射环形文件（原始、分钟、小时，默认每个指标约 1MB）；
+    指标数（包括目录中已有的）最多 max_series 个，超出后不再记录新指标，磁盘占用和映射数量都有上限
+    """
+    def __init__(self, directory, raw_capacity=20000, minute_capacity=10080, hour_capacity=8760,
+                 max_series=256):
+        self.directory = directory
+        self.raw_capacity = raw_capacity
+        self.minute_capacity = minute_capacity
+        self.hour_capacity = hour_capacity
+        self.max_series = max_series
+        self._series = {}
+        self._lock = threading.Lock()
+        self._limit_logged = False
+        os.makedirs(directory, exist_ok=True)
+        # 目录中已有的指标文件同样计入上限
+        self._files = {entry[:-len(_SUFFIXES[0])] for entry in os.listdir(directory) if entry.endswith(_SUFFIXES[0])}
+
+    def _get_series(self, name):
+        """获取指标，新指标超出 max_series 时返回None"""
+        series = self._series.get(name)
+        if series is None:
+            with self._lock:
+                series = self._series.get(name)
+                if series is None:
+                    self._migrate(name)
+                    filename = _series_filename(name)
+                    if filename not in self._files and len(self._files) >= self.max_series:
+                        if not self._limit_logged:
+                            self._limit_logged = True
+                            _log(f"历史数据指标数已达上限 {self.max_series}，不再记录新指标（如 {name}）")
+                        return None
+                    series = Series(self.directory, filename, self.raw_capacity,
+                                    self.minute_capacity, self.hour_capacity)
+                    self._files.add(filename)
+                    self._series[name] = series
+        return series
+
+    def _migrate(self, name):
+        """把旧文件名下的数据改为新文件名（新文件不存在时）"""
+        old = os.path.join(self.directory, _legacy_series_filename(name))
+        new = os.path.join(self.directory, _series_filename(name))
+        if old == new or os.path.exists(new + _SUFFIXES[0]):
+            return
+        for suffix in _SUFFIXES:
+            if os.path.exists(old + suffix):
+                os.replace(old + suffix, new + suffix)
+        if os.path.exists(new + _SUFFIXES[0]):
+            self._files.discard(_legacy_series_filename(name))
+            self._files.add(_series_filename(name))
+
+    def _exists(self, name):
+        """指标是否已有数据文件（包括旧文件名）"""
+        return any(os.path.exists(os.path.join(self.directory, filename) + _SUFFIXES[0])
+                   for filename in (_series_filename(name), _legacy_series_filename(name)))
+
+    def record(self, name, value, timestamp=None):
+        """记录一个数据点（timestamp 为 Unix 时间戳，默认当前时间）"""
+        if timestamp is None:
+            timestamp = time.time()
+        series = self._get_series(name)
+        if series is not None:
+            series.append(timestamp, float(value))
+
+    def query(self, name, start=None, end=None, resolution="raw"):
+        """
+        查询时间范围 [start, end) 内的数据
+        resolution: raw / minute / hour
+        返回: 数据段列表，每段为 {列名: memoryview}（不复制数据，环形回绕时为两段），
+              没有记录过的指标返回空列表，不会创建文件
+        """
+        if name not in self._series and not self._exists(name):
+            return []
+        series = self._get_series(name)
+        return series.query(start, end, resolution) if series is not None else []
+
+    def query_numpy(self, name, start=None, end=None, resolution="raw"):
+        """与 query 相同，但每列为直接引用映射内存的 numpy 数组"""
+        if numpy is None:
+            raise RuntimeError("需要安装 numpy 才能使用 query_numpy")
+        return [
+            {column: numpy.frombuffer(view, dtype=numpy.float64) for column, view in segment.items()}
+            for segment in self.query(name, start, end, resolution)
+        ]
+
+    def series_names(self):
+        with self._lock:
+            return list(self._series)
+
+    def flush(self):
+        """把映射内存同步到磁盘（在后台任务中调用，不影响监控任务）"""
+        for series in list(self._series.values()):
+            series.flush()
+
+    def close(self):
+        with self._lock:
+            for series in self._series.values():
+                series.close()
+            self._series.clear()
+
+def open_history_store():
+    """
+    根据 XIAOU_HISTORY_DIR 环境变量创建历史数据存储，未设置时返回None
+    XIAOU_HISTORY_MAX_SERIES: 最多保存的指标数
+    """
+    directory = os.environ.get("XIAOU_HISTORY_DIR")
+    if not directory:
+        return None
+    return HistoryStore(directory, max_series=int(os.environ.get("XIAOU_HISTORY_MAX_SERIES", 256)))
@@ -0,0 +1,167 @@
+import bisect
+import os
+import threading
+import time
+
+# 桶上界（秒）：10微秒到100秒，每个数量级5个桶
+BUCKET_BOUNDS = tuple(round(10 ** (exponent / 5), 9) for exponent in range(-25, 11))
+
+_enabled = os.environ.get("XIAOU_INSTRUMENTATION", "1") != "0"
+_local = threading.local()
+_shards = []
+_shards_lock = threading.Lock()
+
+class LatencyHistogram:
+    """
+    固定分桶的延迟直方图，桶边界对所有实例相同，因此可以直接合并
+    最后一个桶统计超过最大边界的观测值
+    """
+    __slots__ = ("counts", "count", "total", "minimum", "maximum")
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKET_BOUNDS) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.minimum = float("inf")
+        self.maximum = 0.0
+
+    def observe(self, seconds):
+        self.counts[bisect.bisect_left(BUCKET_BOUNDS, seconds)] += 1
+        self.count += 1
+        self.total += seconds
+        if seconds < self.minimum:
+            self.minimum = seconds
+        if seconds > self.maximum:
+            self.maximum = seconds
+
+    def merge(self, other):
+        for i, count in enumerate(other.counts):
+            self.counts[i] += count
+        self.count += other.count
+        self.total += other.total
+        self.minimum = min(self.minimum, other.minimum)
+        self.maximum = max(self.maximum, other.maximum)
+        return self
+
+    def copy(self):
+        return LatencyHistogram().merge(self)
+
+    def percentile(self, q):
+        """估算分位数（秒），在桶内按线性插值，结果限制在实际观测到的最小/最大值之间"""
+        if self.count == 0:
+            return None
+        rank = q * self.count
+        cumulative = 0
+        for i, count in enumerate(self.counts):
+            if count and cumulative + count >= rank:
+                lower = BUCKET_BOUNDS[i - 1] if i > 0 else 0.0
+                upper = BUCKET_BOUNDS[i] if i < len(BUCKET_BOUNDS) else self.maximum
+                value = lower + (upper - lower) * (rank - cumulative) / count
+                return min(max(value, self.minimum), self.maximum)
+            cumulative += count
+        return self.maximum
+
+    def cumulative_buckets(self):
+        """返回 [(上界, 累计计数), ...]，最后一项上界为 +Inf"""
+        result = []
+        cumulative = 0
+        for bound, count in zip(BUCKET_BOUNDS + (float("inf"),), self.counts):
+            cumulative += count
+            result.append((bound, cumulative))
+        return result
+
+class _Timer:
+    __slots__ = ("key", "start")
+
+    def __init__(self, key):
+        self.key = key
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        _observe_key(self.key, time.perf_counter() - self.start)
+        return False
+
+class _NullTimer:
+    """禁用统计时使用的空计时器"""
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+_NULL_TIMER = _NullTimer()
+
+def configure(enabled=None):
+    """启用或禁用统计，enabled 为None时读取 XIAOU_INSTRUMENTATION 环境变量"""
+    global _enabled
+    if enabled is None:
+        enabled = os.environ.get("XIAOU_INSTRUMENTATION", "1") != "0"
+    _enabled = enabled
+
+def is_enabled():
+    return _enabled
+
+def _shard():
+    shard = getattr(_local, "shard", None)
+    if shard is None:
+        shard = _local.shard = {}
+        with _shards_lock:
+            _shards.append(shard)
+    return shard
+
+def _observe_key(key, seconds):
+    shard = _shard()
+    histogram = shard.get(key)
+    if histogram is None:
+        histogram = shard[key] = LatencyHistogram()
+    histogram.observe(seconds)
+
+def observe(name, seconds, **labels):
+    """记录一次耗时（秒），禁用时直接返回"""
+    if not _enabled:
+        return
+    _observe_key((name, tuple(sorted(labels.items()))), seconds)
+
+def timer(name, **labels):
+    """
+    返回计时上下文，用法: with timer("smtp_phase", phase="login"): ...
+    基于单调时钟，禁用时返回空计时器
+    """
+    if not _enabled:
+        return _NULL_TIMER
+    return _Timer((name, tuple(sorted(labels.items()))))
+
+def snapshot():
+    """合并所有线程的直方图，返回 {(名称, 标签): LatencyHistogram}"""
+    merged = {}
+    with _shards_lock:
+        shards = list(_shards)
+    for shard in shards:
+        for key, histogram in list(shard.items()):
+            if key in merged:
+                merged[key].merge(histogram)
+            else:
+                merged[key] = histogram.copy()
+    return merged
+
+def _format_ms(seconds):
+    return f"{round(seconds * 1000, 2)}ms"
+
+def format_summary():
+    """格式化各直方图的分位数摘要，每个直方图一行"""
+    lines = []
+    for (name, labels), histogram in sorted(snapshot().items()):
+        label_text = ",".join(f"{key}={value}" for key, value in labels)
+        title = f"{name}[{label_text}]" if label_text else name
+        lines.append(
+            f"{title}: p50={_format_ms(histogram.percentile(0.5))} "
+            f"p90={_format_ms(histogram.percentile(0.9))} "
+            f"p99={_format_ms(histogram.percentile(0.99))} "
+            f"max={_format_ms(histogram.maximum)} n={histogram.count}"
+        )
+    return lines
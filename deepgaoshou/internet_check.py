@@ -1,117 +1,657 @@
-import subprocess
 import platform
 import time
+import os
+import socket
+import struct
+import errno
+import itertools
+import selectors
+import threading
+from collections import namedtuple
+import instrumentation
+from lazy_import import LazyModule
 
-def check_internet_connection(hosts=None, timeout=5):
+subprocess = LazyModule("subprocess")  # 只有退回到 ping 命令时才需要
+
+# 单个host的探测结果，rtt_us 为微秒级往返时间（失败时为 None；被对冲超过的探测为取消前已等待的时间）
+ProbeResult = namedtuple("ProbeResult", ["host", "ok", "rtt_us", "error"])
+
+_TIMEOUT_ERROR = "超时"
+_CANCELLED_ERROR = "已取消"
+_SLOW_ERROR = "响应慢"
+
+# 默认的备选host列表，可通过 XIAOU_PROBE_HOSTS 环境变量覆盖
+DEFAULT_HOSTS = (
+    "223.5.5.5",         # 阿里云DNS
+    "114.114.114.114",   # 114DNS
+    "1.1.1.1",           # Cloudflare DNS
+    "211.141.85.68",     # 移动DNS
+    "211.141.90.68",     # 移动备选DNS
+    "8.8.8.8",           # Google DNS
+    "208.67.222.222",    # OpenDNS
+)
+
+
+class _SubprocessProbe:
+    """通过 ping 命令执行的单次探测（无可等待的文件描述符，需要轮询）"""
+    events = 0
+
+    def __init__(self, host):
+        self.host = host
+        param = "-n" if platform.system().lower() == "windows" else "-c"
+        self.started_ns = time.perf_counter_ns()
+        self.proc = subprocess.Popen(
+            ["ping", param, "1", host],
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL
+        )
+
+    def fileno(self):
+        return None
+
+    def poll(self):
+        returncode = self.proc.poll()
+        if returncode is None:
+            return None
+        if returncode == 0:
+            return True, None
+        return False, _TIMEOUT_ERROR
+
+    def close(self):
+        if self.proc.poll() is None:
+            try:
+                self.proc.kill()
+                self.proc.wait()
+            except Exception:
+                pass
+
+
+class _IcmpProbe:
+    """基于非特权 ICMP 数据报套接字的单次探测（Linux ping_group_range 允许时可用）"""
+    events = selectors.EVENT_READ
+    _sequence = itertools.count(1)
+
+    def __init__(self, host):
+        self.host = host
+        self.seq = next(self._sequence) & 0xFFFF
+        address = socket.gethostbyname(host)
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM, socket.IPPROTO_ICMP)
+        try:
+            self.sock.setblocking(False)
+            packet = _build_echo_request(self.seq)
+            self.started_ns = time.perf_counter_ns()
+            self.sock.sendto(packet, (address, 0))
+        except Exception:
+            self.sock.close()
+            raise
+
+    def fileno(self):
+        return self.sock.fileno()
+
+    def poll(self):
+        while True:
+            try:
+                data = self.sock.recv(1024)
+            except (BlockingIOError, InterruptedError):
+                return None
+            except OSError as e:
+                return False, e.strerror or str(e)
+            # 内核已按标识符过滤，这里只需确认是对应序号的回显应答
+            if len(data) >= 8 and data[0] == 0:
+                if struct.unpack("!H", data[6:8])[0] == self.seq:
+                    return True, None
+
+    def close(self):
+        self.sock.close()
+
+
+class _TcpProbe:
+    """基于非阻塞 TCP connect 的单次探测，连接被拒绝同样说明主机可达"""
+    events = selectors.EVENT_WRITE
+
+    def __init__(self, host, port):
+        self.host = host
+        address = socket.gethostbyname(host)
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        try:
+            self.sock.setblocking(False)
+            self.started_ns = time.perf_counter_ns()
+            code = self.sock.connect_ex((address, port))
+        except Exception:
+            self.sock.close()
+            raise
+        if code not in (0, errno.EINPROGRESS, errno.EWOULDBLOCK, errno.EALREADY):
+            self.sock.close()
+            raise OSError(code, os.strerror(code))
+
+    def fileno(self):
+        return self.sock.fileno()
+
+    def poll(self):
+        code = self.sock.getsockopt(socket.SOL_SOCKET, socket.SO_ERROR)
+        if code in (0, errno.ECONNREFUSED):
+            return True, None
+        return False, os.strerror(code)
+
+    def close(self):
+        self.sock.close()
+
+
+class SubprocessPingBackend:
+    """调用系统 ping 命令的探测后端（原有实现，作为兜底）"""
+    name = "subprocess"
+    fallback = None
+
+    def start(self, host):
+        return _SubprocessProbe(host)
+
+
+class IcmpDatagramBackend:
+    """进程内 ICMP 探测后端，无需 fork 子进程，也不需要 root 权限"""
+    name = "icmp"
+
+    def __init__(self, fallback=None):
+        self.fallback = fallback
+
+    @staticmethod
+    def available():
+        """内核是否允许当前用户创建 ICMP 数据报套接字"""
+        try:
+            sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM, socket.IPPROTO_ICMP)
+        except (OSError, AttributeError):
+            return False
+        sock.close()
+        return True
+
+    def start(self, host):
+        return _IcmpProbe(host)
+
+
+class TcpConnectBackend:
+    """进程内 TCP 连接探测后端，默认连接 53 端口（DNS）"""
+    name = "tcp"
+
+    def __init__(self, port=53, fallback=None):
+        self.port = port
+        self.fallback = fallback
+
+    def start(self, host):
+        return _TcpProbe(host, self.port)
+
+
+class HostHealth:
+    """单个host的探测统计与熔断状态"""
+    __slots__ = ("rtt_ewma_us", "rtt_dev_us", "failures", "overtaken", "open_count", "open_until")
+
+    def __init__(self):
+        self.rtt_ewma_us = None   # 平滑后的往返时间
+        self.rtt_dev_us = 0.0     # 往返时间的平滑偏差
+        self.failures = 0         # 连续失败次数
+        self.overtaken = 0        # 上次成功以来被对冲超过的次数
+        self.open_count = 0       # 连续熔断次数，决定冷却时间
+        self.open_until = 0.0     # 熔断冷却结束时间（monotonic），0 表示未熔断
+
+
+class HostHealthTracker:
+    """
+    记录各host的探测表现，决定探测顺序
+    - 往返时间按 EWMA 平滑，连续失败次数少、延迟低的host优先探测
+    - 连续失败 failure_threshold 次后熔断，冷却期内不再探测
+    - 冷却期结束后进入半开状态，排在正常host之后试探：成功则恢复，失败则冷却时间加倍
+    """
+    def __init__(self, alpha=0.25, failure_threshold=3, open_seconds=60, max_open_seconds=1800,
+                 default_hedge_delay=0.25, min_hedge_delay=0.02, max_hedge_delay=1.0):
+        self.alpha = alpha
+        self.failure_threshold = failure_threshold
+        self.open_seconds = open_seconds
+        self.max_open_seconds = max_open_seconds
+        self.default_hedge_delay = default_hedge_delay
+        self.min_hedge_delay = min_hedge_delay
+        self.max_hedge_delay = max_hedge_delay
+        self._hosts = {}
+        self._lock = threading.Lock()
+
+    def _get(self, host):
+        health = self._hosts.get(host)
+        if health is None:
+            health = self._hosts[host] = HostHealth()
+        return health
+
+    def state(self, host, now=None):
+        """返回 closed / open / half_open"""
+        health = self._hosts.get(host)
+        if health is None or not health.open_until:
+            return "closed"
+        now = time.monotonic() if now is None else now
+        return "open" if now < health.open_until else "half_open"
+
+    def order(self, hosts, now=None):
+        """
+        按探测优先级排序并跳过熔断中的host
+        所有host都在熔断时仍全部返回（按冷却结束时间排序），否则无法发现网络恢复
+        """
+        now = time.monotonic() if now is None else now
+        closed, half_open, opened = [], [], []
+        with self._lock:
+            for index, host in enumerate(hosts):
+                health = self._hosts.get(host)
+                state = self.state(host, now)
+                if state == "closed":
+                    rtt = health.rtt_ewma_us if health and health.rtt_ewma_us is not None else float("inf")
+                    closed.append(((health.failures if health else 0, rtt, index), host))
+                elif state == "half_open":
+                    half_open.append(((health.open_until, index), host))
+                else:
+                    opened.append(((health.open_until, index), host))
+        if not closed and not half_open:
+            return [host for _, host in sorted(opened)]
+        return [host for _, host in sorted(closed)] + [host for _, host in sorted(half_open)]
+
+    def hedge_delay(self, host):
+        """
+        对冲探测的等待时间（秒）：超过平滑往返时间加4倍偏差仍无应答时再启动下一个host
+        """
+        health = self._hosts.get(host)
+        if health is None or health.rtt_ewma_us is None:
+            return self.default_hedge_delay
+        delay = (health.rtt_ewma_us + 4 * health.rtt_dev_us) / 1e6
+        return min(max(delay, self.min_hedge_delay), self.max_hedge_delay)
+
+    def record(self, result, now=None):
+        """
+        记录一次探测结果，被取消的探测不计入统计
+        被对冲超过的探测：已等待的时间是其往返时间的下限，只在已有平滑值且高于它时计入，
+        使该host排到更快的host之后；从未成功过的host不设置平滑值，不会排到未探测过的host之前。
+        自上次成功以来连续被超过 failure_threshold 次后，之后的每次都按失败计，从不应答的host最终会熔断
+        """
+        if not result.ok and result.error == _CANCELLED_ERROR:
+            return
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            health = self._get(result.host)
+            if result.error == _SLOW_ERROR:
+                if (result.rtt_us is not None and health.rtt_ewma_us is not None
+                        and result.rtt_us > health.rtt_ewma_us):
+                    self._update_rtt(health, result.rtt_us)
+                health.overtaken += 1
+                if health.overtaken >= self.failure_threshold:
+                    self._fail(health, now)
+            elif result.ok:
+                self._update_rtt(health, result.rtt_us)
+                health.failures = 0
+                health.overtaken = 0
+                health.open_count = 0
+                health.open_until = 0.0
+            else:
+                self._fail(health, now)
+
+    def _fail(self, health, now):
+        """记录一次失败，连续失败达到阈值时熔断（调用方需持有锁）"""
+        health.failures += 1
+        if health.failures >= self.failure_threshold:
+            health.open_count += 1
+            cooldown = self.open_seconds * 2 ** (health.open_count - 1)
+            health.open_until = now + min(cooldown, self.max_open_seconds)
+
+    def _update_rtt(self, health, rtt_us):
+        """按 EWMA 更新平滑往返时间和偏差（调用方需持有锁）"""
+        if health.rtt_ewma_us is None:
+            health.rtt_ewma_us = float(rtt_us)
+            health.rtt_dev_us = rtt_us / 2
+        else:
+            error = rtt_us - health.rtt_ewma_us
+            health.rtt_ewma_us += self.alpha * error
+            health.rtt_dev_us += self.alpha * (abs(error) - health.rtt_dev_us)
+
+    def format_summary(self):
+        """格式化各host的状态，每个host一行"""
+        now = time.monotonic()
+        lines = []
+        with self._lock:
+            items = sorted(self._hosts.items())
+        for host, health in items:
+            rtt = f"{round(health.rtt_ewma_us / 1000, 2)}ms" if health.rtt_ewma_us is not None else "未知"
+            state = self.state(host, now)
+            if state == "open":
+                state = f"熔断中(剩余{int(health.open_until - now)}秒)"
+            elif state == "half_open":
+                state = "半开"
+            else:
+                state = "正常"
+            lines.append(f"{host}: {state}, 平滑响应时间 {rtt}, 连续失败 {health.failures} 次")
+        return lines
+
+
+class StateHysteresis:
+    """
+    网络状态迟滞：连续 down_checks 次失败才确认断网，连续 up_checks 次成功才确认恢复
+    链路抖动造成的个别失败或成功不会改变确认后的状态
+    """
+    def __init__(self, down_checks=3, up_checks=2):
+        self.down_checks = down_checks
+        self.up_checks = up_checks
+        self.state = None   # 确认后的状态，None 表示尚无结果（首次结果直接采用）
+        self._streak = 0    # 与确认状态相反的连续结果次数
+
+    @property
+    def pending(self):
+        """是否有尚未确认的状态变化"""
+        return self._streak > 0
+
+    def update(self, ok):
+        """记录一次检测结果，返回确认后的状态"""
+        if self.state is None or ok == self.state:
+            self.state = ok
+            self._streak = 0
+            return self.state
+        self._streak += 1
+        if self._streak >= (self.up_checks if ok else self.down_checks):
+            self.state = ok
+            self._streak = 0
+        return self.state
+
+
+# 全局实例
+host_health = HostHealthTracker()
+
+
+def get_default_hosts():
+    """读取 XIAOU_PROBE_HOSTS 环境变量（逗号分隔），未设置时使用默认列表"""
+    spec = os.environ.get("XIAOU_PROBE_HOSTS", "")
+    hosts = [host.strip() for host in spec.split(",") if host.strip()]
+    return hosts or list(DEFAULT_HOSTS)
+
+
+def _checksum(data):
+    """计算 ICMP 校验和"""
+    if len(data) % 2:
+        data += b"\x00"
+    total = sum(struct.unpack(f"!{len(data) // 2}H", data))
+    total = (total >> 16) + (total & 0xFFFF)
+    total += total >> 16
+    return ~total & 0xFFFF
+
+
+def _build_echo_request(seq):
+    """构造 ICMP 回显请求报文（标识符由内核填充）"""
+    payload = b"xiaoU-probe"
+    header = struct.pack("!BBHHH", 8, 0, 0, 0, seq)
+    checksum = _checksum(header + payload)
+    return struct.pack("!BBHHH", 8, 0, checksum, 0, seq) + payload
+
+
+def get_probe_backend(name=None):
+    """
+    获取探测后端
+    参数:
+        name: auto / icmp / tcp / subprocess，为None时读取 XIAOU_PROBE_BACKEND 环境变量
+    返回: 探测后端实例
+    """
+    if name is None:
+        name = os.environ.get("XIAOU_PROBE_BACKEND", "auto")
+    name = name.strip().lower()
+
+    fallback = SubprocessPingBackend()
+    if name == "subprocess":
+        return fallback
+    if name == "tcp":
+        return TcpConnectBackend(fallback=fallback)
+    if name == "icmp" or IcmpDatagramBackend.available():
+        return IcmpDatagramBackend(fallback=fallback)
+    return TcpConnectBackend(fallback=fallback)
+
+
+def _resolve_backend(backend):
+    if backend is None or isinstance(backend, str):
+        return get_probe_backend(backend)
+    return backend
+
+
+# 表示进程内后端本身不可用（无权限、内核不支持）的错误码，此时才退回到 ping 命令
+_BACKEND_UNAVAILABLE_ERRNOS = frozenset((errno.EPERM, errno.EACCES, errno.EAFNOSUPPORT, errno.EPROTONOSUPPORT))
+
+
+def _start_probe(backend, host):
+    """
+    启动探测，进程内后端不可用时退回到 ping 命令
+    域名解析失败、网络不可达等错误直接抛出，由调用方记为探测失败，断网时不会为每个host启动 ping
+    """
+    try:
+        return backend.start(host)
+    except OSError as e:
+        if backend.fallback is None or e.errno not in _BACKEND_UNAVAILABLE_ERRNOS:
+            raise
+        return backend.fallback.start(host)
+
+
+def _run_probes(backend, hosts, timeout, stop_on_first=True, hedge_delay=None):
+    """
+    探测 hosts，等待结果直到全局截止时间
+    hedge_delay 为None时同时启动所有探测；否则按顺序对冲启动：
+    前一个探测超过 hedge_delay 秒仍无应答或已失败时才启动下一个host
+    stop_on_first 为True时首个成功即返回，并取消其余探测（未启动的host不会出现在结果中）
+    返回: ProbeResult 列表（与 hosts 顺序一致）
+    """
+    deadline = time.monotonic() + timeout
+    results = {}
+    pending = []
+    waiting = list(hosts)
+    next_launch = 0.0
+    selector = selectors.DefaultSelector()
+
+    try:
+        success = False
+        winner_started_ns = None
+        while not (success and stop_on_first):
+            now = time.monotonic()
+            while waiting and (hedge_delay is None or not pending or now >= next_launch):
+                host = waiting.pop(0)
+                next_launch = now + (hedge_delay or 0)
+                try:
+                    probe = _start_probe(backend, host)
+                except Exception as e:
+                    results[host] = ProbeResult(host, False, None, str(e))
+                    continue
+                pending.append(probe)
+                if probe.fileno() is not None:
+                    selector.register(probe, probe.events)
+
+            if not pending:
+                break
+            remaining = deadline - now
+            if remaining <= 0:
+                break
+
+            # 含有 ping 子进程时需要定期轮询，对冲模式下到时间要启动下一个探测
+            wait = remaining
+            if waiting:
+                wait = min(wait, max(next_launch - now, 0))
+            if any(probe.fileno() is None for probe in pending):
+                wait = min(wait, 0.02)
+            if selector.get_map():
+                ready = {key.fileobj for key, _ in selector.select(wait)}
+            else:
+                time.sleep(wait)
+                ready = set()
+
+            for probe in list(pending):
+                if probe.fileno() is not None and probe not in ready:
+                    continue
+                outcome = probe.poll()
+                if outcome is None:
+                    continue
+                ok, error = outcome
+                rtt_us = (time.perf_counter_ns() - probe.started_ns) // 1000 if ok else None
+                if ok:
+                    instrumentation.observe("probe_rtt", rtt_us / 1e6, host=probe.host)
+                results[probe.host] = ProbeResult(probe.host, ok, rtt_us, error)
+                pending.remove(probe)
+                if probe.fileno() is not None:
+                    selector.unregister(probe)
+                probe.close()
+                if ok:
+                    if not success:
+                        winner_started_ns = probe.started_ns
+                    success = True
+                    if stop_on_first:
+                        break
+
+        # 对冲模式下先于成功者启动却仍无应答的host记为响应慢，附上已等待的时间，
+        # 只用于调整其平滑往返时间，不计入失败统计（慢但正常的host不应被熔断）
+        for probe in pending:
+            waited_us = None
+            if not success:
+                error = _TIMEOUT_ERROR
+            elif hedge_delay is not None and probe.started_ns < winner_started_ns:
+                error = _SLOW_ERROR
+                waited_us = (time.perf_counter_ns() - probe.started_ns) // 1000
+            else:
+                error = _CANCELLED_ERROR
+            results[probe.host] = ProbeResult(probe.host, False, waited_us, error)
+    finally:
+        for probe in pending:
+            probe.close()
+        selector.close()
+
+    return [results[host] for host in hosts if host in results]
+
+
+def probe_hosts(hosts, timeout=5, concurrent=False, backend=None, tracker=None):
+    """
+    按 tracker 给出的优先级探测host列表，直到有一个成功
+    参数:
+        hosts: 要检测的host列表
+        timeout: 超时时间（秒），并发模式下为全局截止时间
+        concurrent: 是否并发探测：最优host在对冲等待时间内无应答或失败时立即启动下一个，
+                    而不是等满一个timeout
+        backend: 探测后端实例或名称，为None时自动选择
+        tracker: HostHealthTracker，为None时使用全局的 host_health
+    返回: ProbeResult 列表（按实际探测顺序，熔断中的host不会被探测）
+    """
+    backend = _resolve_backend(backend)
+    tracker = tracker or host_health
+    hosts = tracker.order(hosts)
+    if concurrent:
+        hedge_delay = tracker.hedge_delay(hosts[0]) if hosts else None
+        results = _run_probes(backend, hosts, timeout, hedge_delay=hedge_delay)
+    else:
+        results = []
+        for host in hosts:
+            results.extend(_run_probes(backend, [host], timeout))
+            if results and results[-1].ok:
+                break
+
+    for result in results:
+        tracker.record(result)
+    return results
+
+
+def probe_all(hosts, timeout=5, backend=None):
+    """
+    同时探测所有host并等待全部结果，用于质量测量（不提前结束，不计入 host_health）
+    返回: ProbeResult 列表（与 hosts 顺序一致）
+    """
+    return _run_probes(_resolve_backend(backend), hosts, timeout, stop_on_first=False)
+
+
+def format_probe_result(result):
+    """将单个探测结果格式化为日志文本"""
+    if result.ok:
+        response_time = round(result.rtt_us / 1000, 2)
+        return f"成功连接到 {result.host} (响应时间: {response_time}ms)"
+    if result.error in (_TIMEOUT_ERROR, _CANCELLED_ERROR, _SLOW_ERROR):
+        return f"{result.host} ({result.error})"
+    return f"{result.host} (错误: {result.error})"
+
+
+def check_internet_connection(hosts=None, timeout=5, backend=None):
     """
     检查网络连接状态，支持多个备选host地址
     参数:
-        hosts: 要检测的host列表，如果为None则使用默认列表
+        hosts: 要检测的host列表，如果为None则使用 get_default_hosts()
         timeout: 每次检测的超时时间（秒）
+        backend: 探测后端实例或名称，为None时自动选择
     返回: Boolean - 是否联网成功
     """
     if hosts is None:
-        # 默认的备选host列表
-        hosts = [
-            "8.8.8.8",           # Google DNS
-            "1.1.1.1",           # Cloudflare DNS
-            "208.67.222.222",    # OpenDNS
-            "223.5.5.5",         # 阿里云DNS
-            "114.114.114.114"    # 114DNS
-        ]
-    
-    # 根据操作系统选择ping参数
-    param = "-n" if platform.system().lower() == "windows" else "-c"
-    
-    for host in hosts:
-        try:
-            # 执行ping命令
-            result = subprocess.run(
-                ["ping", param, "1", host],
-                capture_output=True,
-                timeout=timeout
-            )
-            
-            # 如果ping成功，返回True
-            if result.returncode == 0:
-                return True
-                
-        except subprocess.TimeoutExpired:
-            # 超时继续尝试下一个host
-            continue
-        except Exception:
-            # 其他异常继续尝试下一个host
-            continue
-    
-    # 所有host都失败，返回False
-    return False
+        hosts = get_default_hosts()
 
-def check_internet_connection_with_details(hosts=None, timeout=5):
+    results = probe_hosts(hosts, timeout, backend=backend)
+    return any(result.ok for result in results)
+
+def check_internet_connection_with_details(hosts=None, timeout=5, concurrent=False, backend=None):
     """
     检查网络连接状态并返回详细信息
     参数:
-        hosts: 要检测的host列表，如果为None则使用默认列表
+        hosts: 要检测的host列表，如果为None则使用 get_default_hosts()
         timeout: 每次检测的超时时间（秒）
+        concurrent: 是否并发探测（对冲启动，总耗时不超过一个timeout）
+        backend: 探测后端实例或名称，为None时自动选择
     返回: (Boolean, str) - (是否联网成功, 详细信息)
     """
+    status, details, _ = check_internet_connection_with_results(hosts, timeout, concurrent, backend)
+    return status, details
+
+def check_internet_connection_with_results(hosts=None, timeout=5, concurrent=False, backend=None):
+    """
+    与 check_internet_connection_with_details 相同，额外返回每个host的探测结果
+    返回: (Boolean, str, list) - (是否联网成功, 详细信息, ProbeResult 列表)
+    """
     if hosts is None:
-        # 默认的备选host列表
-        hosts = [
-            "211.141.85.68",     # 移动DNS
-            "211.141.90.68",     # 移动备选DNS
-            "1.1.1.1",           # Cloudflare DNS
-            "223.5.5.5",         # 阿里云DNS
-            "114.114.114.114"    # 114DNS
-        ]
-    
-    # 根据操作系统选择ping参数
-    param = "-n" if platform.system().lower() == "windows" else "-c"
-    
-    failed_hosts = []
-    
-    for host in hosts:
-        try:
-            # 执行ping命令
-            start_time = time.time()
-            result = subprocess.run(
-                ["ping", param, "1", host],
-                capture_output=True,
-                timeout=timeout
-            )
-            response_time = round((time.time() - start_time) * 1000, 2)
-            
-            # 如果ping成功，返回True和详细信息
-            if result.returncode == 0:
-                return True, f"成功连接到 {host} (响应时间: {response_time}ms)"
-            else:
-                failed_hosts.append(f"{host} (超时)")
-                
-        except subprocess.TimeoutExpired:
-            failed_hosts.append(f"{host} (超时)")
-        except Exception as e:
-            failed_hosts.append(f"{host} (错误: {str(e)})")
-    
+        hosts = get_default_hosts()
+
+    results = probe_hosts(hosts, timeout, concurrent=concurrent, backend=backend)
+    succeeded = [result for result in results if result.ok]
+
+    if succeeded:
+        message = format_probe_result(succeeded[0])
+        others = [format_probe_result(result) for result in results if result is not succeeded[0]]
+        if concurrent and others:
+            message += f"; 其他: {', '.join(others)}"
+        return True, message, results
+
     # 所有host都失败，返回False和错误信息
+    failed_hosts = [format_probe_result(result) for result in results]
     error_msg = f"所有host连接失败: {', '.join(failed_hosts)}"
-    return False, error_msg
+    return False, error_msg, results
 
 if __name__ == "__main__":
     # 测试基本功能
+    print(f"探测后端: {get_probe_backend().name}")
+    print(f"探测host: {', '.join(get_default_hosts())}")
     print("测试网络连接...")
     if check_internet_connection():
         print("网络连接正常")
     else:
         print("网络连接失败")
-    
+
     # 测试详细功能
     print("\n测试详细网络连接信息...")
     status, details = check_internet_connection_with_details()
     print(f"状态: {'正常' if status else '失败'}")
     print(f"详情: {details}")
-    
+
     # 测试自定义host列表
     print("\n测试自定义host列表...")
     custom_hosts = ["8.8.8.8", "1.1.1.1"]
     status, details = check_internet_connection_with_details(hosts=custom_hosts)
     print(f"状态: {'正常' if status else '失败'}")
-    print(f"详情: {details}")
\ No newline at end of file
+    print(f"详情: {details}")
+
+    # 测试并发探测
+    print("\n测试并发探测...")
+    status, details = check_internet_connection_with_details(concurrent=True)
+    print(f"状态: {'正常' if status else '失败'}")
+    print(f"详情: {details}")
+
+    for line in host_health.format_summary():
+        print(f"host状态: {line}")
+
+    # 测试各探测后端
+    print("\n测试各探测后端...")
+    for name in ("icmp", "tcp", "subprocess"):
+        try:
+            for result in probe_hosts(["223.5.5.5"], backend=name):
+                print(f"{name}: {result}")
+        except Exception as e:
+            print(f"{name}: 不可用 ({e})")
@@ -0,0 +1,17 @@
+import importlib
+
+class LazyModule:
+    """
+    延迟导入的模块代理，首次访问属性时才真正导入
+    用于启动阶段用不到的重量级模块（psutil、smtplib 等），访问过的属性会缓存在代理上
+    """
+    def __init__(self, name):
+        self._name = name
+
+    def __getattr__(self, attr):
+        value = getattr(importlib.import_module(self._name), attr)
+        setattr(self, attr, value)
+        return value
+
+    def __repr__(self):
+        return f"<lazy module '{self._name}'>"
@@ -0,0 +1,183 @@
+import threading
+
+import instrumentation
+
+def _label_key(labels):
+    return tuple(sorted(labels.items()))
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _format_labels(key):
+    if not key:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in key) + "}"
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    if isinstance(value, float) and value.is_integer() and abs(value) < 1e15:
+        return str(int(value))
+    return repr(value)
+
+def series_name(name, key):
+    """指标名加标签的文本形式，如 xiaou_disk_free_bytes{mount="/"}"""
+    return name + _format_labels(key)
+
+class MetricsRegistry:
+    """
+    进程内指标注册表
+    - 监控线程更新指标时不加锁：仪表值直接赋值，计数器和汇总写入各线程私有的分片
+    - 导出时把各分片合并成快照，只有导出方付出合并的开销
+    """
+    def __init__(self):
+        self._meta = {}        # 指标名 -> (类型, 说明)
+        self._gauges = {}      # (指标名, 标签) -> 值
+        self._shards = []      # 各线程的计数分片
+        self._shards_lock = threading.Lock()
+        self._local = threading.local()
+        self._collectors = []  # 导出时额外调用的采集函数
+
+    def describe(self, name, metric_type, help_text):
+        """声明指标类型（gauge / counter / summary / histogram）和说明"""
+        self._meta[name] = (metric_type, help_text)
+
+    def add_collector(self, collector):
+        """
+        注册采集函数，快照时调用 collector() 获取额外的 {(指标名, 标签): 值}
+        直方图指标的值为 instrumentation.LatencyHistogram
+        """
+        self._collectors.append(collector)
+
+    def _shard(self):
+        shard = getattr(self._local, "shard", None)
+        if shard is None:
+            shard = self._local.shard = {}
+            with self._shards_lock:
+                self._shards.append(shard)
+        return shard
+
+    def set(self, name, value, **labels):
+        """设置仪表值"""
+        self._gauges[(name, _label_key(labels))] = value
+
+    def gauges(self):
+        """返回当前所有仪表值 {(指标名, 标签): 值}"""
+        return dict(self._gauges)
+
+    def remove(self, name, **labels):
+        """移除一个仪表值（如挂载点被卸载）"""
+        self._gauges.pop((name, _label_key(labels)), None)
+
+    def inc(self, name, amount=1, **labels):
+        """计数器加 amount"""
+        shard = self._shard()
+        key = (name, _label_key(labels))
+        shard[key] = shard.get(key, 0) + amount
+
+    def observe(self, name, value, **labels):
+        """记录一次观测值（汇总指标，导出 _sum 和 _count）"""
+        shard = self._shard()
+        key = (name, _label_key(labels))
+        total, count = shard.get(key, (0.0, 0))
+        shard[key] = (total + value, count + 1)
+
+    def snapshot(self):
+        """
+        合并所有分片，返回 {(指标名, 标签): 值}
+        计数器为累计值，汇总指标为 (sum, count)
+        """
+        values = dict(self._gauges)
+        with self._shards_lock:
+            shards = list(self._shards)
+        for shard in shards:
+            for key, value in dict(shard).items():
+                current = values.get(key)
+                if current is None:
+                    values[key] = value
+                elif isinstance(value, tuple):
+                    values[key] = (current[0] + value[0], current[1] + value[1])
+                else:
+                    values[key] = current + value
+        for collector in self._collectors:
+            values.update(collector())
+        return values
+
+    def render_openmetrics(self):
+        """把当前快照渲染为 OpenMetrics 文本格式"""
+        grouped = {}
+        for (name, key), value in self.snapshot().items():
+            grouped.setdefault(name, []).append((key, value))
+
+        lines = []
+        for name in sorted(grouped):
+            metric_type, help_text = self._meta.get(name, ("unknown", ""))
+            lines.append(f"# TYPE {name} {metric_type}")
+            if help_text:
+                lines.append(f"# HELP {name} {_escape(help_text)}")
+            for key, value in sorted(grouped[name]):
+                labels = _format_labels(key)
+                if metric_type == "counter":
+                    lines.append(f"{name}_total{labels} {_format_value(value)}")
+                elif metric_type == "histogram":
+                    for bound, cumulative in value.cumulative_buckets():
+                        bucket_labels = _format_labels(key + (("le", _format_value(float(bound))),))
+                        lines.append(f"{name}_bucket{bucket_labels} {cumulative}")
+                    lines.append(f"{name}_count{labels} {value.count}")
+                    lines.append(f"{name}_sum{labels} {_format_value(value.total)}")
+                elif metric_type == "summary":
+                    lines.append(f"{name}_sum{labels} {_format_value(value[0])}")
+                    lines.append(f"{name}_count{labels} {_format_value(value[1])}")
+                else:
+                    lines.append(f"{name}{labels} {_format_value(value)}")
+        lines.append("# EOF")
+        return "\n".join(lines) + "\n"
+
+# 全局实例
+metrics = MetricsRegistry()
+
+metrics.describe("xiaou_network_up", "gauge", "网络是否连通（1=在线，0=离线）")
+metrics.describe("xiaou_probe_rtt_seconds", "gauge", "最近一次探测成功的往返时间")
+metrics.describe("xiaou_probes", "counter", "探测次数")
+metrics.describe("xiaou_disk_total_bytes", "gauge", "挂载点总空间")
+metrics.describe("xiaou_disk_used_bytes", "gauge", "挂载点已用空间")
+metrics.describe("xiaou_disk_free_bytes", "gauge", "挂载点剩余空间")
+metrics.describe("xiaou_disk_read_bytes_per_second", "gauge", "设备读取吞吐量")
+metrics.describe("xiaou_disk_write_bytes_per_second", "gauge", "设备写入吞吐量")
+metrics.describe("xiaou_disk_iops", "gauge", "设备每秒读写次数")
+metrics.describe("xiaou_disk_await_seconds", "gauge", "设备IO平均服务时间")
+metrics.describe("xiaou_disk_utilization_ratio", "gauge", "设备忙碌时间占比")
+metrics.describe("xiaou_emails", "counter", "邮件发送尝试次数")
+metrics.describe("xiaou_email_send_seconds", "summary", "邮件发送耗时")
+metrics.describe("xiaou_notification_queue_depth", "gauge", "通知队列中等待发送的消息数")
+metrics.describe("xiaou_check_duration_seconds", "histogram", "检查任务耗时")
+metrics.describe("xiaou_stalls", "counter", "被看门狗判定卡死并放弃的任务次数")
+metrics.describe("xiaou_probe_rtt_histogram_seconds", "histogram", "各host探测往返时间分布")
+metrics.describe("xiaou_disk_usage_call_seconds", "histogram", "psutil.disk_usage 调用耗时")
+metrics.describe("xiaou_smtp_phase_seconds", "histogram", "SMTP各阶段耗时")
+metrics.describe("xiaou_notifications", "counter", "各通知渠道发送次数")
+metrics.describe("xiaou_notify_channel_seconds", "histogram", "各通知渠道发送耗时")
+metrics.describe("xiaou_fleet_nodes", "gauge", "集群汇总端已知的节点数")
+metrics.describe("xiaou_network_loss_ratio", "gauge", "网络质量测量的丢包率")
+metrics.describe("xiaou_network_jitter_seconds", "gauge", "网络质量测量的抖动")
+metrics.describe("xiaou_network_rtt_p95_seconds", "gauge", "网络质量测量的往返时间p95")
+metrics.describe("xiaou_processes", "gauge", "进程监控跟踪的进程数")
+metrics.describe("xiaou_diagnosis_layer_up", "gauge", "最近一次网络诊断中各层是否正常")
+metrics.describe("xiaou_check_up", "gauge", "配置文件中的检查是否正常（1=正常，0=失败）")
+
+def _collect_histograms():
+    """把 instrumentation 的直方图映射为导出指标"""
+    names = {
+        "check": "xiaou_check_duration_seconds",
+        "probe_rtt": "xiaou_probe_rtt_histogram_seconds",
+        "disk_usage": "xiaou_disk_usage_call_seconds",
+        "smtp_phase": "xiaou_smtp_phase_seconds",
+        "notify_channel": "xiaou_notify_channel_seconds",
+    }
+    return {
+        (names[name], labels): histogram
+        for (name, labels), histogram in instrumentation.snapshot().items()
+        if name in names
+    }
+
+metrics.add_collector(_collect_histograms)
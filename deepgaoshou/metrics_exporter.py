@@ -0,0 +1,63 @@
+import os
+import threading
+
+from metrics import metrics
+
+CONTENT_TYPE = "application/openmetrics-text; version=1.0.0; charset=utf-8"
+
+class MetricsExporter:
+    """
+    OpenMetrics HTTP 导出端点
+    抓取请求只返回缓存的快照文本，不会触发网络探测或 psutil 调用；
+    快照由调度器定期调用 refresh() 重新生成
+    """
+    def __init__(self, registry=None, host="127.0.0.1", port=9469):
+        self.registry = registry or metrics
+        self.host = host
+        self.port = port
+        self._snapshot = b"# EOF\n"
+        self._server = None
+
+    def refresh(self):
+        """重新渲染指标快照"""
+        self._snapshot = self.registry.render_openmetrics().encode("utf-8")
+
+    def start(self):
+        """在后台线程中启动HTTP服务"""
+        from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+        exporter = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split("?")[0] not in ("/metrics", "/"):
+                    self.send_error(404)
+                    return
+                body = exporter._snapshot
+                self.send_response(200)
+                self.send_header("Content-Type", CONTENT_TYPE)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                # 抓取请求很频繁，不输出访问日志
+                pass
+
+        self.refresh()
+        self._server = ThreadingHTTPServer((self.host, self.port), Handler)
+        self._server.daemon_threads = True
+        self.port = self._server.server_address[1]
+        threading.Thread(target=self._server.serve_forever, name="metrics-exporter", daemon=True).start()
+
+    def stop(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+def build_metrics_exporter():
+    """根据 XIAOU_METRICS_PORT / XIAOU_METRICS_ADDR 环境变量创建导出端点，未设置端口时返回None"""
+    port = os.environ.get("XIAOU_METRICS_PORT")
+    if not port:
+        return None
+    return MetricsExporter(host=os.environ.get("XIAOU_METRICS_ADDR", "127.0.0.1"), port=int(port))
@@ -0,0 +1,182 @@
+import errno
+import os
+import selectors
+import socket
+import struct
+import sys
+import threading
+import time
+from datetime import datetime
+
+# rtnetlink 消息类型
+RTM_NEWLINK, RTM_DELLINK = 16, 17
+RTM_NEWADDR, RTM_DELADDR = 20, 21
+RTM_NEWROUTE, RTM_DELROUTE = 24, 25
+NLMSG_NOOP, NLMSG_ERROR, NLMSG_DONE, NLMSG_OVERRUN = 1, 2, 3, 4
+
+# 订阅的多播组：网卡状态、IPv4/IPv6 地址和路由
+RTMGRP_LINK = 0x1
+RTMGRP_IPV4_IFADDR = 0x10
+RTMGRP_IPV4_ROUTE = 0x40
+RTMGRP_IPV6_IFADDR = 0x100
+RTMGRP_IPV6_ROUTE = 0x400
+GROUPS = RTMGRP_LINK | RTMGRP_IPV4_IFADDR | RTMGRP_IPV4_ROUTE | RTMGRP_IPV6_IFADDR | RTMGRP_IPV6_ROUTE
+
+IFF_UP = 0x1
+IFF_RUNNING = 0x40
+RT_TABLE_LOCAL = 255
+
+_NLMSG_HEADER = struct.Struct("=IHHII")   # 长度, 类型, 标志, 序号, 端口
+_IFINFOMSG = struct.Struct("=BxHiII")     # 地址族, 设备类型, 网卡序号, 标志, 变化掩码
+_IFADDRMSG = struct.Struct("=BBBBI")      # 地址族, 前缀长度, 标志, 范围, 网卡序号
+_RTMSG = struct.Struct("=BBBBBBBBI")      # 地址族, 目的前缀长度, 源前缀长度, TOS, 路由表, 协议, 范围, 类型, 标志
+
+def _log(message):
+    """统一的日志输出函数"""
+    timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    print(f"[{timestamp}] {message}", flush=True)
+
+def _interface_name(index):
+    try:
+        return socket.if_indextoname(index)
+    except OSError:
+        return f"#{index}"
+
+class NetlinkMonitor:
+    """
+    通过 rtnetlink 套接字监听网卡、地址和路由变化（仅 Linux）
+    - 内核主动推送事件，网络稳定时不需要唤醒
+    - 收到事件后等待 debounce 秒，把同一批变化合并为一次 on_change(事件描述列表) 回调
+    - 网卡事件只在运行状态变化时上报，过滤无线网卡等反复推送的重复通知
+    """
+    def __init__(self, on_change, debounce=0.2):
+        self.on_change = on_change
+        self.debounce = debounce
+        self._sock = None
+        self._wakeup = None
+        self._thread = None
+        self._link_running = {}   # 网卡序号 -> 上次的运行状态
+
+    @staticmethod
+    def available():
+        return sys.platform.startswith("linux") and hasattr(socket, "AF_NETLINK")
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self):
+        """打开 netlink 套接字并在后台线程中监听"""
+        self._sock = socket.socket(socket.AF_NETLINK, socket.SOCK_RAW, socket.NETLINK_ROUTE)
+        try:
+            self._sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 1024 * 1024)
+            self._sock.bind((0, GROUPS))
+        except OSError:
+            self._sock.close()
+            raise
+        self._wakeup = os.pipe()
+        self._thread = threading.Thread(target=self._run, name="netlink-monitor", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """停止监听，唤醒管道只在这里关闭，监听线程出错退出后调用也是安全的"""
+        if self._thread is None:
+            return
+        if self._thread.is_alive():
+            os.write(self._wakeup[1], b"x")
+            self._thread.join(timeout=2)
+        if not self._thread.is_alive():
+            # 线程仍未退出时保留管道，避免它在已关闭（可能被复用）的文件描述符上等待
+            for fd in self._wakeup:
+                os.close(fd)
+            self._wakeup = None
+        self._thread = None
+
+    def parse(self, data):
+        """解析一批 netlink 消息，返回需要上报的事件描述列表"""
+        events = []
+        offset = 0
+        while offset + _NLMSG_HEADER.size <= len(data):
+            length, msg_type, _, _, _ = _NLMSG_HEADER.unpack_from(data, offset)
+            if length < _NLMSG_HEADER.size or offset + length > len(data):
+                break
+            payload = offset + _NLMSG_HEADER.size
+            event = None
+            if msg_type == NLMSG_OVERRUN:
+                event = "事件队列溢出"
+            elif msg_type in (RTM_NEWLINK, RTM_DELLINK) and length >= _NLMSG_HEADER.size + _IFINFOMSG.size:
+                _, _, index, flags, _ = _IFINFOMSG.unpack_from(data, payload)
+                event = self._link_event(msg_type, index, flags)
+            elif msg_type in (RTM_NEWADDR, RTM_DELADDR) and length >= _NLMSG_HEADER.size + _IFADDRMSG.size:
+                family, prefix, _, _, index = _IFADDRMSG.unpack_from(data, payload)
+                action = "新增" if msg_type == RTM_NEWADDR else "删除"
+                version = "IPv6" if family == socket.AF_INET6 else "IPv4"
+                event = f"网卡 {_interface_name(index)} {action}{version}地址 (/{prefix})"
+            elif msg_type in (RTM_NEWROUTE, RTM_DELROUTE) and length >= _NLMSG_HEADER.size + _RTMSG.size:
+                family, dst_len, _, _, table, _, _, _, _ = _RTMSG.unpack_from(data, payload)
+                if table != RT_TABLE_LOCAL:
+                    action = "新增" if msg_type == RTM_NEWROUTE else "删除"
+                    version = "IPv6" if family == socket.AF_INET6 else "IPv4"
+                    target = "默认路由" if dst_len == 0 else "路由"
+                    event = f"{action}{version}{target}"
+            if event is not None:
+                events.append(event)
+            offset += (length + 3) & ~3
+        return events
+
+    def _link_event(self, msg_type, index, flags):
+        name = _interface_name(index)
+        if msg_type == RTM_DELLINK:
+            self._link_running.pop(index, None)
+            return f"网卡 {name} 已移除"
+        running = bool(flags & IFF_UP) and bool(flags & IFF_RUNNING)
+        if self._link_running.get(index) == running:
+            return None
+        self._link_running[index] = running
+        return f"网卡 {name} {'已连接' if running else '已断开'}"
+
+    def _run(self):
+        selector = selectors.DefaultSelector()
+        pending = []
+        deadline = None
+        try:
+            selector.register(self._sock, selectors.EVENT_READ)
+            selector.register(self._wakeup[0], selectors.EVENT_READ)
+            while True:
+                timeout = None if deadline is None else max(deadline - time.monotonic(), 0)
+                for key, _ in selector.select(timeout):
+                    if key.fileobj == self._wakeup[0]:
+                        return
+                    try:
+                        events = self.parse(self._sock.recv(65536))
+                    except OSError as e:
+                        # ENOBUFS 表示内核丢弃了部分事件，同样需要重新确认网络状态
+                        if e.errno != errno.ENOBUFS:
+                            raise
+                        events = ["事件队列溢出"]
+                    if events:
+                        pending.extend(events)
+                        if deadline is None:
+                            deadline = time.monotonic() + self.debounce
+                if deadline is not None and time.monotonic() >= deadline:
+                    events, pending, deadline = pending, [], None
+                    try:
+                        self.on_change(events)
+                    except Exception as e:
+                        _log(f"网络事件处理出错: {e}")
+        except Exception as e:
+            _log(f"网络事件监听已停止，恢复定时检测: {e}")
+        finally:
+            selector.close()
+            self._sock.close()
+
+def build_netlink_monitor(on_change):
+    """
+    根据 XIAOU_NETLINK 环境变量（auto/0，默认 auto）创建网络事件监听器
+    未启用或当前系统不支持时返回None
+    """
+    if os.environ.get("XIAOU_NETLINK", "auto").strip().lower() in ("0", "off", "false"):
+        return None
+    if not NetlinkMonitor.available():
+        return None
+    return NetlinkMonitor(on_change)
@@ -0,0 +1,302 @@
+import os
+import random
+import socket
+import struct
+import threading
+import time
+from collections import namedtuple
+from datetime import datetime
+
+import internet_check
+from lazy_import import LazyModule
+
+psutil = LazyModule("psutil")                  # 只有诊断时才需要
+urllib_request = LazyModule("urllib.request")
+
+# 单层的诊断结果：ok 为None表示无法判断（如平台不支持），elapsed 为耗时（秒）
+LayerResult = namedtuple("LayerResult", ["layer", "ok", "detail", "elapsed"])
+# 一次诊断：layers 按 LAYERS 顺序排列，conclusion 为推断的故障位置
+Diagnosis = namedtuple("Diagnosis", ["time", "layers", "conclusion", "elapsed"])
+
+# 诊断的各层及名称，从下到上
+LAYERS = (
+    ("link", "网卡链路"),
+    ("gateway", "默认网关"),
+    ("dns_local", "本地DNS"),
+    ("dns_public", "公共DNS"),
+    ("tcp", "TCP连接"),
+    ("http", "HTTP请求"),
+)
+LAYER_NAMES = dict(LAYERS)
+
+# 各层自己的超时（秒），同时不超过整次诊断的超时
+LAYER_TIMEOUTS = {
+    "link": 1,
+    "gateway": 1.5,
+    "dns_local": 2,
+    "dns_public": 2,
+    "tcp": 2,
+    "http": 3,
+}
+
+DEFAULT_DNS_SERVER = "223.5.5.5"
+DEFAULT_DOMAIN = "www.baidu.com"
+DEFAULT_URL = "http://www.baidu.com/"
+
+_RTF_GATEWAY = 0x2
+
+def default_gateway():
+    """
+    从 /proc/net/route 读取 IPv4 默认网关
+    返回: (网关地址, 网卡名)，没有默认路由时返回None；无法读取路由表（非 Linux）时抛出 OSError
+    """
+    with open("/proc/net/route") as f:
+        next(f, None)  # 表头
+        for line in f:
+            fields = line.split()
+            if len(fields) < 4 or fields[1] != "00000000" or not int(fields[3], 16) & _RTF_GATEWAY:
+                continue
+            gateway = socket.inet_ntoa(struct.pack("<I", int(fields[2], 16)))
+            return gateway, fields[0]
+    return None
+
+def local_nameservers():
+    """/etc/resolv.conf 中配置的 DNS 服务器（读取失败时为空列表）"""
+    try:
+        with open("/etc/resolv.conf") as f:
+            return [line.split()[1] for line in f if line.startswith("nameserver") and len(line.split()) > 1]
+    except OSError:
+        return []
+
+def _build_dns_query(query_id, domain):
+    """构造查询 A 记录的 DNS 报文（期望递归）"""
+    header = struct.pack("!HHHHHH", query_id, 0x0100, 1, 0, 0, 0)
+    question = b"".join(bytes([len(label)]) + label.encode("idna") for label in domain.rstrip(".").split("."))
+    return header + question + b"\x00" + struct.pack("!HH", 1, 1)
+
+def _skip_name(data, offset):
+    """跳过报文中的域名（可能以压缩指针结尾），返回其后的偏移"""
+    while True:
+        length = data[offset]
+        if length & 0xC0 == 0xC0:
+            return offset + 2
+        offset += 1
+        if length == 0:
+            return offset
+        offset += length
+
+def _parse_dns_response(data, query_id):
+    """
+    解析 DNS 应答
+    返回: (响应码, A 记录地址列表)，不是本次查询的应答时抛出 ValueError
+    """
+    if len(data) < 12:
+        raise ValueError("应答报文过短")
+    response_id, flags, questions, answers = struct.unpack("!HHHH", data[:8])
+    if response_id != query_id or not flags & 0x8000:
+        raise ValueError("应答与查询不匹配")
+    offset = 12
+    for _ in range(questions):
+        offset = _skip_name(data, offset) + 4
+    addresses = []
+    for _ in range(answers):
+        offset = _skip_name(data, offset)
+        record_type, _, _, length = struct.unpack("!HHIH", data[offset:offset + 10])
+        offset += 10
+        if record_type == 1 and length == 4:
+            addresses.append(socket.inet_ntoa(data[offset:offset + 4]))
+        offset += length
+    return flags & 0x000F, addresses
+
+class NetworkDiagnoser:
+    """
+    分层网络诊断：同时检查网卡链路、默认网关、本地和公共DNS解析、TCP连接和HTTP请求，
+    根据各层结果推断故障位置（本机网卡、局域网/网关、上游线路、DNS 或 HTTP 层）
+    - 各层在独立线程中并发执行，各自有较短的超时，整次诊断在 timeout 秒内结束，
+      届时仍未完成的层按超时处理（阻塞的 getaddrinfo 无法取消，线程结束后自行退出）
+    - 只在断网时或按需执行，不参与常规的联网检测
+    - 同一时间只进行一次诊断
+    """
+    def __init__(self, dns_server=DEFAULT_DNS_SERVER, domain=DEFAULT_DOMAIN, url=DEFAULT_URL,
+                 timeout=5, tcp_hosts=None, backend=None):
+        self.dns_server = dns_server
+        self.domain = domain
+        self.url = url
+        self.timeout = timeout
+        self.tcp_hosts = tcp_hosts or internet_check.get_default_hosts()[:3]
+        self.backend = backend
+        self.last_diagnosis = None
+        self._lock = threading.Lock()
+
+    def diagnose(self):
+        """
+        执行一次诊断
+        返回: Diagnosis，已有诊断正在进行时返回None
+        """
+        if not self._lock.acquire(blocking=False):
+            return None
+        try:
+            diagnosis = self._diagnose()
+            self.last_diagnosis = diagnosis
+            return diagnosis
+        finally:
+            self._lock.release()
+
+    def _diagnose(self):
+        started = time.monotonic()
+        deadline = started + min(max(LAYER_TIMEOUTS.values()), self.timeout)
+        results = {}
+        threads = []
+        for layer, _ in LAYERS:
+            layer_timeout = min(LAYER_TIMEOUTS[layer], self.timeout)
+            thread = threading.Thread(target=self._run_layer, args=(layer, layer_timeout, results),
+                                      name=f"xiaoU-diagnose-{layer}", daemon=True)
+            thread.start()
+            threads.append(thread)
+        for thread in threads:
+            thread.join(max(deadline - time.monotonic(), 0))
+
+        layers = []
+        for layer, _ in LAYERS:
+            result = results.get(layer)
+            if result is None:
+                result = LayerResult(layer, False, f"超时（{round(min(LAYER_TIMEOUTS[layer], self.timeout), 1)}秒内未完成）",
+                                     time.monotonic() - started)
+            layers.append(result)
+        return Diagnosis(datetime.now(), layers, conclude(layers), time.monotonic() - started)
+
+    def _run_layer(self, layer, timeout, results):
+        started = time.monotonic()
+        try:
+            ok, detail = getattr(self, f"check_{layer}")(timeout)
+        except Exception as e:
+            ok, detail = False, str(e)
+        elapsed = time.monotonic() - started
+        if ok and elapsed > timeout:
+            # getaddrinfo 等无法设置超时的调用，超过本层的时限后才返回也按超时处理
+            ok, detail = False, f"超时（{round(elapsed, 1)}秒，超过{round(timeout, 1)}秒）: {detail}"
+        results[layer] = LayerResult(layer, ok, detail, elapsed)
+
+    def check_link(self, timeout):
+        """是否有已启用且配置了地址的网卡（不含回环）"""
+        stats = psutil.net_if_stats()
+        addresses = psutil.net_if_addrs()
+        up = []
+        for name, stat in stats.items():
+            if not stat.isup or name.startswith("lo"):
+                continue
+            ips = [addr.address for addr in addresses.get(name, ())
+                   if addr.family == socket.AF_INET and not addr.address.startswith("169.254.")]
+            if ips:
+                up.append(f"{name} ({', '.join(ips)})")
+        if not up:
+            down = [name for name, stat in stats.items() if not name.startswith("lo")]
+            return False, f"没有已启用并获得IPv4地址的网卡（网卡: {', '.join(down) or '无'}）"
+        return True, f"已启用: {', '.join(up)}"
+
+    def check_gateway(self, timeout):
+        """默认路由是否存在，网关是否可达"""
+        try:
+            route = default_gateway()
+        except OSError:
+            return None, "无法读取路由表（仅支持 Linux）"
+        if route is None:
+            return False, "没有默认路由"
+        gateway, interface = route
+        result = internet_check.probe_all([gateway], timeout, self.backend)[0]
+        return result.ok, f"{gateway} ({interface}): {internet_check.format_probe_result(result)}"
+
+    def check_dns_local(self, timeout):
+        """通过系统解析器（本地配置的DNS）解析域名，getaddrinfo 没有超时参数，由诊断的截止时间兜底"""
+        servers = ", ".join(local_nameservers()) or "未知"
+        try:
+            infos = socket.getaddrinfo(self.domain, None, socket.AF_INET, socket.SOCK_STREAM)
+        except socket.gaierror as e:
+            return False, f"解析 {self.domain} 失败（DNS: {servers}）: {e}"
+        return True, f"{self.domain} -> {infos[0][4][0]}（DNS: {servers}）"
+
+    def check_dns_public(self, timeout):
+        """直接向公共DNS服务器发送查询，绕过本地解析器"""
+        query_id = random.getrandbits(16)
+        try:
+            with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+                sock.settimeout(timeout)
+                sock.connect((self.dns_server, 53))
+                sock.send(_build_dns_query(query_id, self.domain))
+                deadline = time.monotonic() + timeout
+                while True:
+                    try:
+                        rcode, addresses = _parse_dns_response(sock.recv(512), query_id)
+                        break
+                    except ValueError:
+                        remaining = deadline - time.monotonic()
+                        if remaining <= 0:
+                            raise socket.timeout("timed out")
+                        sock.settimeout(remaining)  # 忽略不匹配的报文，继续等待
+        except OSError as e:
+            return False, f"{self.dns_server} 查询失败: {e}"
+        if rcode != 0 or not addresses:
+            return False, f"{self.dns_server} 解析 {self.domain} 失败（响应码 {rcode}）"
+        return True, f"{self.dns_server}: {self.domain} -> {addresses[0]}"
+
+    def check_tcp(self, timeout):
+        """直接按IP连接公网主机（不依赖DNS）"""
+        results = internet_check.probe_all(self.tcp_hosts, timeout, internet_check.TcpConnectBackend())
+        succeeded = [result for result in results if result.ok]
+        text = ", ".join(internet_check.format_probe_result(result) for result in (succeeded[:1] or results))
+        return bool(succeeded), f"端口53: {text}"
+
+    def check_http(self, timeout):
+        """请求 url，返回任意HTTP状态码都说明应用层可达"""
+        try:
+            with urllib_request.urlopen(self.url, timeout=timeout) as response:
+                status = response.status
+        except urllib_request.HTTPError as e:
+            status = e.code
+        return True, f"{self.url} 返回 {status}"
+
+def conclude(layers):
+    """根据各层结果推断故障位置"""
+    ok = {result.layer: result.ok for result in layers}
+    if ok["link"] is False:
+        return "本机网卡未连接或未获得地址"
+    if ok["gateway"] is False:
+        return "无法到达默认网关，故障在本机与路由器之间（局域网/路由器）"
+    if ok["tcp"] is False:
+        if ok["gateway"]:
+            return "网关可达但无法连接公网，故障在上游（宽带/运营商线路）"
+        return "无法连接公网"
+    if ok["dns_local"] is False and ok["dns_public"]:
+        return "公网连通，本地配置的DNS服务器无法解析"
+    if ok["dns_local"] is False or ok["dns_public"] is False:
+        return "公网连通，但DNS解析失败"
+    if ok["http"] is False:
+        return "DNS和TCP正常，HTTP请求失败（可能需要网页认证或被代理拦截）"
+    return "各层均正常（故障可能已恢复，或只影响探测使用的host）"
+
+def format_diagnosis(diagnosis):
+    """格式化诊断结果，每层一行，最后一行为推断的故障位置"""
+    state = {True: "正常", False: "失败", None: "未知"}
+    lines = [f"{LAYER_NAMES[result.layer]}: {state[result.ok]} - {result.detail} ({round(result.elapsed * 1000)}ms)"
+             for result in diagnosis.layers]
+    lines.append(f"结论: {diagnosis.conclusion}")
+    return lines
+
+def build_network_diagnoser():
+    """
+    根据环境变量创建网络诊断，XIAOU_DIAGNOSIS=0 时返回None
+    XIAOU_DIAGNOSIS_DNS: 公共DNS服务器，XIAOU_DIAGNOSIS_DOMAIN: 解析的域名，XIAOU_DIAGNOSIS_URL: 请求的地址
+    """
+    if os.environ.get("XIAOU_DIAGNOSIS", "1") == "0":
+        return None
+    return NetworkDiagnoser(
+        dns_server=os.environ.get("XIAOU_DIAGNOSIS_DNS", DEFAULT_DNS_SERVER),
+        domain=os.environ.get("XIAOU_DIAGNOSIS_DOMAIN", DEFAULT_DOMAIN),
+        url=os.environ.get("XIAOU_DIAGNOSIS_URL", DEFAULT_URL),
+    )
+
+if __name__ == "__main__":
+    diagnosis = NetworkDiagnoser().diagnose()
+    for line in format_diagnosis(diagnosis):
+        print(line)
+    print(f"耗时 {round(diagnosis.elapsed, 2)}秒")
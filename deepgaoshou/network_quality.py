@@ -0,0 +1,175 @@
+import os
+import threading
+import time
+from collections import namedtuple
+
+import internet_check
+from instrumentation import LatencyHistogram
+
+# 单个目标的质量统计：samples 为丢包率窗口内的探测数，loss 为丢包率（0~1），
+# jitter 和往返时间分位数单位为秒，没有数据时为None
+TargetReport = namedtuple("TargetReport", ["host", "samples", "loss", "jitter", "p50", "p95", "p99"])
+
+def _format_ms(seconds):
+    return "未知" if seconds is None else f"{round(seconds * 1000, 1)}ms"
+
+class TargetQuality:
+    """
+    单个目标的流式统计，内存占用固定
+    - 丢包率：最近 loss_window 次探测的结果（环形缓冲区）
+    - 抖动：同一轮探测中相邻往返时间之差，按 RFC 3550 的方式平滑（增益 1/16）
+    - 往返时间分位数：两个固定分桶直方图每 rotate_seconds 秒轮换一次，反映最近一到两个周期
+    """
+    def __init__(self, loss_window=60, rotate_seconds=600):
+        self.loss_window = loss_window
+        self.rotate_seconds = rotate_seconds
+        self.jitter = None
+        self._outcomes = bytearray(loss_window)   # 1 表示丢失
+        self._index = 0
+        self._filled = 0
+        self._lost = 0
+        self._last_rtt = None
+        self._current = LatencyHistogram()
+        self._previous = LatencyHistogram()
+        self._rotated_at = time.monotonic()
+
+    def new_train(self):
+        """开始新一轮探测，抖动只在同一轮内计算"""
+        self._last_rtt = None
+
+    def record(self, ok, rtt=None, now=None):
+        """记录一次探测结果，rtt 为往返时间（秒）"""
+        lost = 0 if ok else 1
+        if self._filled == self.loss_window:
+            self._lost -= self._outcomes[self._index]
+        else:
+            self._filled += 1
+        self._outcomes[self._index] = lost
+        self._lost += lost
+        self._index = (self._index + 1) % self.loss_window
+        if not ok:
+            self._last_rtt = None
+            return
+
+        now = time.monotonic() if now is None else now
+        if now - self._rotated_at >= self.rotate_seconds:
+            self._previous, self._current = self._current, LatencyHistogram()
+            self._rotated_at = now
+        self._current.observe(rtt)
+        if self._last_rtt is not None:
+            delta = abs(rtt - self._last_rtt)
+            self.jitter = delta if self.jitter is None else self.jitter + (delta - self.jitter) / 16
+        self._last_rtt = rtt
+
+    def report(self, host):
+        histogram = self._previous.copy().merge(self._current)
+        return TargetReport(
+            host, self._filled,
+            self._lost / self._filled if self._filled else None,
+            self.jitter,
+            histogram.percentile(0.5), histogram.percentile(0.95), histogram.percentile(0.99),
+        )
+
+class NetworkQualityMonitor:
+    """
+    持续测量网络质量，弥补联网检测只有通/断两种状态的不足
+    - 每轮对所有目标并发发送 train_length 个探测，间隔 spacing 秒，速率很低
+    - 超过半数的目标丢包率、抖动或往返时间 p95 超出阈值时判定为质量下降，
+      连续 confirm 轮结果一致才改变状态，避免偶发的慢响应触发告警
+    """
+    def __init__(self, hosts, backend=None, train_length=5, spacing=0.2, timeout=1,
+                 max_loss=0.05, max_jitter=0.03, max_rtt=0.3, confirm=2, min_samples=10):
+        self.hosts = list(hosts)
+        self.backend = backend
+        self.train_length = train_length
+        self.spacing = spacing
+        self.timeout = timeout
+        self.max_loss = max_loss
+        self.max_jitter = max_jitter
+        self.max_rtt = max_rtt
+        self.min_samples = min_samples
+        self.state = internet_check.StateHysteresis(down_checks=confirm, up_checks=confirm)  # True 表示质量正常
+        self._targets = {host: TargetQuality() for host in self.hosts}
+        self._lock = threading.Lock()
+        self._ready = threading.Event()
+
+    def run_train(self):
+        """
+        执行一轮探测并评估质量
+        返回: (Boolean, list) - (确认后的质量是否正常, 超出阈值的目标描述)
+        """
+        with self._lock:
+            for target in self._targets.values():
+                target.new_train()
+        for i in range(self.train_length):
+            started = time.monotonic()
+            results = internet_check.probe_all(self.hosts, self.timeout, self.backend)
+            now = time.monotonic()
+            with self._lock:
+                for result in results:
+                    self._targets[result.host].record(result.ok, result.rtt_us / 1e6 if result.ok else None, now)
+            if i < self.train_length - 1:
+                time.sleep(max(self.spacing - (now - started), 0))
+        self._ready.set()
+        return self.evaluate()
+
+    def wait_ready(self, timeout):
+        """等待第一轮测量完成，返回是否已有数据"""
+        return self._ready.wait(timeout)
+
+    def reports(self):
+        with self._lock:
+            return [target.report(host) for host, target in self._targets.items()]
+
+    def breaches(self, report):
+        """返回目标超出的阈值描述"""
+        problems = []
+        if report.loss is not None and report.loss > self.max_loss:
+            problems.append(f"丢包 {round(report.loss * 100, 1)}%")
+        if report.jitter is not None and report.jitter > self.max_jitter:
+            problems.append(f"抖动 {_format_ms(report.jitter)}")
+        if report.p95 is not None and report.p95 > self.max_rtt:
+            problems.append(f"往返时间p95 {_format_ms(report.p95)}")
+        return problems
+
+    def evaluate(self):
+        """按阈值评估当前统计，样本不足的目标不参与判断"""
+        measured = 0
+        details = []
+        for report in self.reports():
+            if report.samples < self.min_samples:
+                continue
+            measured += 1
+            problems = self.breaches(report)
+            if problems:
+                details.append(f"{report.host}: {', '.join(problems)}")
+        degraded = measured > 0 and len(details) * 2 > measured
+        return self.state.update(not degraded), details
+
+    def format_summary(self):
+        """格式化各目标的质量统计，每个目标一行（没有数据的目标不显示）"""
+        lines = []
+        for report in self.reports():
+            if not report.samples:
+                continue
+            lines.append(f"{report.host}: 丢包 {round(report.loss * 100, 1)}%, 抖动 {_format_ms(report.jitter)}, "
+                         f"往返时间 p50 {_format_ms(report.p50)} / p95 {_format_ms(report.p95)} / "
+                         f"p99 {_format_ms(report.p99)}")
+        return lines
+
+def build_quality_monitor():
+    """
+    根据环境变量创建网络质量监测，XIAOU_QUALITY=0 时返回None
+    XIAOU_QUALITY_HOSTS: 测量目标（逗号分隔，默认取探测host列表的前3个）
+    XIAOU_QUALITY_LOSS / XIAOU_QUALITY_JITTER / XIAOU_QUALITY_RTT: 丢包率（%）、抖动（毫秒）、往返时间p95（毫秒）阈值
+    """
+    if os.environ.get("XIAOU_QUALITY", "1") == "0":
+        return None
+    spec = os.environ.get("XIAOU_QUALITY_HOSTS", "")
+    hosts = [host.strip() for host in spec.split(",") if host.strip()] or internet_check.get_default_hosts()[:3]
+    return NetworkQualityMonitor(
+        hosts,
+        max_loss=float(os.environ.get("XIAOU_QUALITY_LOSS", 5)) / 100,
+        max_jitter=float(os.environ.get("XIAOU_QUALITY_JITTER", 30)) / 1000,
+        max_rtt=float(os.environ.get("XIAOU_QUALITY_RTT", 300)) / 1000,
+    )
@@ -0,0 +1,382 @@
+import heapq
+import itertools
+import os
+import random
+import threading
+import time
+from datetime import datetime
+
+import notifier
+from notifier import SEVERITIES, SEVERITY_WARNING, SEVERITY_CRITICAL
+
+# 消息优先级，数值越小越先发送
+PRIORITY_HIGH = 0
+PRIORITY_NORMAL = 1
+
+def _log(message):
+    """统一的日志输出函数"""
+    timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    print(f"[{timestamp}] {message}", flush=True)
+
+class TokenBucket:
+    """令牌桶：每小时补充 rate_per_hour 个令牌，最多积攒 burst 个，每发送一条通知消耗一个"""
+    def __init__(self, rate_per_hour, burst):
+        self.rate = rate_per_hour / 3600
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+
+    def _refill(self, now):
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, now):
+        """距离有可用令牌还需等待的秒数"""
+        self._refill(now)
+        return 0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+
+    def take(self, now):
+        """消耗一个令牌（没有可用令牌时不消耗），返回是否取到"""
+        self._refill(now)
+        if self.tokens < 1:
+            return False
+        self.tokens -= 1
+        return True
+
+class Notification:
+    """待发送的通知"""
+    def __init__(self, subject, content, priority, on_result, max_retries, severity=SEVERITY_WARNING,
+                 channels=None):
+        self.subject = subject
+        self.content = content
+        self.priority = priority
+        self.on_result = on_result
+        self.max_retries = max_retries
+        self.severity = severity
+        # 紧急通知（严重级别或高优先级）立即发送，不参与合并，也不受速率限制
+        self.urgent = severity == SEVERITY_CRITICAL or priority == PRIORITY_HIGH
+        self.channels = channels  # 发往的渠道，None 表示按级别路由；重试时只发往上次失败的渠道
+        self.delivered = False    # 是否已有渠道送达
+        self.reported = False     # 是否已调用 on_result
+        self.attempts = 0
+        self.enqueued_at = time.monotonic()
+
+class NotificationQueue:
+    """
+    有界的外发通知队列，由独立的发送线程消费
+    - 监控线程只负责入队，不再等待邮件发送
+    - 发送失败按指数退避加随机抖动重试
+    - 队列满时高优先级消息挤掉最新的普通消息
+    - 默认由 notifier 按级别分发到各渠道，部分渠道失败时只重试失败的渠道
+    - 非紧急通知在 digest_window 秒内合并为一封汇总通知；设置速率上限后，
+      令牌用完时非紧急通知继续积攒，等有令牌时再合并发送，紧急通知始终立即发送
+    """
+    def __init__(self, send_func=None, maxsize=100, max_retries=5,
+                 base_delay=5, max_delay=300, digest_window=0, rate_limit=None):
+        # send_func(subject, content) -> bool 替代渠道分发，用于测试
+        self.send_func = send_func
+        self.maxsize = maxsize
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+        self.digest_window = digest_window
+        self.rate_limit = rate_limit   # TokenBucket，None 表示不限速
+
+        self._ready = []      # (priority, seq, Notification)
+        self._delayed = []    # (ready_at, seq, Notification)
+        self._digest = []     # 等待合并发送的非紧急通知
+        self._digest_due = None
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+        self._worker = None
+        self._stopping = False
+        self._listeners = []
+
+        self._stats = {
+            "enqueued": 0,
+            "sent": 0,
+            "failed": 0,
+            "retries": 0,
+            "dropped": 0,
+            "digested": 0,
+            "digests": 0,
+        }
+        self._send_count = 0
+        self._send_time_total = 0.0
+        self._send_time_max = 0.0
+        self._last_send_time = 0.0
+        self._delivery_time_total = 0.0
+
+    def add_listener(self, listener):
+        """
+        注册发送监听器，每次发送尝试后以 listener(subject, success, elapsed) 调用
+        elapsed 为本次发送耗时（秒），在发送线程中执行，应尽量轻量
+        """
+        self._listeners.append(listener)
+
+    def configure(self, digest_window, rate_per_hour=0, burst=5):
+        """
+        设置合并窗口（秒，0 表示不合并）和每小时发送上限（0 表示不限）
+        """
+        with self._cond:
+            self.digest_window = digest_window
+            self.rate_limit = TokenBucket(rate_per_hour, burst) if rate_per_hour > 0 else None
+            self._cond.notify()
+
+    def enqueue(self, subject, content, priority=PRIORITY_NORMAL, on_result=None, max_retries=None,
+                severity=SEVERITY_WARNING, channels=None):
+        """
+        将通知加入队列，立即返回
+        on_result: 首次有渠道送达或放弃重试后以 on_result(bool) 回调一次（在发送线程中执行），
+                   其余失败的渠道之后继续在后台重试
+        severity: 通知级别，决定发往哪些渠道
+        channels: 指定发往的渠道，不按级别路由
+        返回: Boolean - 是否成功入队
+        """
+        notification = Notification(
+            subject, content, priority, on_result,
+            self.max_retries if max_retries is None else max_retries, severity,
+            list(channels) if channels is not None else None
+        )
+        with self._cond:
+            if not notification.urgent and (self.digest_window > 0 or self.rate_limit is not None):
+                return self._add_to_digest(notification)
+            if self._depth() >= self.maxsize and not self._evict_for(priority):
+                self._stats["dropped"] += 1
+                _log(f"通知队列已满，丢弃消息: {subject}")
+                return False
+            heapq.heappush(self._ready, (priority, next(self._seq), notification))
+            self._stats["enqueued"] += 1
+            self._ensure_worker()
+            self._cond.notify()
+        return True
+
+    def _add_to_digest(self, notification):
+        """加入待合并列表（调用方需持有锁）"""
+        if len(self._digest) >= self.maxsize:
+            self._stats["dropped"] += 1
+            _log(f"待合并通知过多，丢弃消息: {notification.subject}")
+            return False
+        self._digest.append(notification)
+        if self._digest_due is None:
+            self._digest_due = notification.enqueued_at + self.digest_window
+        self._stats["enqueued"] += 1
+        self._ensure_worker()
+        self._cond.notify()
+        return True
+
+    def _flush_digest(self, now):
+        """
+        把待合并的通知按发往的渠道分组合并（调用方需持有锁），每组只有一条时原样发送
+        每组合并后的通知消耗一个令牌，没有令牌的组留在待合并列表中，等有令牌后再发送
+        返回: 合并后的通知列表
+        """
+        items, self._digest, self._digest_due = self._digest, [], None
+        groups = {}
+        for item in items:
+            key = tuple(item.channels) if item.channels is not None else None
+            groups.setdefault(key, []).append(item)
+        flushed = []
+        for group in groups.values():
+            if self.rate_limit is not None and not self.rate_limit.take(now):
+                self._digest.extend(group)
+            else:
+                flushed.append(self._merge(group))
+        if self._digest:
+            self._digest_due = now
+        return flushed
+
+    def _merge(self, items):
+        """合并同一组的通知（调用方需持有锁）"""
+        if len(items) == 1:
+            return items[0]
+        self._stats["digested"] += len(items)
+        self._stats["digests"] += 1
+        sections = [f"【{item.subject}】\n{item.content}" for item in items]
+        content = f"以下 {len(items)} 条通知合并发送：\n\n" + "\n\n".join(sections)
+        severity = max((item.severity for item in items), key=SEVERITIES.index)
+
+        def on_result(success):
+            for item in items:
+                if item.on_result is not None:
+                    try:
+                        item.on_result(success)
+                    except Exception as e:
+                        _log(f"通知回调出错: {e}")
+
+        digest = Notification(f"小悠汇总通知（{len(items)}条）", content, PRIORITY_NORMAL, on_result,
+                              max(item.max_retries for item in items), severity, items[0].channels)
+        digest.enqueued_at = min(item.enqueued_at for item in items)
+        return digest
+
+    def _depth(self):
+        return len(self._ready) + len(self._delayed)
+
+    def _evict_for(self, priority):
+        """队列满时为更高优先级的消息腾出位置（调用方需持有锁）"""
+        candidates = [(item[2].priority, item[1], heap, item)
+                      for heap in (self._ready, self._delayed) for item in heap]
+        if not candidates:
+            return False
+        victim_priority, _, heap, item = max(candidates, key=lambda c: (c[0], c[1]))
+        if victim_priority <= priority:
+            return False
+        heap.remove(item)
+        heapq.heapify(heap)
+        self._stats["dropped"] += 1
+        _log(f"通知队列已满，丢弃低优先级消息: {item[2].subject}")
+        return True
+
+    def _ensure_worker(self):
+        if self._worker is None or not self._worker.is_alive():
+            self._stopping = False
+            self._worker = threading.Thread(target=self._run, name="notification-sender", daemon=True)
+            self._worker.start()
+
+    def _next_notification(self):
+        """取出下一条到期的通知，没有时阻塞等待（调用方需持有锁）"""
+        while not self._stopping:
+            now = time.monotonic()
+            while self._delayed and self._delayed[0][0] <= now:
+                _, seq, notification = heapq.heappop(self._delayed)
+                heapq.heappush(self._ready, (notification.priority, seq, notification))
+            timeouts = [self._delayed[0][0] - now] if self._delayed else []
+            if self._digest:
+                if now < self._digest_due:
+                    timeouts.append(self._digest_due - now)
+                else:
+                    wait = self.rate_limit.wait_time(now) if self.rate_limit is not None else 0
+                    if wait > 0:
+                        timeouts.append(wait)  # 令牌用完，继续积攒直到有令牌
+                    else:
+                        for notification in self._flush_digest(now):
+                            heapq.heappush(self._ready, (notification.priority, next(self._seq), notification))
+            if self._ready:
+                notification = heapq.heappop(self._ready)[2]
+                if notification.urgent and notification.attempts == 0 and self.rate_limit is not None:
+                    self.rate_limit.take(now)  # 紧急通知不等待，但同样计入发送量
+                return notification
+            self._cond.wait(min(timeouts) if timeouts else None)
+        return None
+
+    def _backoff(self, attempts):
+        """指数退避，叠加 0~50% 的随机抖动，避免多条消息同时重试"""
+        delay = min(self.max_delay, self.base_delay * (2 ** (attempts - 1)))
+        return delay * (1 + random.random() * 0.5)
+
+    def _run(self):
+        """发送线程主循环"""
+        while True:
+            with self._cond:
+                notification = self._next_notification()
+            if notification is None:
+                return
+
+            notification.attempts += 1
+            start = time.monotonic()
+            try:
+                success = self._send(notification)
+            except Exception as e:
+                _log(f"通知发送出错: {e}")
+                success = False
+            finished = time.monotonic()
+            for listener in self._listeners:
+                try:
+                    listener(notification.subject, success, finished - start)
+                except Exception as e:
+                    _log(f"通知监听器出错: {e}")
+
+            retrying = False
+            with self._cond:
+                self._record_send_time(finished - start)
+                if success:
+                    self._stats["sent"] += 1
+                    self._delivery_time_total += finished - notification.enqueued_at
+                elif notification.attempts <= notification.max_retries:
+                    retrying = True
+                    self._stats["retries"] += 1
+                    delay = self._backoff(notification.attempts)
+                    heapq.heappush(self._delayed, (finished + delay, next(self._seq), notification))
+                    _log(f"通知发送失败，{delay:.1f}秒后第{notification.attempts}次重试: {notification.subject}")
+                else:
+                    self._stats["failed"] += 1
+                    _log(f"通知重试{notification.max_retries}次后仍发送失败，放弃: {notification.subject}")
+
+            # 已有渠道送达时立即回调成功，不必等待其余渠道重试结束
+            if notification.on_result is not None and not notification.reported and (
+                    notification.delivered or not retrying):
+                notification.reported = True
+                try:
+                    notification.on_result(notification.delivered)
+                except Exception as e:
+                    _log(f"通知回调出错: {e}")
+
+    def _send(self, notification):
+        """发送一次通知，返回是否所有渠道都已送达"""
+        if self.send_func is not None:
+            success = self.send_func(notification.subject, notification.content)
+            notification.delivered = notification.delivered or success
+            return success
+        targets = notification.channels
+        if targets is None:
+            targets = notifier.get_notifier().targets(notification.severity)
+        failed = notifier.get_notifier().send(notification.subject, notification.content,
+                                              notification.severity, targets)
+        if not failed or len(failed) < len(targets):
+            notification.delivered = True
+        notification.channels = failed
+        return not failed
+
+    def _record_send_time(self, elapsed):
+        self._send_count += 1
+        self._send_time_total += elapsed
+        self._send_time_max = max(self._send_time_max, elapsed)
+        self._last_send_time = elapsed
+
+    def get_stats(self):
+        """
+        获取队列统计信息
+        返回: dict - 队列深度、发送计数以及发送耗时（毫秒）
+        """
+        with self._cond:
+            stats = dict(self._stats)
+            stats["depth"] = self._depth() + len(self._digest)
+            stats["waiting_digest"] = len(self._digest)
+            stats["waiting_retry"] = len(self._delayed)
+            stats["avg_send_ms"] = round(self._send_time_total / self._send_count * 1000, 2) if self._send_count else 0
+            stats["max_send_ms"] = round(self._send_time_max * 1000, 2)
+            stats["last_send_ms"] = round(self._last_send_time * 1000, 2)
+            stats["avg_delivery_ms"] = round(self._delivery_time_total / stats["sent"] * 1000, 2) if stats["sent"] else 0
+        return stats
+
+    def format_stats(self):
+        """格式化统计信息用于日志输出"""
+        stats = self.get_stats()
+        return (f"队列深度 {stats['depth']} (待重试 {stats['waiting_retry']}, 待合并 {stats['waiting_digest']}), "
+                f"已发送 {stats['sent']}, 失败 {stats['failed']}, 重试 {stats['retries']}, 丢弃 {stats['dropped']}, "
+                f"合并 {stats['digested']} 条为 {stats['digests']} 封, "
+                f"平均发送耗时 {stats['avg_send_ms']}ms, 最长 {stats['max_send_ms']}ms")
+
+    def stop(self, timeout=None):
+        """停止发送线程（队列中未发送的消息将被丢弃）"""
+        with self._cond:
+            self._stopping = True
+            self._cond.notify_all()
+        if self._worker is not None:
+            self._worker.join(timeout)
+
+# 全局实例
+notification_queue = NotificationQueue()
+
+def configure_notification_queue():
+    """
+    根据环境变量设置全局队列的合并与限速
+    XIAOU_DIGEST_WINDOW: 非紧急通知的合并窗口（秒，0=不合并）
+    XIAOU_NOTIFY_RATE / XIAOU_NOTIFY_BURST: 每小时最多发送的通知数（0=不限）和可积攒的突发数
+    """
+    notification_queue.configure(
+        float(os.environ.get("XIAOU_DIGEST_WINDOW", 60)),
+        float(os.environ.get("XIAOU_NOTIFY_RATE", 20)),
+        int(os.environ.get("XIAOU_NOTIFY_BURST", 5)),
+    )
@@ -0,0 +1,298 @@
+import json
+import os
+import socket
+import threading
+import time
+from datetime import datetime
+
+import email_sender
+import instrumentation
+from lazy_import import LazyModule
+from metrics import metrics
+from scheduler import WorkerPool
+
+# 只有配置了 webhook 渠道时才需要
+urllib_request = LazyModule("urllib.request")
+
+# 通知级别
+SEVERITY_INFO = "info"
+SEVERITY_WARNING = "warning"
+SEVERITY_CRITICAL = "critical"
+SEVERITIES = (SEVERITY_INFO, SEVERITY_WARNING, SEVERITY_CRITICAL)
+
+def _log(message):
+    """统一的日志输出函数"""
+    timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    print(f"[{timestamp}] {message}", flush=True)
+
+class SMTPChannel:
+    """邮件渠道，通过复用的SMTP会话发送"""
+    name = "smtp"
+
+    def __init__(self, from_addr, to_addrs, session_manager=None, timeout=30):
+        self.from_addr = from_addr
+        self.to_addrs = to_addrs
+        self.session_manager = session_manager
+        self.timeout = timeout
+
+    def send(self, subject, content, severity):
+        if not (self.from_addr and self.to_addrs):
+            raise ValueError("邮件配置信息不完整")
+        session = self.session_manager or email_sender.get_session_manager()
+        msg = email_sender.build_message(self.from_addr, self.to_addrs, subject, content)
+        session.sendmail(self.from_addr, self.to_addrs, msg)
+
+class WebhookChannel:
+    """HTTP webhook 渠道，以 JSON 格式 POST 通知内容，非 2xx 响应视为失败"""
+    name = "webhook"
+
+    def __init__(self, url, timeout=10):
+        self.url = url
+        self.timeout = timeout
+
+    def send(self, subject, content, severity):
+        body = json.dumps({
+            "subject": subject,
+            "content": content,
+            "severity": severity,
+            "host": socket.gethostname(),
+            "time": datetime.now().isoformat(timespec="seconds"),
+        }, ensure_ascii=False).encode("utf-8")
+        request = urllib_request.Request(
+            self.url, data=body, method="POST",
+            headers={"Content-Type": "application/json; charset=utf-8"},
+        )
+        # urlopen 对 4xx/5xx 响应抛出 HTTPError
+        with urllib_request.urlopen(request, timeout=self.timeout) as response:
+            response.read()
+
+class SyslogChannel:
+    """
+    本地 syslog 渠道，向 /dev/log 发送数据报（systemd 系统上由 journald 接收）
+    address 为 host:port 时改为发往远程 syslog 的 UDP 端口
+    """
+    name = "syslog"
+    FACILITY_DAEMON = 3
+    PRIORITIES = {SEVERITY_CRITICAL: 2, SEVERITY_WARNING: 4, SEVERITY_INFO: 6}
+
+    def __init__(self, address="/dev/log", ident="xiaoU", timeout=5, max_bytes=8192):
+        self.address = address
+        self.ident = ident
+        self.timeout = timeout
+        self.max_bytes = max_bytes
+
+    def _target(self):
+        if self.address.startswith("/"):
+            return socket.AF_UNIX, self.address
+        host, _, port = self.address.rpartition(":")
+        return socket.AF_INET, (host, int(port))
+
+    def send(self, subject, content, severity):
+        # syslog 每条记录一行，把多行内容合并
+        text = " ".join(line.strip() for line in content.splitlines() if line.strip())
+        priority = self.FACILITY_DAEMON * 8 + self.PRIORITIES.get(severity, 6)
+        message = f"<{priority}>{self.ident}[{os.getpid()}]: {subject} {text}"
+        data = message.encode("utf-8")[:self.max_bytes].decode("utf-8", "ignore").encode("utf-8")
+        family, target = self._target()
+        with socket.socket(family, socket.SOCK_DGRAM) as sock:
+            sock.settimeout(self.timeout)
+            sock.sendto(data, target)
+
+class FileChannel:
+    """文件渠道，每条通知追加一行 JSON"""
+    name = "file"
+
+    def __init__(self, path, timeout=5):
+        self.path = path
+        self.timeout = timeout
+        self._lock = threading.Lock()
+
+    def send(self, subject, content, severity):
+        record = json.dumps({
+            "time": datetime.now().isoformat(timespec="seconds"),
+            "severity": severity,
+            "subject": subject,
+            "content": content,
+        }, ensure_ascii=False)
+        with self._lock:
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(record + "\n")
+
+class _Delivery:
+    """一次渠道发送，在工作线程中执行，由分发线程等待结果"""
+    def __init__(self, channel):
+        self.channel = channel
+        self.deadline = time.monotonic() + channel.timeout
+        self.error = None
+        self._done = threading.Event()
+
+    def run(self, subject, content, severity):
+        start = time.perf_counter()
+        try:
+            self.channel.send(subject, content, severity)
+        except Exception as e:
+            self.error = e
+        finally:
+            instrumentation.observe("notify_channel", time.perf_counter() - start, channel=self.channel.name)
+            self._done.set()
+
+    def wait(self):
+        """等待发送结束，返回错误描述，成功时返回None"""
+        if not self._done.wait(max(self.deadline - time.monotonic(), 0)):
+            return f"超过{self.channel.timeout}秒未完成"
+        return None if self.error is None else str(self.error)
+
+class Notifier:
+    """
+    把一条通知并发分发到多个渠道
+    - 各渠道在共享的工作线程池中同时发送，每个渠道有独立的超时，慢渠道不会拖慢其他渠道
+    - routes 按级别选择渠道 {级别: [渠道名]}，未列出的级别发往所有渠道
+    - send 返回失败的渠道，重试时只重发这些渠道，已送达的渠道不会收到重复通知
+    """
+    def __init__(self, channels, routes=None, workers=None):
+        self.channels = {channel.name: channel for channel in channels}
+        self.routes = routes or {}
+        # 线程数不少于渠道数的两倍，超时仍未返回的发送不会立即占满线程池；
+        # 超过两倍超时仍未返回的线程由看门狗放弃并补充
+        self.pool = WorkerPool(workers or max(4, 2 * len(self.channels)), name="xiaoU-notify")
+        self._started = False
+        self._lock = threading.Lock()
+
+    def targets(self, severity):
+        """该级别的通知需要发往的渠道"""
+        names = self.routes.get(severity)
+        if names is None:
+            return list(self.channels)
+        return [name for name in names if name in self.channels]
+
+    def send(self, subject, content, severity=SEVERITY_WARNING, channels=None):
+        """
+        发送通知
+        channels: 只发往这些渠道（重试时传入上次失败的渠道），默认按级别路由；
+                  未启用的渠道被忽略，全部未启用时按级别路由
+        返回: list - 发送失败的渠道名，全部成功时为空列表
+        """
+        with self._lock:
+            if not self._started:
+                self.pool.start()
+                self._started = True
+        names = None
+        if channels is not None:
+            names = [name for name in channels if name in self.channels]
+            if len(names) < len(channels):
+                _log(f"忽略未启用的通知渠道: {', '.join(name for name in channels if name not in self.channels)}")
+        if not names:
+            names = self.targets(severity)
+        deliveries = []
+        for name in names:
+            delivery = _Delivery(self.channels[name])
+            self.pool.submit(delivery.run, subject, content, severity,
+                             name=f"notify:{name}", timeout=2 * delivery.channel.timeout)
+            deliveries.append(delivery)
+
+        failed = []
+        for delivery in deliveries:
+            error = delivery.wait()
+            name = delivery.channel.name
+            metrics.inc("xiaou_notifications", channel=name, result="failure" if error else "success")
+            if error is not None:
+                failed.append(name)
+                _log(f"通知渠道 {name} 发送失败: {error}")
+        return failed
+
+    def stop(self):
+        if self._started:
+            self.pool.stop()
+
+def _parse_list(spec):
+    return [item.strip().lower() for item in spec.split(",") if item.strip()]
+
+def parse_routes(spec, channel_names):
+    """
+    解析路由规则，如 critical=*;warning=smtp,webhook;info=smtp
+    * 表示所有渠道，留空表示该级别不发送
+    """
+    routes = {}
+    for rule in spec.split(";"):
+        if not rule.strip():
+            continue
+        severity, _, names = rule.partition("=")
+        severity = severity.strip().lower()
+        if severity not in SEVERITIES:
+            raise ValueError(f"未知的通知级别: {severity}")
+        names = _parse_list(names)
+        routes[severity] = list(channel_names) if "*" in names else names
+    return routes
+
+def _parse_timeouts(spec, default):
+    """解析超时配置：单个数字对所有渠道生效，也可按渠道设置，如 10,smtp=30"""
+    timeouts = {}
+    for item in spec.split(","):
+        name, sep, value = item.rpartition("=")
+        if not value.strip():
+            continue
+        if sep:
+            timeouts[name.strip().lower()] = float(value)
+        else:
+            default = float(value)
+    return default, timeouts
+
+def build_notifier():
+    """
+    根据环境变量创建通知分发器
+    XIAOU_NOTIFY_CHANNELS: 启用的渠道（逗号分隔，smtp/webhook/syslog/file/collector，默认 smtp）
+    XIAOU_NOTIFY_ROUTES: 按级别选择渠道，如 critical=*;warning=smtp,webhook;info=smtp
+    XIAOU_NOTIFY_TIMEOUT: 渠道发送超时（秒），可按渠道设置
+    XIAOU_WEBHOOK_URL / XIAOU_SYSLOG_ADDRESS / XIAOU_NOTIFY_FILE: 各渠道的目标地址
+    """
+    default_timeout, timeouts = _parse_timeouts(os.environ.get("XIAOU_NOTIFY_TIMEOUT", ""), 30)
+    channels = []
+    for name in _parse_list(os.environ.get("XIAOU_NOTIFY_CHANNELS", "smtp")):
+        timeout = timeouts.get(name, default_timeout)
+        if name == "smtp":
+            channels.append(SMTPChannel(
+                os.environ.get("ENV_EMLADDR"),
+                email_sender.parse_recipients(os.environ.get("ENV_EMLNOTION2")),
+                timeout=timeout,
+            ))
+        elif name == "webhook":
+            url = os.environ.get("XIAOU_WEBHOOK_URL")
+            if not url:
+                _log("未设置 XIAOU_WEBHOOK_URL，跳过 webhook 渠道")
+                continue
+            channels.append(WebhookChannel(url, timeout=timeout))
+        elif name == "syslog":
+            channels.append(SyslogChannel(os.environ.get("XIAOU_SYSLOG_ADDRESS", "/dev/log"), timeout=timeout))
+        elif name == "file":
+            path = os.environ.get("XIAOU_NOTIFY_FILE")
+            if not path:
+                _log("未设置 XIAOU_NOTIFY_FILE，跳过文件渠道")
+                continue
+            channels.append(FileChannel(path, timeout=timeout))
+        elif name == "collector":
+            import fleet
+            agent = fleet.get_agent()
+            if agent is None:
+                _log("未设置 XIAOU_COLLECTOR，跳过集群汇总渠道")
+                continue
+            channels.append(fleet.FleetChannel(agent, timeout=timeout))
+        else:
+            _log(f"未知的通知渠道: {name}")
+    names = [channel.name for channel in channels]
+    routes = parse_routes(os.environ.get("XIAOU_NOTIFY_ROUTES", ""), names)
+    for severity, targets in routes.items():
+        for name in targets:
+            if name not in names:
+                _log(f"通知路由 {severity} 中的渠道 {name} 未启用，已忽略")
+    return Notifier(channels, routes)
+
+_notifier = None
+_notifier_lock = threading.Lock()
+
+def get_notifier():
+    """获取全局通知分发器，首次调用时根据环境变量创建"""
+    global _notifier
+    with _notifier_lock:
+        if _notifier is None:
+            _notifier = build_notifier()
+        return _notifier
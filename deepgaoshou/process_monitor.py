@@ -0,0 +1,206 @@
+import heapq
+import os
+import threading
+import time
+from collections import namedtuple
+from datetime import datetime
+
+from disk_analyzer import format_size
+from lazy_import import LazyModule
+
+psutil = LazyModule("psutil")  # 首次采样时才导入
+
+# 一次采样后的排名：cpu 为 [(pid, 进程名, 占单核百分比)]，memory 为 [(pid, 进程名, 常驻内存字节数)]，
+# io 为 [(pid, 进程名, 每秒读写字节数)]；processes 为跟踪的进程数，refreshed 为本轮读取的进程数
+ProcessReport = namedtuple("ProcessReport", ["cpu", "memory", "io", "processes", "refreshed", "elapsed"])
+
+def _log(message):
+    """统一的日志输出函数"""
+    timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    print(f"[{timestamp}] {message}", flush=True)
+
+class _Tracked:
+    """缓存的进程句柄和上次读取的累计值"""
+    __slots__ = ("process", "name", "slot", "read_at", "cpu_time", "io_bytes", "has_io",
+                 "cpu_rate", "io_rate", "rss")
+
+    def __init__(self, process, slot):
+        self.process = process
+        self.name = None
+        self.slot = slot
+        self.read_at = None
+        self.cpu_time = 0.0
+        self.io_bytes = 0
+        self.has_io = True     # 无权限读取 IO 计数的进程以后不再尝试
+        self.cpu_rate = 0.0    # 最近一次读取得到的CPU占用（秒/秒）
+        self.io_rate = 0.0     # 最近一次读取得到的读写速度（字节/秒）
+        self.rss = 0
+
+    @property
+    def active(self):
+        return self.cpu_rate > 0 or self.io_rate > 0
+
+class ProcessMonitor:
+    """
+    按进程统计CPU、内存和磁盘IO，找出占用最多的进程
+    - 缓存 psutil.Process 句柄，每轮只列一次 PID，只为新出现的进程创建句柄，已退出的进程直接丢弃
+    - 每个进程的属性在 oneshot() 中批量读取
+    - 增量刷新：上一次读取时有CPU或IO活动的进程每轮都读取，空闲进程按 PID 分组轮流读取，
+      每 idle_every 轮读取一次；主机上数千个进程大多处于睡眠状态，每轮实际读取的只是其中一小部分
+    - 各排名只保留前 top_n 个（有界堆）
+    - 记录每轮采样自身消耗的CPU时间，超过 max_cpu_share 时由 suggest_interval 拉长采样间隔
+    """
+    def __init__(self, top_n=5, interval=15, idle_every=8, max_cpu_share=0.01):
+        self.top_n = top_n
+        self.interval = interval
+        self.idle_every = idle_every
+        self.max_cpu_share = max_cpu_share
+        self.last_report = None
+        self.last_cost = 0.0   # 上一轮采样消耗的CPU时间（秒）
+        self._tracked = {}     # pid -> _Tracked
+        self._round = 0
+        self._lock = threading.Lock()   # 同一时间只进行一次采样
+
+    def sample(self):
+        """
+        执行一轮采样并更新排名
+        返回: ProcessReport
+        """
+        with self._lock:
+            return self._sample()
+
+    def report(self):
+        """最近一次的排名，尚未采样时先采样一次（此时只有内存排名）"""
+        with self._lock:
+            if self.last_report is None:
+                return self._sample()
+            return self.last_report
+
+    def _sample(self):
+        started = time.monotonic()
+        cpu_started = time.thread_time()
+        self._round += 1
+        current = set(psutil.pids())
+        for pid in list(self._tracked):
+            if pid not in current:
+                del self._tracked[pid]
+
+        refreshed = 0
+        for pid in current:
+            tracked = self._tracked.get(pid)
+            if tracked is None:
+                try:
+                    tracked = self._tracked[pid] = _Tracked(psutil.Process(pid), pid % self.idle_every)
+                except psutil.Error:
+                    continue  # 列出 PID 后进程已退出
+            elif not tracked.active and self._round % self.idle_every != tracked.slot:
+                continue
+            refreshed += 1
+            if not self._read(tracked):
+                del self._tracked[pid]
+
+        report = self._rank(refreshed, time.monotonic() - started)
+        self.last_report = report
+        self.last_cost = time.thread_time() - cpu_started
+        return report
+
+    @property
+    def baseline(self):
+        """是否为首轮采样，首轮需要为所有进程创建句柄，开销不代表之后的增量采样"""
+        return self._round <= 1
+
+    def _read(self, tracked):
+        """读取进程的累计CPU时间、常驻内存和IO计数，进程已退出时返回False"""
+        process = tracked.process
+        now = time.monotonic()
+        try:
+            with process.oneshot():
+                if tracked.name is None:
+                    tracked.name = process.name()
+                cpu = process.cpu_times()
+                cpu_time = cpu.user + cpu.system
+                tracked.rss = process.memory_info().rss
+                io_bytes = 0
+                if tracked.has_io:
+                    try:
+                        io = process.io_counters()
+                        io_bytes = io.read_bytes + io.write_bytes
+                    except (psutil.AccessDenied, AttributeError, NotImplementedError):
+                        tracked.has_io = False  # 没有权限或平台不支持（macOS）
+        except psutil.NoSuchProcess:
+            return False
+        except psutil.AccessDenied:
+            return True    # 保留句柄，避免每轮重新创建
+
+        if tracked.read_at is not None and cpu_time >= tracked.cpu_time:
+            elapsed = max(now - tracked.read_at, 1e-6)
+            tracked.cpu_rate = (cpu_time - tracked.cpu_time) / elapsed
+            tracked.io_rate = max(io_bytes - tracked.io_bytes, 0) / elapsed
+        else:
+            # 首次读取，或累计CPU时间变小（PID 被复用），重新建立基准
+            tracked.cpu_rate = tracked.io_rate = 0.0
+        tracked.read_at = now
+        tracked.cpu_time = cpu_time
+        tracked.io_bytes = io_bytes
+        return True
+
+    def _rank(self, refreshed, elapsed):
+        tracked = self._tracked
+        cpu = heapq.nlargest(self.top_n, ((t.cpu_rate, pid) for pid, t in tracked.items() if t.cpu_rate > 0))
+        memory = heapq.nlargest(self.top_n, ((t.rss, pid) for pid, t in tracked.items()))
+        io = heapq.nlargest(self.top_n, ((t.io_rate, pid) for pid, t in tracked.items() if t.io_rate > 0))
+        return ProcessReport(
+            [(pid, tracked[pid].name, round(rate * 100, 1)) for rate, pid in cpu],
+            [(pid, tracked[pid].name, rss) for rss, pid in memory],
+            [(pid, tracked[pid].name, rate) for rate, pid in io],
+            len(tracked), refreshed, elapsed,
+        )
+
+    def suggest_interval(self):
+        """根据上一轮采样的开销建议下次采样间隔，保证CPU占用不超过 max_cpu_share"""
+        if self.baseline:
+            return self.interval
+        return max(self.interval, self.last_cost / self.max_cpu_share)
+
+    def format_summary(self, report=None):
+        """格式化排名（默认为最近一次），每项一行，尚未采样时返回空列表"""
+        report = report or self.last_report
+        if report is None:
+            return []
+        lines = []
+        if report.cpu:
+            lines.append("CPU: " + ", ".join(f"{name}({pid}) {percent}%" for pid, name, percent in report.cpu))
+        if report.memory:
+            lines.append("内存: " + ", ".join(f"{name}({pid}) {format_size(rss)}" for pid, name, rss in report.memory))
+        if report.io:
+            lines.append("磁盘IO: " + ", ".join(f"{name}({pid}) {format_size(rate)}/s"
+                                                for pid, name, rate in report.io))
+        return lines
+
+def build_process_monitor():
+    """
+    根据环境变量创建进程监控，XIAOU_PROCESS_MONITOR=0 时返回None
+    XIAOU_PROCESS_INTERVAL: 采样间隔（秒），XIAOU_PROCESS_TOP: 各排名保留的进程数
+    """
+    if os.environ.get("XIAOU_PROCESS_MONITOR", "1") == "0":
+        return None
+    return ProcessMonitor(
+        top_n=int(os.environ.get("XIAOU_PROCESS_TOP", 5)),
+        interval=float(os.environ.get("XIAOU_PROCESS_INTERVAL", 15)),
+    )
+
+if __name__ == "__main__":
+    import sys
+    monitor = ProcessMonitor()
+    rounds = int(sys.argv[1]) if len(sys.argv) > 1 else 17
+    cost = 0.0
+    for i in range(rounds):
+        report = monitor.sample()
+        cost += monitor.last_cost
+        print(f"第{i + 1}轮: 跟踪 {report.processes} 个进程, 读取 {report.refreshed} 个, "
+              f"CPU {round(monitor.last_cost * 1000, 1)}ms, 建议间隔 {round(monitor.suggest_interval(), 1)}秒")
+        time.sleep(1)
+    print(f"平均每轮CPU {round(cost / rounds * 1000, 1)}ms, "
+          f"按 {monitor.interval} 秒间隔占单核 {round(cost / rounds / monitor.interval * 100, 2)}%")
+    for line in monitor.format_summary():
+        print(line)
@@ -0,0 +1,377 @@
+import heapq
+import itertools
+import queue
+import sys
+import threading
+import time
+import traceback
+from collections import namedtuple
+from datetime import datetime
+
+MAX_STUCK_RUNS = 2          # 同一任务最多同时有几次被放弃后仍未返回的执行，达到后暂停分派
+MAX_STALL_BACKOFF = 3600    # 任务卡死后再次执行的最长退避时间（秒）
+
+def _log(message):
+    """统一的日志输出函数"""
+    timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    print(f"[{timestamp}] {message}", flush=True)
+
+class Job:
+    """定时任务"""
+    def __init__(self, name, func, interval, timeout=None, pool=None):
+        self.name = name
+        self.func = func
+        self.interval = interval
+        self.timeout = timeout  # 单次执行超过该时间（秒）视为卡死，None 表示不检测
+        self.pool = pool        # 执行任务的线程池，None 表示使用调度器的线程池
+        self.deadline = None    # 下一次计划执行时间（monotonic）
+        self.generation = 0     # 每次重新安排时递增，用于作废堆中的旧条目
+        self.running = False
+        self.removed = False
+        self.skipped = 0        # 因上一次仍在执行而跳过的次数
+        self.rerun = False      # 执行期间被 run_now 触发，结束后立即再执行一次
+        self.runs = 0           # 已分派的次数，用于识别被放弃的执行
+        self.stalls = 0         # 被看门狗判定卡死的次数
+        self.stuck_runs = set() # 被放弃后仍未返回的执行
+        self.resume_at = 0      # 卡死后退避到该时间（monotonic）才再次执行
+
+class _Worker:
+    """工作线程及其心跳：开始执行任务时记录任务名和开始时间（monotonic），空闲时清空"""
+    __slots__ = ("thread", "task", "started", "timeout", "on_abandon", "abandoned", "stalled")
+
+    def __init__(self):
+        self.thread = None
+        self.task = None
+        self.started = None
+        self.timeout = None
+        self.on_abandon = None
+        self.abandoned = False
+        self.stalled = False   # 已报告卡死但因放弃的线程达到上限而未被替换
+
+# 卡死的任务：thread 为仍卡在任务中的线程，replaced 为是否已放弃该线程并补充了新线程
+StalledTask = namedtuple("StalledTask", ["pool", "task", "thread", "elapsed", "replaced"])
+
+class WorkerPool:
+    """
+    固定大小的工作线程池，新增任务不会新增线程
+    任务可以设置超时，超时仍未返回的线程由看门狗放弃并补充新线程，卡死的任务不会占满线程池
+    被放弃且仍未返回的线程最多 max_abandoned 个（默认与 max_workers 相同），达到上限后
+    卡死的线程不再被替换，线程总数不会因反复卡死的任务而无限增长
+    """
+    def __init__(self, max_workers=4, name="xiaoU-worker", max_abandoned=None):
+        self.max_workers = max_workers
+        self.name = name
+        self.max_abandoned = max_workers if max_abandoned is None else max_abandoned
+        self._tasks = queue.Queue()
+        self._workers = []
+        self._abandoned = []   # 被放弃且仍未返回的工作线程
+        self._spawned = itertools.count()
+        self._lock = threading.Lock()
+
+    def start(self):
+        with self._lock:
+            for _ in range(self.max_workers):
+                self._spawn()
+
+    def _spawn(self):
+        """启动一个工作线程（调用方需持有锁）"""
+        worker = _Worker()
+        worker.thread = threading.Thread(target=self._work, args=(worker,),
+                                         name=f"{self.name}-{next(self._spawned)}", daemon=True)
+        self._workers.append(worker)
+        worker.thread.start()
+
+    def submit(self, func, *args, name=None, timeout=None, on_abandon=None):
+        """
+        提交任务
+        name: 任务名（用于卡死时的日志），timeout: 超过该时间（秒）视为卡死
+        on_abandon: 任务被放弃时调用（在看门狗线程中执行）
+        """
+        self._tasks.put((func, args, name, timeout, on_abandon))
+
+    def _work(self, worker):
+        while True:
+            func, args, name, timeout, on_abandon = self._tasks.get()
+            if func is None:
+                return
+            with self._lock:
+                worker.task = name or getattr(func, "__name__", "task")
+                worker.timeout = timeout
+                worker.on_abandon = on_abandon
+                worker.started = time.monotonic()
+            try:
+                func(*args)
+            except Exception as e:
+                _log(f"工作线程执行出错: {e}")
+            finally:
+                with self._lock:
+                    worker.started = None
+                    worker.stalled = False
+                    abandoned = worker.abandoned
+                    if abandoned:
+                        self._abandoned.remove(worker)
+            if abandoned:
+                # 已有替补线程，卡死的任务最终返回后直接退出
+                _log(f"已放弃的任务 {worker.task} 在 {worker.thread.name} 中结束")
+                return
+
+    def reap_stalled(self, now=None):
+        """
+        放弃执行超时的工作线程，并为每个被放弃的线程补充一个新线程
+        被放弃的线程已达上限时不再替换，该线程只报告一次，任务返回后继续使用
+        返回: [StalledTask, ...]
+        """
+        now = time.monotonic() if now is None else now
+        stalled = []
+        with self._lock:
+            for worker in list(self._workers):
+                if worker.started is None or worker.timeout is None or worker.stalled:
+                    continue
+                elapsed = now - worker.started
+                if elapsed < worker.timeout:
+                    continue
+                if len(self._abandoned) >= self.max_abandoned:
+                    worker.stalled = True
+                    stalled.append((worker, elapsed, False))
+                    continue
+                worker.abandoned = True
+                self._workers.remove(worker)
+                self._abandoned.append(worker)
+                self._spawn()
+                stalled.append((worker, elapsed, True))
+        result = []
+        for worker, elapsed, replaced in stalled:
+            if replaced and worker.on_abandon is not None:
+                try:
+                    worker.on_abandon()
+                except Exception as e:
+                    _log(f"放弃任务回调出错: {e}")
+            result.append(StalledTask(self.name, worker.task, worker.thread, elapsed, replaced))
+        return result
+
+    def stop(self):
+        with self._lock:
+            count = len(self._workers)
+        for _ in range(count):
+            self._tasks.put((None, (), None, None, None))
+
+class Watchdog:
+    """
+    看门狗，在独立线程中检查各线程池的心跳
+    - 任务执行超过其超时时间即判定卡死：输出卡住线程的调用栈（sys._current_frames），
+      通知监听器，并放弃该线程、补充新线程，之后的任务不再受影响
+    - 从卡死到发现的延迟不超过 任务超时 + interval
+    卡死的线程无法被强制终止，只能放弃，它若最终返回会自行退出
+    """
+    def __init__(self, interval=5):
+        self.interval = interval
+        self._pools = []
+        self._listeners = []
+        self._stopping = threading.Event()
+        self._thread = None
+
+    def watch(self, pool):
+        self._pools.append(pool)
+
+    def add_listener(self, listener):
+        """注册监听器，发现卡死任务时以 listener(StalledTask, 调用栈文本) 调用"""
+        self._listeners.append(listener)
+
+    def start(self):
+        self._stopping.clear()
+        self._thread = threading.Thread(target=self._run, name="xiaoU-watchdog", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stopping.set()
+
+    def _run(self):
+        while not self._stopping.wait(self.interval):
+            self.check()
+
+    def check(self):
+        """检查一次所有线程池，返回本次发现的卡死任务"""
+        stalled = []
+        for pool in self._pools:
+            stalled.extend(pool.reap_stalled())
+        if not stalled:
+            return stalled
+        frames = sys._current_frames()
+        for task in stalled:
+            frame = frames.get(task.thread.ident)
+            stack = "".join(traceback.format_stack(frame)) if frame is not None else "（线程已结束）\n"
+            if task.replaced:
+                action = f"放弃线程 {task.thread.name}，补充新线程"
+            else:
+                action = f"被放弃的线程已达上限，保留线程 {task.thread.name} 等待任务返回"
+            _log(f"任务 {task.task} 已执行 {round(task.elapsed, 1)}秒仍未返回，{action}，"
+                 f"卡住的位置:\n{stack.rstrip()}")
+            for listener in self._listeners:
+                try:
+                    listener(task, stack)
+                except Exception as e:
+                    _log(f"看门狗监听器出错: {e}")
+        return stalled
+
+class Scheduler:
+    """
+    基于定时器堆的调度器
+    - 按固定的截止时间执行任务，不会因任务耗时而产生漂移
+    - 阻塞操作交给固定大小的工作线程池执行
+    - 同一个任务不会并发执行，上一次尚未结束时跳过本次
+    - 支持运行时修改任务间隔或立即触发任务
+    - 任务执行超过 timeout（默认 stall_timeout）秒视为卡死，由看门狗放弃后继续执行；
+      被放弃的执行仍未返回时按卡住的次数指数退避，达到 MAX_STUCK_RUNS 次时暂停，直到有执行返回
+    """
+    def __init__(self, max_workers=4, stall_timeout=None):
+        self.pool = WorkerPool(max_workers)
+        self.stall_timeout = stall_timeout
+        self._jobs = {}
+        self._heap = []   # (deadline, seq, generation, job)
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+        self._stopping = False
+        self._listeners = []
+
+    def add_listener(self, listener):
+        """注册任务监听器，每次任务执行结束后以 listener(任务名, 耗时秒数) 调用"""
+        self._listeners.append(listener)
+
+    def add_job(self, name, func, interval, delay=0, timeout=None, pool=None):
+        """
+        添加任务，delay 秒后首次执行，之后每 interval 秒执行一次
+        timeout: 单次执行的超时时间（秒），默认使用 stall_timeout
+        pool: 在指定的线程池中执行（由调用方启动），避免大量同类任务占满调度器的线程池
+        """
+        with self._cond:
+            if name in self._jobs:
+                raise ValueError(f"任务已存在: {name}")
+            job = Job(name, func, interval, timeout or self.stall_timeout, pool)
+            self._jobs[name] = job
+            self._schedule(job, time.monotonic() + delay)
+        return job
+
+    def remove_job(self, name):
+        with self._cond:
+            job = self._jobs.pop(name, None)
+            if job is not None:
+                job.removed = True
+                job.generation += 1
+
+    def has_job(self, name):
+        with self._cond:
+            return name in self._jobs
+
+    def get_interval(self, name):
+        with self._cond:
+            return self._jobs[name].interval
+
+    def set_interval(self, name, interval):
+        """修改任务间隔，下一次执行时间按上一次计划时间加新间隔重新计算"""
+        with self._cond:
+            job = self._jobs.get(name)
+            if job is None or job.interval == interval:
+                return
+            previous = job.deadline - job.interval
+            job.interval = interval
+            self._schedule(job, max(previous + interval, time.monotonic()))
+
+    def run_now(self, name):
+        """立即触发任务，正在执行时不并发执行，而是在本次结束后立即再执行一次"""
+        with self._cond:
+            job = self._jobs.get(name)
+            if job is None:
+                return
+            if job.running:
+                job.rerun = True
+            else:
+                self._schedule(job, time.monotonic())
+
+    def _schedule(self, job, deadline):
+        """安排任务的下一次执行（调用方需持有锁）"""
+        job.generation += 1
+        job.deadline = deadline
+        heapq.heappush(self._heap, (deadline, next(self._seq), job.generation, job))
+        self._cond.notify()
+
+    def _dispatch(self, job):
+        """把到期任务交给工作线程，并立即按固定步长安排下一次执行（调用方需持有锁）"""
+        deadline = job.deadline
+        if job.running:
+            job.skipped += 1
+        elif job.stuck_runs and (len(job.stuck_runs) >= MAX_STUCK_RUNS or time.monotonic() < job.resume_at):
+            job.skipped += 1   # 上一次执行仍卡着，退避或暂停
+        else:
+            job.running = True
+            job.runs += 1
+            run = job.runs
+            (job.pool or self.pool).submit(self._execute, job, run, name=job.name, timeout=job.timeout,
+                                           on_abandon=lambda: self._release(job, run))
+
+        now = time.monotonic()
+        next_deadline = deadline + job.interval
+        if next_deadline <= now:
+            # 落后超过一个周期时跳过错过的执行，保持原有相位
+            missed = int((now - next_deadline) // job.interval) + 1
+            next_deadline += missed * job.interval
+        self._schedule(job, next_deadline)
+
+    def _release(self, job, run):
+        """看门狗放弃了卡死的执行，退避一段时间后允许任务再次执行"""
+        with self._cond:
+            if job.runs == run and job.running:
+                job.running = False
+                job.stalls += 1
+                job.stuck_runs.add(run)
+                backoff = min(job.interval * 2 ** len(job.stuck_runs), MAX_STALL_BACKOFF)
+                job.resume_at = time.monotonic() + backoff
+
+    def _execute(self, job, run):
+        start = time.monotonic()
+        try:
+            job.func()
+        except Exception as e:
+            _log(f"任务 {job.name} 执行出错: {e}")
+        finally:
+            with self._cond:
+                # 本次执行已被放弃时，任务可能已在其他线程中重新执行，不再改动其状态
+                current = run not in job.stuck_runs
+                job.stuck_runs.discard(run)
+                if current:
+                    job.running = False
+                    if job.rerun and not job.removed:
+                        job.rerun = False
+                        self._schedule(job, time.monotonic())
+        if not current:
+            return
+        elapsed = time.monotonic() - start
+        for listener in self._listeners:
+            try:
+                listener(job.name, elapsed)
+            except Exception as e:
+                _log(f"任务监听器出错: {e}")
+
+    def run_forever(self):
+        """在当前线程运行调度循环，直到调用 stop()"""
+        self.pool.start()
+        with self._cond:
+            while not self._stopping:
+                # 丢弃已被重新安排或移除的旧条目
+                while self._heap and (self._heap[0][3].removed or self._heap[0][2] != self._heap[0][3].generation):
+                    heapq.heappop(self._heap)
+                if not self._heap:
+                    self._cond.wait()
+                    continue
+                deadline, _, _, job = self._heap[0]
+                delay = deadline - time.monotonic()
+                if delay > 0:
+                    self._cond.wait(delay)
+                    continue
+                heapq.heappop(self._heap)
+                self._dispatch(job)
+        self.pool.stop()
+
+    def stop(self):
+        with self._cond:
+            self._stopping = True
+            self._cond.notify_all()
@@ -0,0 +1,262 @@
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+
+def _log(message):
+    """统一的日志输出函数"""
+    timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    print(f"[{timestamp}] {message}", flush=True)
+
+class TTLMap:
+    """
+    有容量上限的过期字典
+    - 条目在 ttl 秒后过期，写入时顺带清理过期条目
+    - 超过 maxsize 时淘汰最早写入的条目，内存占用不会无限增长
+    """
+    def __init__(self, ttl, maxsize=1000):
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self._items = OrderedDict()   # 键 -> (值, 写入时间戳)
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None, now=None):
+        now = time.time() if now is None else now
+        with self._lock:
+            item = self._items.get(key)
+            if item is None:
+                return default
+            if now - item[1] >= self.ttl:
+                del self._items[key]
+                return default
+            return item[0]
+
+    def set(self, key, value, now=None):
+        """写入条目，now 为写入时间戳（恢复持久化的条目时传入原写入时间）"""
+        now = time.time() if now is None else now
+        with self._lock:
+            self._items[key] = (value, now)
+            self._items.move_to_end(key)
+            self._expire(time.time())
+
+    def _expire(self, now):
+        while self._items:
+            key, (_, stamp) = next(iter(self._items.items()))
+            if now - stamp < self.ttl and len(self._items) <= self.maxsize:
+                break
+            del self._items[key]
+
+    def __contains__(self, key):
+        return self.get(key, _MISSING) is not _MISSING
+
+    def __len__(self):
+        return len(self._items)
+
+_MISSING = object()
+
+class StateJournal:
+    """
+    追加写入的状态日志，用于在重启后恢复告警状态
+    - 每次修改追加一行 JSON：{"k": 键, "v": 值}，删除时 v 为 null
+    - 写入只进入页缓存，由后台线程在 sync_interval 秒内合并为一次 fsync
+    - 日志行数超过当前键数的 compact_ratio 倍（且不少于 min_compact 行）时重写为快照：
+      写临时文件、fsync、rename，不会出现半个快照
+    - 启动时顺序重放，崩溃时写了一半的末尾行直接丢弃
+    - 写入失败（如磁盘已满）时只记录一次日志，内存中的状态照常更新，
+      之后每次修改都尝试重写快照，成功后恢复追加写入
+    """
+    def __init__(self, path, sync_interval=1.0, compact_ratio=4, min_compact=1000):
+        self.path = path
+        self.sync_interval = sync_interval
+        self.compact_ratio = compact_ratio
+        self.min_compact = min_compact
+        self._state = {}
+        self._lines = 0
+        self._dirty = False
+        self._closed = False
+        self._failed = False   # 上次写入失败，日志文件中缺少部分记录
+        self._cond = threading.Condition()
+
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        self._replay()
+        self._fd = os.open(path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o600)
+        self._syncer = threading.Thread(target=self._sync_loop, name="state-journal", daemon=True)
+        self._syncer.start()
+
+    def _replay(self):
+        try:
+            with open(self.path, "rb") as f:
+                data = f.read()
+        except FileNotFoundError:
+            return
+        valid = 0
+        lines = data.split(b"\n")
+        lines.pop()  # 最后一个换行符之后的内容是未写完的记录
+        for line in lines:
+            if not line:
+                valid += 1
+                continue
+            try:
+                record = json.loads(line)
+                key, value = record["k"], record["v"]
+            except (ValueError, KeyError, TypeError):
+                break  # 末尾不完整的记录，之后的内容不可信
+            if value is None:
+                self._state.pop(key, None)
+            else:
+                self._state[key] = value
+            valid += len(line) + 1
+            self._lines += 1
+        if valid < len(data):
+            # 截掉损坏的末尾，避免后续追加的记录接在半行后面
+            with open(self.path, "r+b") as f:
+                f.truncate(valid)
+
+    def __len__(self):
+        return len(self._state)
+
+    def get(self, key, default=None):
+        return self._state.get(key, default)
+
+    def items(self, prefix=""):
+        """返回以 prefix 开头的 (键, 值) 列表"""
+        return [(key, value) for key, value in list(self._state.items()) if key.startswith(prefix)]
+
+    def set(self, key, value):
+        """写入一个键，值需可序列化为 JSON（None 表示删除）"""
+        with self._cond:
+            if self._closed:
+                return
+            if value is None:
+                if key not in self._state:
+                    return
+                self._state.pop(key)
+            else:
+                if self._state.get(key, _MISSING) == value:
+                    return
+                self._state[key] = value
+            if self._failed:
+                # 之前的写入失败过，只有完整重写快照才能让日志与内存状态一致
+                if not self._compact():
+                    return
+                self._failed = False
+                _log("状态日志恢复写入")
+            else:
+                line = json.dumps({"k": key, "v": value}, ensure_ascii=False, separators=(",", ":"))
+                try:
+                    os.write(self._fd, line.encode("utf-8") + b"\n")
+                except OSError as e:
+                    self._fail(e)
+                    return
+                self._lines += 1
+                if self._lines >= max(self.min_compact, self.compact_ratio * len(self._state)):
+                    self._compact()
+            if not self._dirty:
+                self._dirty = True
+                self._cond.notify()
+
+    def delete(self, key):
+        self.set(key, None)
+
+    def _fail(self, error):
+        """记录写入失败（调用方需持有锁），连续失败时只输出一次日志"""
+        if not self._failed:
+            self._failed = True
+            _log(f"状态日志写入失败，暂时只在内存中保存状态: {error}")
+
+    def _compact(self):
+        """
+        把当前状态重写为快照（调用方需持有锁）
+        返回: Boolean - 是否成功，失败时保留原日志文件
+        """
+        tmp = f"{self.path}.tmp"
+        try:
+            try:
+                os.unlink(tmp)  # 上次未完成的临时文件，权限可能不同
+            except FileNotFoundError:
+                pass
+            # 与日志文件一样只允许所有者读写，替换后不会放宽权限
+            with os.fdopen(os.open(tmp, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600), "wb") as f:
+                for key, value in self._state.items():
+                    line = json.dumps({"k": key, "v": value}, ensure_ascii=False, separators=(",", ":"))
+                    f.write(line.encode("utf-8") + b"\n")
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp, self.path)
+        except OSError as e:
+            try:
+                os.unlink(tmp)
+            except OSError:
+                pass
+            self._fail(e)
+            return False
+        try:
+            self._fsync_directory()
+        except OSError:
+            pass  # 快照已经替换完成，目录项稍后由系统写回
+        fd = self._fd
+        try:
+            self._fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o600)
+        except OSError as e:
+            self._fail(e)
+            return False
+        os.close(fd)
+        self._lines = len(self._state)
+        return True
+
+    def _fsync_directory(self):
+        if not hasattr(os, "O_DIRECTORY"):
+            return
+        fd = os.open(os.path.dirname(os.path.abspath(self.path)), os.O_RDONLY | os.O_DIRECTORY)
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+
+    def flush(self):
+        """立即把已写入的记录同步到磁盘"""
+        with self._cond:
+            if self._closed or not self._dirty:
+                return
+            self._dirty = False
+            try:
+                os.fsync(self._fd)
+            except OSError as e:
+                self._fail(e)
+
+    def _sync_loop(self):
+        """有新记录时等待 sync_interval 秒，把期间的所有写入合并为一次 fsync"""
+        while True:
+            with self._cond:
+                while not self._dirty and not self._closed:
+                    self._cond.wait()
+                if self._closed:
+                    return
+            time.sleep(self.sync_interval)
+            self.flush()
+
+    def close(self):
+        self.flush()
+        with self._cond:
+            if self._closed:
+                return
+            self._closed = True
+            self._cond.notify_all()
+            os.close(self._fd)
+
+def open_state_journal():
+    """
+    根据 XIAOU_STATE_FILE 环境变量打开状态日志（默认为工作目录下的 xiaoU_state.journal）
+    设置为 off 时不持久化状态，打开失败时同样返回None
+    """
+    path = os.environ.get("XIAOU_STATE_FILE", "xiaoU_state.journal")
+    if not path or path.lower() in ("off", "0"):
+        return None
+    try:
+        return StateJournal(path)
+    except OSError as e:
+        _log(f"无法打开状态日志 {path}，告警状态将不会持久化: {e}")
+        return None
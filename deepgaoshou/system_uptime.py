@@ -1,5 +1,21 @@
-import psutil
 import datetime
+from lazy_import import LazyModule
+
+psutil = LazyModule("psutil")  # 发送上线通知时才导入
+
+def get_boot_time():
+    """
+    获取系统开机时间戳，用于区分进程重启和系统重启
+    Linux 上直接读取 /proc/stat，启动时无需导入 psutil
+    """
+    try:
+        with open("/proc/stat", "rb") as f:
+            for line in f:
+                if line.startswith(b"btime "):
+                    return float(line.split()[1])
+    except (OSError, ValueError, IndexError):
+        pass
+    return psutil.boot_time()
 
 def get_system_uptime():
     """
@@ -5,53 +5,185 @@
 1. 首次联网成功后发送上线通知
 2. 持续监控网络状态，断网重连后发送重新联网通知
 3. 独立持续监控磁盘空间，根据剩余空间设置多级预警机制
+所有检查由同一个调度器按固定节拍分派到有界的工作线程池执行
 """
 
 import time
+_import_started = time.perf_counter()
+
 import platform
-import threading
+import signal
 import sys
+import threading
 import os
 from datetime import datetime, timedelta
-from dotenv import load_dotenv
+import checks
+import config
+import email_sender
 import internet_check
 import system_uptime
 import disk_usage
-import email_sender
-from email_composer import email_composer
+import disk_trend
+import disk_analyzer
+import disk_io
+import fleet
+import history_store
+import instrumentation
+import metrics_exporter
+import netlink_monitor
+import network_diagnosis
+import network_quality
+import process_monitor
+import state_store
+from metrics import metrics
+from email_composer import email_composer, TITLE_REPEAT_WINDOW
+from notification_queue import notification_queue, configure_notification_queue, PRIORITY_HIGH, PRIORITY_NORMAL
+from notifier import SEVERITY_INFO, SEVERITY_WARNING, SEVERITY_CRITICAL, get_notifier
+from scheduler import Scheduler, Watchdog
+
+_import_finished = time.perf_counter()
 
-# 加载环境变量
-load_dotenv()
+# 加载环境变量（整个进程只加载一次）
+config.load_config()
+instrumentation.configure()
+configure_notification_queue()
+_config_loaded = time.perf_counter()
+
+# 各预警级别对应的邮件标题和日志描述
+DISK_WARNING_TITLES = {
+    "predicted": "小悠快要被灌满了！",
+    "high": "小悠的里面...好多❤",
+    "medium": "小悠要被灌满了~~",
+    "low": "小悠提醒你空间不够了！",
+}
+DISK_WARNING_NAMES = {
+    "predicted": "即将写满",
+    "high": "极度不足",
+    "medium": "严重不足",
+    "low": "不足",
+}
+DISK_IO_WARNING_TITLES = {
+    "high": "小悠的磁盘快要忙不过来了！",
+    "medium": "小悠的磁盘好忙~~",
+    "low": "小悠提醒你磁盘有点忙",
+}
+DISK_IO_WARNING_NAMES = {
+    "high": "极度繁忙",
+    "medium": "严重繁忙",
+    "low": "繁忙",
+}
 
 class XiaoUSystem:
     def __init__(self):
+        init_started = time.perf_counter()
+        # 启动各阶段耗时（秒），上线通知发送成功后输出
+        self.startup_times = {
+            "导入模块": _import_finished - _import_started,
+            "加载配置": _config_loaded - _import_finished,
+        }
+        self.run_started = None
+        
         self.online_notification_sent = False
+        self.online_notification_pending = False  # 上线通知已入队，等待发送结果
         self.reconnect_notification_sent = False
         self.last_network_status = None  # 记录上一次网络状态
-        
-        # 磁盘监控相关变量
-        self.last_disk_warning_time_100gb = None  # 100GB阈值警告最后发送时间
-        self.last_disk_warning_time_30gb = None   # 30GB阈值警告最后发送时间
-        self.last_disk_warning_time_1gb = None    # 1GB阈值警告最后发送时间
+        self.last_network_details = ""   # 记录上一次网络检测详情
         
         self.disk_check_interval = 60  # 磁盘检查间隔（秒）
+        self.disk_min_check_interval = 10  # 写入速度较快时的最短检查间隔（秒）
+        # 预计写满时间低于该值时发送预测警告（秒）
+        self.disk_ttf_warning = float(os.environ.get('XIAOU_DISK_TTF_WARNING', 60)) * 60
+        self.disk_ttf_cooldown = timedelta(minutes=30)  # 预测警告冷却时间
+        self.online_check_interval = 5  # 上线检测间隔（秒）
         self.network_check_interval = 10  # 网络检查间隔（秒）
+        self.network_offline_interval = 5  # 断网期间的网络检查间隔（秒）
+        self.network_stable_interval = 300  # 有网络事件监听时，网络稳定期间的兜底检查间隔（秒）
+        self.network_event_interval = 1  # 网络事件后仍未联网时的快速确认间隔（秒）
+        self.network_event_window = 30  # 网络事件后保持快速确认的时长（秒）
+        self.last_network_event = None  # 最近一次网络事件时间（monotonic）
+        # 状态迟滞：连续多次失败/成功才确认断网/恢复，链路抖动时不会反复发送重新联网通知
+        self.network_state = internet_check.StateHysteresis(
+            down_checks=int(os.environ.get('XIAOU_NETWORK_DOWN_CHECKS', 3)),
+            up_checks=int(os.environ.get('XIAOU_NETWORK_UP_CHECKS', 2)),
+        )
+        self.network_confirm_interval = 2  # 状态变化待确认期间的检查间隔（秒）
+        # 网络质量测量：丢包率、抖动和往返时间分位数（XIAOU_QUALITY=0 关闭）
+        self.network_quality = network_quality.build_quality_monitor()
+        self.network_quality_interval = float(os.environ.get('XIAOU_QUALITY_INTERVAL', 30))  # 每轮测量间隔（秒）
+        self.online_quality_wait = 2  # 上线通知最多等待首轮质量测量的时间（秒）
+        # 断网时分层诊断链路、网关、DNS、TCP 和 HTTP，结果附在重新联网通知中（XIAOU_DIAGNOSIS=0 关闭）
+        self.network_diagnosis = network_diagnosis.build_network_diagnoser()
+        self.last_diagnosis = None  # 最近一次断网诊断：(诊断时间文本, 各层结果文本列表)
+        # 进程资源排名：CPU、内存和磁盘IO占用最多的进程（XIAOU_PROCESS_MONITOR=0 关闭）
+        self.process_monitor = process_monitor.build_process_monitor()
         self.status_report_interval = 300  # 状态报告间隔（秒）
-        self.last_status_report = 0
         
-        # 从环境变量读取挂载点，如果没有设置则使用默认值
-        self.mount_point = os.environ.get('ENV_MOUNT_POINT')
-        if not self.mount_point:
-            # 根据操作系统设置默认挂载点
-            if platform.system() == "Windows":
-                self.mount_point = "C:\\"
-            else:
-                self.mount_point = "/"
-            self._log(f"未设置 ENV_MOUNT_POINT 环境变量，使用默认挂载点: {self.mount_point}")
+        self.history_flush_interval = 60  # 历史数据同步到磁盘的间隔（秒）
+        
+        # 历史数据存储（设置 XIAOU_HISTORY_DIR 后启用）
+        self.history = history_store.open_history_store()
+        if self.history is not None:
+            self._log(f"历史数据存储目录: {self.history.directory}")
+            notification_queue.add_listener(self._record_email_history)
+        
+        # 所有检查共用一个调度器和固定大小的工作线程池
+        # 单次检查超过 XIAOU_STALL_TIMEOUT 秒仍未返回视为卡死（0 关闭看门狗）
+        stall_timeout = float(os.environ.get('XIAOU_STALL_TIMEOUT', 120))
+        self.scheduler = Scheduler(max_workers=int(os.environ.get('XIAOU_WORKERS', 4)),
+                                   stall_timeout=stall_timeout or None)
+        self.scheduler.add_listener(self._record_check_duration)
+        
+        # 看门狗：检查和通知线程卡死时输出调用栈，放弃卡住的线程并补充新线程
+        self.watchdog = None
+        if stall_timeout:
+            self.watchdog = Watchdog()
+            self.watchdog.watch(self.scheduler.pool)
+            self.watchdog.watch(get_notifier().pool)
+            self.watchdog.add_listener(self._on_stall)
+        
+        # 配置文件中声明的检查（XIAOU_CHECKS_FILE），文件变化或 SIGHUP 时重新加载，在独立的有界线程池中执行
+        self.check_registry = checks.build_check_registry(self.scheduler, self._on_check_alert)
+        if self.check_registry is not None and self.watchdog is not None:
+            self.watchdog.watch(self.check_registry.pool)
+        
+        # OpenMetrics 导出端点（设置 XIAOU_METRICS_PORT 后启用）
+        self.metrics_refresh_interval = 5  # 指标快照刷新间隔（秒）
+        self.metrics_exporter = metrics_exporter.build_metrics_exporter()
+        notification_queue.add_listener(self._record_email_metrics)
+        
+        # Linux 上监听网卡/地址/路由变化，事件触发立即检测（XIAOU_NETLINK=0 关闭）
+        self.netlink_monitor = netlink_monitor.build_netlink_monitor(self._on_network_event)
+        
+        # 告警状态日志，进程重启后恢复通知状态和冷却时间（XIAOU_STATE_FILE=off 关闭）
+        self.state = state_store.open_state_journal()
+        self._restored_cooldowns = set()  # 已恢复预警冷却时间的挂载点/设备（状态日志中的键前缀）
+        if self.state is not None:
+            self._restore_state()
+            email_composer.add_listener(self._save_title)
+        
+        # 集群模式：汇总其他节点的上报（XIAOU_COLLECTOR_LISTEN），或向汇总端上报（XIAOU_COLLECTOR）
+        self.fleet_collector = fleet.build_fleet_collector(self._on_fleet_alert)
+        self.fleet_agent = fleet.get_agent()
+        
+        # 从环境变量读取挂载点（单个、逗号分隔的多个或 auto），如果没有设置则使用默认值
+        mount_spec = os.environ.get('ENV_MOUNT_POINT')
+        if not mount_spec:
+            mount_spec = disk_usage.default_mount_point()
+            self._log(f"未设置 ENV_MOUNT_POINT 环境变量，使用默认挂载点: {mount_spec}")
         else:
-            self._log(f"使用环境变量指定的挂载点: {self.mount_point}")
+            self._log(f"使用环境变量指定的挂载点: {mount_spec}")
+        # 每个挂载点有独立的阈值和预警冷却状态
+        self.mount_registry = disk_usage.build_mount_registry(mount_spec)
+        # 挂载点所在设备的IO吞吐量、服务时间和利用率（XIAOU_DISKIO=0 关闭）
+        self.disk_io_check_interval = float(os.environ.get('XIAOU_DISKIO_INTERVAL', 10))
+        self.disk_io = disk_io.build_disk_io_monitor(self.mount_registry)
+        self._last_disk_io = {}  # 设备名 -> 最近一次的 IOStats，用于状态报告
+        # 触发预警时分析占用空间最多的目录和文件（XIAOU_DISK_ANALYZE=0 关闭）
+        self.disk_analyzer = disk_analyzer.build_disk_analyzer()
+        self._log(f"监控挂载点数量: {len(self.mount_registry.watches)}")
         
         self._log(f"系统类型: {platform.system()}")
+        self.startup_times["初始化"] = time.perf_counter() - init_started
         
     def _log(self, message):
         """统一的日志输出函数，确保输出到stdout"""
@@ -64,230 +196,665 @@ class XiaoUSystem:
         if os.environ.get('XIAOU_DEBUG'):
             self._log(f"DEBUG: {message}")
     
-    def run_online_check(self):
-        """执行联网检测和上线通知"""
-        self._log("开始检测网络连接...")
+    def _save_state(self, key, value):
+        """写入状态日志（未启用时忽略），value 为None表示删除"""
+        if self.state is not None:
+            self.state.set(key, value)
+    
+    def _restore_state(self):
+        """从状态日志恢复重启前的通知状态，同一次开机内不重复发送上线通知"""
+        started = time.perf_counter()
+        boot_time = self.state.get("online.boot_time")
+        if boot_time is not None and abs(boot_time - system_uptime.get_boot_time()) < 1:
+            self.online_notification_sent = True
+        self.last_network_status = self.state.get("network.last_status")
+        self.reconnect_notification_sent = self.state.get("network.reconnect_sent", False)
+        diagnosis = self.state.get("network.diagnosis")
+        if diagnosis is not None:
+            self.last_diagnosis = tuple(diagnosis)
+        for key, sent_time in self.state.items("title:"):
+            email_composer.restore_title(key[len("title:"):], sent_time)
+        self._expire_titles(time.time())
+        elapsed = (time.perf_counter() - started) * 1000
+        self._log(f"已从 {self.state.path} 恢复告警状态: {len(self.state)} 条, 耗时 {round(elapsed, 1)}ms"
+                  f"{'，本次开机已发送过上线通知' if self.online_notification_sent else ''}")
+    
+    def _save_title(self, title, sent_time):
+        """记录标题发送时间，并删除已超过重复窗口的标题，状态日志与内存中的记录同样有界"""
+        self._save_state(f"title:{title}", sent_time)
+        self._expire_titles(sent_time)
+    
+    def _expire_titles(self, now):
+        for key, sent_time in self.state.items("title:"):
+            if now - sent_time >= TITLE_REPEAT_WINDOW:
+                self.state.delete(key)
+    
+    def _restore_cooldowns(self, prefix, watch):
+        """恢复挂载点或设备重启前的预警时间，冷却期跨重启继续计算（每个前缀只恢复一次）"""
+        if self.state is None or prefix in self._restored_cooldowns:
+            return
+        self._restored_cooldowns.add(prefix)
+        for key, sent_time in self.state.items(prefix):
+            watch.last_warning_times.setdefault(key[len(prefix):], datetime.fromtimestamp(sent_time))
+    
+    def _update_network_status(self, current_status, details):
+        self.last_network_status = current_status
+        self.last_network_details = details
+        self._save_state("network.last_status", current_status)
+    
+    def _set_reconnect_notification_sent(self, sent):
+        self.reconnect_notification_sent = sent
+        self._save_state("network.reconnect_sent", sent)
+    
+    def _record(self, name, value):
+        """记录一个历史数据点（未启用历史存储时忽略）"""
+        if self.history is not None:
+            self.history.record(name, value)
+    
+    def _record_network_history(self, current_status, results):
+        self._record("network.up", 1 if current_status else 0)
+        metrics.set("xiaou_network_up", 1 if current_status else 0)
+        for result in results:
+            metrics.inc("xiaou_probes", host=result.host, result="success" if result.ok else "failure")
+            if result.ok:
+                self._record(f"network.rtt_ms.{result.host}", result.rtt_us / 1000)
+                metrics.set("xiaou_probe_rtt_seconds", result.rtt_us / 1e6, host=result.host)
+    
+    def _record_disk_metrics(self, watch, free_gb, percent):
+        mount_point = watch.mount_point
+        self._record(f"disk.{mount_point}.free_gb", free_gb)
+        self._record(f"disk.{mount_point}.percent", percent)
+        if watch.usage_bytes is not None:
+            # 导出 psutil 返回的原始字节数，不经过四舍五入的GB值换算
+            total, used, free = watch.usage_bytes
+            metrics.set("xiaou_disk_total_bytes", total, mount=mount_point)
+            metrics.set("xiaou_disk_used_bytes", used, mount=mount_point)
+            metrics.set("xiaou_disk_free_bytes", free, mount=mount_point)
+    
+    def _record_email_metrics(self, subject, success, elapsed):
+        metrics.inc("xiaou_emails", result="success" if success else "failure")
+        metrics.observe("xiaou_email_send_seconds", elapsed)
+    
+    def _record_check_duration(self, name, elapsed):
+        instrumentation.observe("check", elapsed, check=name)
+    
+    def _on_stall(self, task, stack):
+        """看门狗发现卡死任务（在看门狗线程中执行）"""
+        metrics.inc("xiaou_stalls", pool=task.pool, task=task.task)
+        # 任务名可能来自配置（如 check:<名称>），按线程池记录，历史指标数不随任务增长
+        self._record(f"stall.{task.pool}", task.elapsed)
+    
+    def refresh_metrics(self):
+        """刷新导出端点的指标快照（只读取内存中的数据）"""
+        metrics.set("xiaou_notification_queue_depth", notification_queue.get_stats()["depth"])
+        self.metrics_exporter.refresh()
+    
+    def _record_email_history(self, subject, success, elapsed):
+        self._record("email.sent", 1 if success else 0)
+        self._record("email.send_ms", elapsed * 1000)
+    
+    def check_online(self):
+        """执行一次联网检测，首次联网成功后发送上线通知"""
+        if self.online_notification_sent:
+            return
         
-        while not self.online_notification_sent:
-            # 使用详细网络检测功能
-            current_status, details = internet_check.check_internet_connection_with_details()
+        # 使用详细网络检测功能
+        probe_started = time.perf_counter()
+        current_status, details, results = internet_check.check_internet_connection_with_results(concurrent=True)
+        if "首次联网检测" not in self.startup_times:
+            self.startup_times["首次联网检测"] = time.perf_counter() - probe_started
+        
+        self._record_network_history(current_status, results)
+        
+        # 记录初始网络状态
+        if self.last_network_status is None:
+            self.last_network_status = current_status
+        
+        if self.online_notification_pending:
+            self._log_debug("上线通知等待发送中...")
+        elif current_status:
+            self._log(f"检测到网络连接成功！{details}")
+            
+            # 获取系统信息
+            boot_time, uptime = system_uptime.get_system_uptime()
             
-            # 记录初始网络状态
-            if self.last_network_status is None:
-                self.last_network_status = current_status
+            # 编写邮件内容
+            title = email_composer.format_title("小悠上线提醒")
+            content = email_composer.compose_online_notification(
+                boot_time, uptime, self._quality_summary(wait=self.online_quality_wait)
+            )
             
-            if current_status:
-                self._log(f"检测到网络连接成功！{details}")
+            # 加入发送队列，由发送线程负责发送和重试
+            self.online_notification_pending = notification_queue.enqueue(
+                title, content, priority=PRIORITY_HIGH, severity=SEVERITY_INFO,
+                on_result=self._on_online_notification_result
+            )
+        else:
+            self._log_debug(f"网络连接失败: {details}")
+        
+        # 更新网络状态
+        self._update_network_status(current_status, details)
+    
+    def _on_online_notification_result(self, success):
+        """上线通知发送结果回调（在发送线程中执行）"""
+        if success:
+            self.online_notification_sent = True
+            self._set_reconnect_notification_sent(False)  # 重置重新联网通知状态
+            self._save_state("online.boot_time", system_uptime.get_boot_time())
+            self._log("上线通知邮件发送成功！")
+            if self.run_started is not None and "上线通知" not in self.startup_times:
+                self.startup_times["上线通知"] = time.perf_counter() - self.run_started
+                self._log_startup_times()
+            self.start_network_monitor()
+        else:
+            self._log("上线通知邮件发送失败，将在下次检测时重试")
+        self.online_notification_pending = False
+    
+    def _on_smtp_warm_up(self, success, elapsed):
+        """SMTP预连接完成回调（在预连接线程中执行）"""
+        self.startup_times["SMTP预连接"] = elapsed
+        if success:
+            self._log_debug(f"SMTP连接已就绪，耗时 {round(elapsed * 1000, 1)}ms")
+    
+    def _log_startup_times(self):
+        """输出启动各阶段耗时，便于发现启动变慢"""
+        for phase, seconds in self.startup_times.items():
+            instrumentation.observe("startup", seconds, phase=phase)
+        breakdown = ", ".join(f"{phase} {round(seconds * 1000, 1)}ms" for phase, seconds in self.startup_times.items())
+        total = time.perf_counter() - _import_started
+        self._log(f"启动耗时: {breakdown}（从启动到上线通知共 {round(total * 1000, 1)}ms）")
+    
+    def check_network(self):
+        """执行一次网络状态检测，检测断网重连情况"""
+        try:
+            # 使用详细网络检测功能
+            probe_status, details, results = internet_check.check_internet_connection_with_results(concurrent=True)
+            self._record_network_history(probe_status, results)
+            current_status = self.network_state.update(probe_status)
+            if self.network_state.pending:
+                self._log_debug(f"网络状态变化待确认（当前{'在线' if probe_status else '离线'}）: {details}")
+            
+            # 检测网络状态变化：从断网到联网
+            if (self.last_network_status is not None and 
+                not self.last_network_status and 
+                current_status and 
+                self.online_notification_sent and
+                not self.reconnect_notification_sent):
                 
-                # 获取系统信息
-                boot_time, uptime = system_uptime.get_system_uptime()
+                self._log(f"检测到网络重新连接！{details}")
                 
                 # 编写邮件内容
-                title = email_composer.format_title("小悠上线提醒")
-                content = email_composer.compose_online_notification(boot_time, uptime)
+                title = email_composer.format_title("小悠已重新联网")
+                content = email_composer.compose_reconnect_notification(self._quality_summary(),
+                                                                        self.last_diagnosis)
                 
-                # 发送邮件
-                if email_sender.send_email(title, content):
-                    self.online_notification_sent = True
-                    self.reconnect_notification_sent = False  # 重置重新联网通知状态
-                    self._log("上线通知邮件发送成功！")
+                # 加入发送队列，不阻塞监控任务
+                if notification_queue.enqueue(title, content, severity=SEVERITY_INFO,
+                                              on_result=self._on_reconnect_notification_result):
+                    self._set_reconnect_notification_sent(True)
+                    self._set_last_diagnosis(None)
                 else:
-                    self._log("上线通知邮件发送失败，将在下次检测时重试")
-            else:
-                self._log_debug(f"网络连接失败: {details}")
+                    self._log("重新联网通知邮件入队失败")
+            
+            # 确认断网时诊断各层，定位故障位置
+            if self.last_network_status and not current_status:
+                self._log(f"检测到网络断开: {details}")
+                self.request_diagnosis(outage=True)
+            
+            # 如果网络断开，重置重新联网通知状态
+            if not current_status and self.reconnect_notification_sent:
+                self._set_reconnect_notification_sent(False)
+                self._log_debug(f"网络连接已断开: {details}")
             
             # 更新网络状态
-            self.last_network_status = current_status
+            self._update_network_status(current_status, details)
             
-            # 等待5秒后再次检测
-            time.sleep(5)
+            self.scheduler.set_interval("network", self._next_network_interval(current_status))
+            
+        except Exception as e:
+            self._log(f"网络状态监控出错: {e}")
     
-    def run_network_monitor(self):
-        """持续监控网络状态，检测断网重连情况"""
-        self._log("网络监控线程启动 - 持续监控网络状态")
-        
-        while True:
-            try:
-                # 使用详细网络检测功能
-                current_status, details = internet_check.check_internet_connection_with_details()
-                
-                # 检测网络状态变化：从断网到联网
-                if (self.last_network_status is not None and 
-                    not self.last_network_status and 
-                    current_status and 
-                    self.online_notification_sent and
-                    not self.reconnect_notification_sent):
-                    
-                    self._log(f"检测到网络重新连接！{details}")
-                    
-                    # 编写邮件内容
-                    title = email_composer.format_title("小悠已重新联网")
-                    content = email_composer.compose_reconnect_notification()
-                    
-                    # 发送邮件
-                    if email_sender.send_email(title, content):
-                        self.reconnect_notification_sent = True
-                        self._log("重新联网通知邮件发送成功！")
-                    else:
-                        self._log("重新联网通知邮件发送失败")
-                
-                # 如果网络断开，重置重新联网通知状态
-                if not current_status and self.reconnect_notification_sent:
-                    self.reconnect_notification_sent = False
-                    self._log_debug(f"网络连接已断开: {details}")
-                
-                # 更新网络状态
-                self.last_network_status = current_status
-                
-                # 定期报告网络状态
-                current_time = time.time()
-                if current_time - self.last_status_report > self.status_report_interval:
-                    status_text = "在线" if current_status else "离线"
-                    self._log_debug(f"网络状态: {status_text} - {details}")
-                    self.last_status_report = current_time
-                
-            except Exception as e:
-                self._log(f"网络状态监控出错: {e}")
+    def request_diagnosis(self, outage=False):
+        """在工作线程中执行一次网络诊断（断网时或按需），不阻塞调用方"""
+        if self.network_diagnosis is not None:
+            self.scheduler.pool.submit(self.diagnose_network, outage, name="diagnose",
+                                       timeout=self.scheduler.stall_timeout)
+    
+    def diagnose_network(self, outage=False):
+        """
+        执行分层网络诊断并输出到日志
+        outage: 是否为断网诊断，是则保存结果，网络恢复后附在重新联网通知中
+        """
+        diagnosis = self.network_diagnosis.diagnose()
+        if diagnosis is None:
+            self._log_debug("网络诊断正在进行，跳过本次请求")
+            return
+        lines = network_diagnosis.format_diagnosis(diagnosis)
+        self._log(f"网络诊断（{'断网' if outage else '按需'}，耗时 {round(diagnosis.elapsed, 2)}秒）:")
+        for line in lines:
+            self._log(f"  {line}")
+        for result in diagnosis.layers:
+            if result.ok is not None:
+                metrics.set("xiaou_diagnosis_layer_up", 1 if result.ok else 0, layer=result.layer)
+        if outage:
+            self._set_last_diagnosis((diagnosis.time.strftime("%Y-%m-%d %H:%M:%S"), lines))
+    
+    def _set_last_diagnosis(self, diagnosis):
+        self.last_diagnosis = diagnosis
+        self._save_state("network.diagnosis", list(diagnosis) if diagnosis is not None else None)
+    
+    def _next_network_interval(self, current_status):
+        """
+        断网期间加快检测，以便尽快发现网络恢复；刚收到网络事件时每秒确认一次
+        有事件监听时网络稳定期间只做低频兜底检查，状态变化待确认时缩短间隔
+        """
+        if not current_status and (self.last_network_event is not None and
+                time.monotonic() - self.last_network_event < self.network_event_window):
+            return self.network_event_interval
+        if self.network_state.pending:
+            return self.network_confirm_interval
+        if not current_status:
+            return self.network_offline_interval
+        if self.netlink_monitor is not None and self.netlink_monitor.running:
+            return self.network_stable_interval
+        return self.network_check_interval
+    
+    def check_quality(self):
+        """执行一轮网络质量测量，质量下降或恢复时发送通知"""
+        if self.last_network_status is False:
+            return  # 断网期间不测量，断网不计入质量统计
+        try:
+            was_good = self.network_quality.state.state
+            good, details = self.network_quality.run_train()
+            for report in self.network_quality.reports():
+                if report.samples:
+                    metrics.set("xiaou_network_loss_ratio", report.loss, host=report.host)
+                if report.jitter is not None:
+                    metrics.set("xiaou_network_jitter_seconds", report.jitter, host=report.host)
+                if report.p95 is not None:
+                    metrics.set("xiaou_network_rtt_p95_seconds", report.p95, host=report.host)
+                    self._record(f"network.rtt_p95_ms.{report.host}", report.p95 * 1000)
+            if was_good is None or good == was_good or not self.online_notification_sent:
+                return
+            quality = self.network_quality.format_summary()
+            if good:
+                self._log("网络质量已恢复")
+                title = email_composer.format_title("小悠的网络恢复顺畅了")
+                content = email_composer.compose_network_recovered(quality)
+                severity = SEVERITY_INFO
+            else:
+                self._log(f"检测到网络质量下降: {'; '.join(details)}")
+                title = email_composer.format_title("小悠的网络好卡...")
+                content = email_composer.compose_network_degraded(details, quality)
+                severity = SEVERITY_WARNING
+            if not notification_queue.enqueue(title, content, severity=severity):
+                self._log("网络质量通知入队失败")
+        except Exception as e:
+            self._log(f"网络质量测量出错: {e}")
+    
+    def _quality_summary(self, wait=0):
+        """网络质量统计文本（未启用或尚无数据时返回None），wait 为等待首轮测量的最长时间"""
+        if self.network_quality is None:
+            return None
+        if wait:
+            self.network_quality.wait_ready(wait)
+        return self.network_quality.format_summary() or None
+    
+    def check_processes(self):
+        """增量采样各进程的资源占用，采样开销超出预算时拉长采样间隔"""
+        try:
+            report = self.process_monitor.sample()
+            metrics.set("xiaou_processes", report.processes)
+            self._log_debug(f"进程采样: 跟踪 {report.processes} 个进程, 读取 {report.refreshed} 个, "
+                            f"CPU {round(self.process_monitor.last_cost * 1000, 1)}ms")
+            next_interval = self.process_monitor.suggest_interval()
+            if next_interval != self.scheduler.get_interval("processes"):
+                self._log_debug(f"进程采样间隔调整为 {round(next_interval, 1)} 秒")
+                self.scheduler.set_interval("processes", next_interval)
+        except Exception as e:
+            self._log(f"进程采样出错: {e}")
+    
+    def _process_summary(self, sample=False):
+        """占用资源最多的进程文本（未启用或尚无数据时返回None），sample 为True时尚未采样则先采样一次"""
+        if self.process_monitor is None:
+            return None
+        report = self.process_monitor.report() if sample else None
+        return self.process_monitor.format_summary(report) or None
+    
+    def _on_network_event(self, events):
+        """网卡/地址/路由变化回调（在事件监听线程中执行），立即触发一次联网检测"""
+        self._log_debug(f"网络事件: {', '.join(events)}")
+        self.last_network_event = time.monotonic()
+        if self.scheduler.has_job("network"):
+            self.scheduler.run_now("network")
+        else:
+            self.scheduler.run_now("online")
+    
+    def report_status(self):
+        """定期报告网络状态和通知队列状态"""
+        status_text = "在线" if self.last_network_status else "离线"
+        self._log_debug(f"网络状态: {status_text} - {self.last_network_details}")
+        self._log_debug(f"通知队列: {notification_queue.format_stats()}")
+        for line in internet_check.host_health.format_summary():
+            self._log_debug(f"探测host: {line}")
+        if self.network_quality is not None:
+            for line in self.network_quality.format_summary():
+                self._log_debug(f"网络质量: {line}")
+        for device, stats in sorted(self._last_disk_io.items()):
+            self._log_debug(f"磁盘IO（{device}）: {disk_io.format_stats(stats)}")
+        for line in self._process_summary() or ():
+            self._log_debug(f"进程占用: {line}")
+        for line in instrumentation.format_summary():
+            self._log_debug(f"耗时统计: {line}")
+        if self.fleet_collector is not None:
+            self._log_debug(f"集群汇总: {self.fleet_collector.format_stats()}")
+        if self.check_registry is not None:
+            self._log_debug(f"配置检查: {self.check_registry.format_stats()}")
+            for line in self.check_registry.format_failures():
+                self._log_debug(f"检查失败: {line}")
+    
+    def _on_fleet_alert(self, subject, content, severity):
+        """集群汇总端合并后的告警（在汇总端线程中执行），加入本机的发送队列"""
+        priority = PRIORITY_HIGH if severity == SEVERITY_CRITICAL else PRIORITY_NORMAL
+        title = email_composer.format_title(subject)
+        if not notification_queue.enqueue(title, content, priority=priority, severity=severity):
+            self._log(f"集群告警入队失败: {subject}")
+    
+    def _on_check_alert(self, subject, content, severity, channels, on_result):
+        """配置文件中的检查失败或恢复（在检查线程中执行），按检查配置的渠道加入发送队列"""
+        priority = PRIORITY_HIGH if severity == SEVERITY_CRITICAL else PRIORITY_NORMAL
+        title = email_composer.format_title(subject)
+        if not notification_queue.enqueue(title, content, priority=priority, on_result=on_result,
+                                          severity=severity, channels=channels):
+            self._log(f"检查通知入队失败: {subject}")
+            if on_result is not None:
+                on_result(False)
+    
+    def _on_reconnect_notification_result(self, success):
+        """重新联网通知发送结果回调（在发送线程中执行）"""
+        if success:
+            self._log("重新联网通知邮件发送成功！")
+        else:
+            self._log("重新联网通知邮件发送失败")
+    
+    def check_disk(self):
+        """执行一次磁盘空间检查 - 多级预警机制"""
+        try:
+            current_time = datetime.now()
+            
+            # 一次扫描所有挂载点，各挂载点独立判断预警级别
+            # 根据写入速度调整下次检查间隔：写入越快检查越频繁，稳定后恢复默认间隔
+            next_interval = self.disk_check_interval
+            for watch, usage in self.mount_registry.sweep():
+                next_interval = min(next_interval, self._check_mount(watch, usage, current_time))
             
-            # 等待指定间隔后再次检查
-            time.sleep(self.network_check_interval)
+            if next_interval != self.scheduler.get_interval("disk"):
+                self._log_debug(f"磁盘检查间隔调整为 {round(next_interval, 1)} 秒")
+                self.scheduler.set_interval("disk", next_interval)
+            
+        except Exception as e:
+            self._log(f"磁盘监控出错: {e}")
     
-    def run_disk_monitor(self):
-        """独立执行磁盘空间监控 - 多级预警机制"""
-        self._log("磁盘监控线程启动 - 多级预警机制已启用")
+    def _check_mount(self, watch, usage, current_time):
+        """
+        检查单个挂载点，达到阈值或预计即将写满且不在冷却期内时发送预警
+        返回: 建议的下次检查间隔（秒）
+        """
+        total_gb, used_gb, free_gb, percent = usage
         
-        while True:
-            try:
-                # 检查磁盘使用情况
-                total_gb, used_gb, free_gb, percent = disk_usage.check_disk_usage(self.mount_point)
-                
-                # 如果获取数据失败，跳过本次检查
-                if total_gb == 0 and used_gb == 0 and free_gb == 0:
-                    self._log_debug("无法获取磁盘使用信息，等待下次检查...")
-                    time.sleep(self.disk_check_interval)
+        # 如果获取数据失败，跳过本次检查
+        if total_gb == 0 and used_gb == 0 and free_gb == 0:
+            self._log_debug(f"无法获取磁盘使用信息（{watch.mount_point}），等待下次检查...")
+            return self.disk_check_interval
+        
+        self._record_disk_metrics(watch, free_gb, percent)
+        self._restore_cooldowns(f"disk:{watch.mount_point}:", watch)
+        
+        # 记录采样并估算写入速度和预计写满时间
+        watch.trend.add(free_gb)
+        time_to_full = watch.trend.time_to_full(free_gb)
+        trend = None
+        if time_to_full is not None:
+            trend = (disk_trend.format_fill_rate(watch.trend.fill_rate()),
+                     disk_trend.format_duration(time_to_full))
+            self._log_debug(f"磁盘状态（{watch.mount_point}）: {free_gb}GB 剩余 ({percent}% 已使用), "
+                            f"写入速度 {trend[0]}, 预计 {trend[1]} 后写满")
+        else:
+            self._log_debug(f"磁盘状态（{watch.mount_point}）: {free_gb}GB 剩余 ({percent}% 已使用)")
+        next_interval = watch.trend.suggest_interval(
+            free_gb, self.disk_check_interval, self.disk_min_check_interval
+        )
+        
+        # 多级预警机制
+        threshold = watch.due_threshold(free_gb, percent, current_time)
+        if threshold is not None:
+            level = threshold.level
+            compose = getattr(email_composer, f"compose_disk_warning_{level}")
+            content = compose(watch.mount_point, total_gb, used_gb, free_gb, percent, trend,
+                              self._analyze_mount(watch), self._process_summary(sample=True))
+            reason = f"<{threshold.describe()}"
+            priority = PRIORITY_HIGH if level == "high" else PRIORITY_NORMAL
+            severity = SEVERITY_CRITICAL if level == "high" else SEVERITY_WARNING
+        elif time_to_full is not None and time_to_full < self.disk_ttf_warning:
+            # 预测预警：尚未触发或已在冷却中，但按当前速度即将写满
+            last = watch.last_warning_times.get("predicted")
+            if last is not None and current_time - last < self.disk_ttf_cooldown:
+                return next_interval
+            level = "predicted"
+            content = email_composer.compose_disk_warning_predicted(
+                watch.mount_point, total_gb, used_gb, free_gb, percent, trend, self._analyze_mount(watch),
+                self._process_summary(sample=True)
+            )
+            reason = f"预计{trend[1]}后写满"
+            priority = PRIORITY_HIGH if time_to_full < 600 else PRIORITY_NORMAL
+            severity = SEVERITY_CRITICAL if time_to_full < 600 else SEVERITY_WARNING
+        else:
+            if watch.level_for(free_gb, percent) is None:
+                self._log_debug(f"磁盘空间充足（{watch.mount_point}）")
+            return next_interval
+        
+        base_title = DISK_WARNING_TITLES[level]
+        if len(self.mount_registry.watches) > 1:
+            base_title = f"{base_title} ({watch.mount_point})"
+        title = email_composer.format_title(base_title)
+        self._log(f"检测到磁盘空间{DISK_WARNING_NAMES[level]}（{watch.mount_point} {reason}），准备发送警告邮件...")
+        
+        # 加入发送队列，入队即开始冷却，最终发送失败时再清除冷却时间
+        queued = notification_queue.enqueue(
+            title, content, priority=priority, severity=severity,
+            on_result=lambda success: self._on_disk_warning_result(watch, level, success)
+        )
+        if queued:
+            watch.last_warning_times[level] = current_time
+            self._save_state(f"disk:{watch.mount_point}:{level}", current_time.timestamp())
+        else:
+            self._log("磁盘空间警告邮件入队失败")
+        return next_interval
+    
+    def check_disk_io(self):
+        """采样挂载点所在设备的IO统计，持续繁忙且不在冷却期内时发送预警"""
+        try:
+            current_time = datetime.now()
+            for watch, stats in self.disk_io.sweep():
+                self._record_disk_io_metrics(stats)
+                self._restore_cooldowns(f"diskio:{watch.device}:", watch)
+                threshold = watch.due_threshold(stats, current_time)
+                if threshold is None:
                     continue
-                
-                self._log_debug(f"磁盘状态: {free_gb}GB 剩余 ({percent}% 已使用)")
-                
-                current_time = datetime.now()
-                should_send = False
-                title = ""
-                content = ""
-                
-                # 多级预警机制
-                if free_gb < 1:
-                    # 级别3: 剩余容量低于1GB - 最高紧急级别
-                    if (self.last_disk_warning_time_1gb is None or 
-                        current_time - self.last_disk_warning_time_1gb >= timedelta(minutes=10)):
-                        should_send = True
-                        title = email_composer.format_title("小悠的里面...好多❤")
-                        content = email_composer.compose_disk_warning_high(
-                            self.mount_point, total_gb, used_gb, free_gb, percent
-                        )
-                        if should_send:
-                            self._log("检测到磁盘空间极度不足（<1GB），准备发送紧急警告邮件...")
-                
-                elif free_gb < 30:
-                    # 级别2: 剩余容量低于30GB但大于1GB - 中等紧急级别
-                    if (self.last_disk_warning_time_30gb is None or 
-                        current_time - self.last_disk_warning_time_30gb >= timedelta(minutes=20)):
-                        should_send = True
-                        title = email_composer.format_title("小悠要被灌满了~~")
-                        content = email_composer.compose_disk_warning_medium(
-                            self.mount_point, total_gb, used_gb, free_gb, percent
-                        )
-                        if should_send:
-                            self._log("检测到磁盘空间严重不足（<30GB），准备发送严重警告邮件...")
-                
-                elif free_gb < 100:
-                    # 级别1: 剩余容量低于100GB但大于30GB - 一般警告级别
-                    if (self.last_disk_warning_time_100gb is None or 
-                        current_time - self.last_disk_warning_time_100gb >= timedelta(minutes=90)):
-                        should_send = True
-                        title = email_composer.format_title("小悠提醒你空间不够了！")
-                        content = email_composer.compose_disk_warning_low(
-                            self.mount_point, total_gb, used_gb, free_gb, percent
-                        )
-                        if should_send:
-                            self._log("检测到磁盘空间不足（<100GB），准备发送警告邮件...")
+                level = threshold.level
+                mount_points = ", ".join(watch.mount_points)
+                reason = threshold.describe(stats)
+                self._log(f"检测到磁盘IO{DISK_IO_WARNING_NAMES[level]}（{watch.device} {mount_points} {reason}），"
+                          f"准备发送警告邮件...")
+                title = email_composer.format_title(f"{DISK_IO_WARNING_TITLES[level]} ({watch.device})")
+                content = email_composer.compose_disk_io_warning(
+                    level, watch.device, mount_points, disk_io.format_stats(stats), reason,
+                    self._process_summary(sample=True)
+                )
+                queued = notification_queue.enqueue(
+                    title, content,
+                    priority=PRIORITY_HIGH if level == "high" else PRIORITY_NORMAL,
+                    severity=SEVERITY_CRITICAL if level == "high" else SEVERITY_WARNING,
+                    on_result=lambda success, watch=watch, level=level: self._on_disk_io_warning_result(
+                        watch, level, success),
+                )
+                if queued:
+                    watch.last_warning_times[level] = current_time
+                    self._save_state(f"diskio:{watch.device}:{level}", current_time.timestamp())
                 else:
-                    self._log_debug("磁盘空间充足")
-                
-                # 发送邮件并更新最后发送时间
-                if should_send:
-                    if email_sender.send_email(title, content):
-                        if free_gb < 1:
-                            self.last_disk_warning_time_1gb = current_time
-                        elif free_gb < 30:
-                            self.last_disk_warning_time_30gb = current_time
-                        else:  # free_gb < 100
-                            self.last_disk_warning_time_100gb = current_time
-                        self._log("磁盘空间警告邮件发送成功！")
-                    else:
-                        self._log("磁盘空间警告邮件发送失败")
-                
-            except Exception as e:
-                self._log(f"磁盘监控出错: {e}")
-            
-            # 等待指定间隔后再次检查
-            time.sleep(self.disk_check_interval)
-    
-    def start_disk_monitor_thread(self):
-        """启动磁盘监控线程"""
-        disk_thread = threading.Thread(target=self.run_disk_monitor)
-        disk_thread.daemon = True  # 设置为守护线程，主程序退出时自动结束
-        disk_thread.start()
-        return disk_thread
-    
-    def start_network_monitor_thread(self):
-        """启动网络监控线程"""
-        network_thread = threading.Thread(target=self.run_network_monitor)
-        network_thread.daemon = True  # 设置为守护线程，主程序退出时自动结束
-        network_thread.start()
-        return network_thread
+                    self._log("磁盘IO警告邮件入队失败")
+        except Exception as e:
+            self._log(f"磁盘IO监控出错: {e}")
+    
+    def _record_disk_io_metrics(self, stats):
+        device = stats.device
+        metrics.set("xiaou_disk_read_bytes_per_second", stats.read_bps, device=device)
+        metrics.set("xiaou_disk_write_bytes_per_second", stats.write_bps, device=device)
+        metrics.set("xiaou_disk_iops", stats.read_iops, device=device, op="read")
+        metrics.set("xiaou_disk_iops", stats.write_iops, device=device, op="write")
+        if stats.await_ms is not None:
+            metrics.set("xiaou_disk_await_seconds", stats.await_ms / 1000, device=device)
+        if stats.util is not None:
+            metrics.set("xiaou_disk_utilization_ratio", stats.util / 100, device=device)
+            self._record(f"diskio.{device}.util", stats.util)
+        self._last_disk_io[device] = stats
+    
+    def _on_disk_io_warning_result(self, watch, level, success):
+        """磁盘IO警告发送结果回调（在发送线程中执行）"""
+        if success:
+            self._log("磁盘IO警告邮件发送成功！")
+        else:
+            # 清除冷却时间，下次检查时重新发送
+            watch.last_warning_times.pop(level, None)
+            self._save_state(f"diskio:{watch.device}:{level}", None)
+            self._log("磁盘IO警告邮件发送失败")
+    
+    def _analyze_mount(self, watch):
+        """分析挂载点下占用空间最多的目录和文件，附在警告邮件中（未启用时返回None）"""
+        if self.disk_analyzer is None:
+            return None
+        report = self.disk_analyzer.analyze(watch.mount_point)
+        if report is not None:
+            self._log_debug(f"空间占用分析（{watch.mount_point}）: 扫描 {report.scanned_dirs} 个目录, "
+                            f"耗时 {round(report.elapsed, 2)}秒{'' if report.complete else '（未完成）'}")
+        return report
+    
+    def _on_disk_warning_result(self, watch, level, success):
+        """磁盘警告发送结果回调（在发送线程中执行）"""
+        if success:
+            self._log("磁盘空间警告邮件发送成功！")
+        else:
+            # 清除冷却时间，下次检查时重新发送
+            watch.last_warning_times.pop(level, None)
+            self._save_state(f"disk:{watch.mount_point}:{level}", None)
+            self._log("磁盘空间警告邮件发送失败")
+    
+    def start_network_monitor(self):
+        """上线通知完成后，停止上线检测并开始持续网络监控"""
+        if self.scheduler.has_job("network"):
+            return
+        self.scheduler.remove_job("online")
+        self._log("=" * 50)
+        self._log("上线通知已完成，启动持续网络监控...")
+        self.scheduler.add_job("network", self.check_network, self.network_check_interval)
     
     def run(self):
         """主运行函数"""
+        self.run_started = time.perf_counter()
         self._log("小悠系统监控启动中...")
         self._log("=" * 50)
         
+        # 与首次联网检测并行建立SMTP连接，上线通知无需等待握手
+        email_sender.warm_up(on_done=self._on_smtp_warm_up)
+        
         # 显示系统信息
         self._log(f"操作系统: {platform.system()} {platform.release()}")
         self._log(f"Python版本: {platform.python_version()}")
         
-        # 立即启动磁盘监控线程（不等待网络检测）
-        self._log("启动独立磁盘监控线程...")
-        disk_thread = self.start_disk_monitor_thread()
+        # 立即开始磁盘监控（不等待网络检测）
+        self._log("启动磁盘监控 - 多级预警机制已启用")
+        self.scheduler.add_job("disk", self.check_disk, self.disk_check_interval)
+        if self.disk_io is not None:
+            self.scheduler.add_job("diskio", self.check_disk_io, self.disk_io_check_interval)
         
-        # 启动联网检测（阻塞，直到首次联网成功发送通知）
-        self.run_online_check()
-        
-        self._log("=" * 50)
-        self._log("上线通知已完成，启动持续网络监控线程...")
+        # 启动联网检测，首次联网成功并发送通知后转为持续网络监控
+        # 本次开机已发送过上线通知（进程重启）时直接开始持续网络监控
+        if self.online_notification_sent:
+            self.start_network_monitor()
+        else:
+            self._log("开始检测网络连接...")
+            self.scheduler.add_job("online", self.check_online, self.online_check_interval)
+        if self.network_quality is not None:
+            self.scheduler.add_job("quality", self.check_quality, self.network_quality_interval)
+        if self.process_monitor is not None:
+            self.scheduler.add_job("processes", self.check_processes, self.process_monitor.interval)
+        if self.netlink_monitor is not None:
+            try:
+                self.netlink_monitor.start()
+                self._log("已启用网络事件监听，网络变化时立即检测")
+            except OSError as e:
+                self._log(f"网络事件监听启动失败，使用定时检测: {e}")
+                self.netlink_monitor = None
+        self.scheduler.add_job("status", self.report_status, self.status_report_interval,
+                               delay=self.status_report_interval)
+        if self.metrics_exporter is not None:
+            try:
+                self.metrics_exporter.start()
+                self._log(f"指标导出端点: http://{self.metrics_exporter.host}:{self.metrics_exporter.port}/metrics")
+                self.scheduler.add_job("metrics", self.refresh_metrics, self.metrics_refresh_interval)
+            except OSError as e:
+                self._log(f"指标导出端点启动失败: {e}")
+                self.metrics_exporter = None
+        if self.fleet_collector is not None:
+            try:
+                self.fleet_collector.start()
+                self._log(f"集群汇总端已启动，监听 UDP/TCP 端口 {self.fleet_collector.udp_port}")
+            except OSError as e:
+                self._log(f"集群汇总端启动失败: {e}")
+                self.fleet_collector = None
+        if self.fleet_agent is not None:
+            self.fleet_agent.start()
+            self._log(f"向集群汇总端 {self.fleet_agent.address[0]}:{self.fleet_agent.address[1]} 上报"
+                      f"（{self.fleet_agent.transport}，每 {self.fleet_agent.interval} 秒）")
+        if self.network_diagnosis is not None and hasattr(signal, "SIGUSR1"):
+            # 收到 SIGUSR1 时诊断一次并输出到日志；调度循环可能正持有线程池队列的锁，交给新线程提交
+            signal.signal(signal.SIGUSR1, lambda signum, frame: threading.Thread(
+                target=self.request_diagnosis, daemon=True).start())
+        if self.check_registry is not None:
+            self.check_registry.start()
+            reload_on = "文件变化或收到 SIGHUP" if self.check_registry.install_sighup() else "文件变化"
+            self._log(f"检查配置: {self.check_registry.path}（{reload_on}时重新加载）")
+        if self.history is not None:
+            self.scheduler.add_job("history_flush", self.history.flush, self.history_flush_interval,
+                                   delay=self.history_flush_interval)
         
-        # 启动网络状态监控线程
-        network_thread = self.start_network_monitor_thread()
+        if self.watchdog is not None:
+            self.watchdog.start()
         
-        # 主线程保持运行，等待所有子线程
+        # 主线程运行调度循环
         try:
-            while True:
-                # 检查线程状态
-                if not disk_thread.is_alive():
-                    self._log("磁盘监控线程已停止，重新启动...")
-                    disk_thread = self.start_disk_monitor_thread()
-                
-                if not network_thread.is_alive():
-                    self._log("网络监控线程已停止，重新启动...")
-                    network_thread = self.start_network_monitor_thread()
-                
-                # 主线程休眠，减少CPU占用
-                time.sleep(10)
-                
+            self.scheduler.run_forever()
         except KeyboardInterrupt:
             self._log("程序被用户中断")
         except Exception as e:
             self._log(f"程序运行出错: {e}")
+        finally:
+            self.scheduler.stop()
+            if self.watchdog is not None:
+                self.watchdog.stop()
+            if self.check_registry is not None:
+                self.check_registry.stop()
+            if self.netlink_monitor is not None:
+                self.netlink_monitor.stop()
+            if self.fleet_collector is not None:
+                self.fleet_collector.stop()
+            if self.fleet_agent is not None:
+                self.fleet_agent.stop()
+            if self.state is not None:
+                self.state.close()
+            if self.history is not None:
+                self.history.flush()
 
 if __name__ == "__main__":
     xiao_u = XiaoUSystem()
-    xiao_u.run()
\ No newline at end of file
+    xiao_u.run()